@@ -2,11 +2,19 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_openai import ChatOpenAI
-from app.models.schemas import ExecutionPlan, ToolOutput, ExecutorOutput, RagAgentResponse
+from app.models.schemas import ExecutionPlan, ToolOutput, ExecutorOutput, RagAgentResponse, ToolRoutingPlan
+from app.agents.tool_router import route_locally
+from app.services.tool_memo import ToolMemo
+from app.services.tool_cache import cache_tools
+from app.services.streaming import invoke_streaming, ainvoke_streaming, streaming_answer
 from app.tools import geo_tools, wikipedia_tools, tavily_tools, time_tools, google_news_tool, duckduckgo_tool, bing_rss_tool, legal_scan_tool, chat_tool
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langsmith import traceable
-from typing import List
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
 
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -28,138 +36,434 @@ synth_llm = ChatOpenAI(
 
 # Step 2: Parsers
 tool_parser = PydanticOutputParser(pydantic_object=ToolOutput)
+routing_parser = PydanticOutputParser(pydantic_object=ToolRoutingPlan)
 
 
 # Step 3: Tool registry
-TOOLS = {
+# (results cached per tool TTL, shared with the planner's TOOL_MAP)
+TOOLS = cache_tools({
     "geo_lookup": geo_tools.geo_tool,
     "wikipedia_search": wikipedia_tools.wikipedia_tool,
     "gnews_tool": google_news_tool.real_estate_news_tool,
     "tavily_tool": tavily_tools.tavily_tool,
     "time_tool": time_tools.time_tool,
-    "broad_duckduckgo_search": duckduckgo_tool.duckduckgo,
+    "broad_duckduckgo_search": duckduckgo_tool.duckduckgo_search_tool,
     "bing_rss_tool": bing_rss_tool.bing_rss_tool,
     "legiscan_tool": legal_scan_tool.legiscan_tool,
     "chat_tool": chat_tool.chat_tool,
+})
+
+
+# Step 4: Routing prompts (built once, reused for every step)
+TOOL_PURPOSES = {
+    "geo_lookup": "get location info from IP or address",
+    "wikipedia_search": "fetch factual background from Wikipedia",
+    "gnews_tool": "get recent housing/real estate news and listings",
+    "tavily_tool": "search structured/local housing info (listings, policies, assistance)",
+    "time_tool": "get current date/time in ISO format",
+    "broad_duckduckgo_search": "general purpose web search",
+    "bing_rss_tool": "fetch recent tenant rights & affordable housing updates (California and New York focus)",
+    "legiscan_tool": "search U.S. state legislation and bills (housing, tenant rights, eviction laws, rental policies)",
+    "chat_tool": "follow-up Q&A agent using conversation history",
 }
 
+tool_catalog = "\nAvailable tools and purpose:\n" + "\n".join(
+    f"- {name}: {purpose}" for name, purpose in TOOL_PURPOSES.items()
+) + "\n"
 
-# Step 4: Executor Agent
-@traceable
-def execute_agent(rag_result: RagAgentResponse, plan_result: ExecutionPlan, query: str, verbose=False) -> ExecutorOutput:
-    observations: List[ToolOutput] = []
+# Descriptions the local router scores steps against
+TOOL_DESCRIPTIONS = {
+    name: f"{TOOL_PURPOSES.get(name, '')} {getattr(tool, 'description', '')}"
+    for name, tool in TOOLS.items()
+}
 
-    if isinstance(plan_result, dict):
-        plan_result = ExecutionPlan(**plan_result)
+routing_examples = """
+Examples:
+Step: "Find recent housing news in Brooklyn" -> tool: "gnews_tool", input.query: "recent housing news Brooklyn"
+Step: "Check local rent prices for apartments" -> tool: "tavily_tool", input.query: "rent prices apartments"
+Step: "Ask user if they want more details or Q&A" -> tool: "chat_tool", input.query: "Follow up with user for more questions"
+"""
+
+decision_msg = """
+You are an executor LLM that maps execution plan steps to the best tool.
+""" + tool_catalog + """
+Instructions:
+- For each step, choose the tool that best matches the intent.
+- Return EXACTLY one JSON object like this:
+
+{{
+"tool": "<name_of_tool>",
+"input": {{"query": "<text_to_pass_to_tool>"}},
+"output": null
+}}
+
+- "tool" must be one of the tools above.
+- Do not include any extra text or explanations.
+- Make sure the JSON is valid.
+""" + routing_examples
+
+decision_prompt = ChatPromptTemplate.from_messages([
+    ("system", decision_msg),
+    ("human", "Step: {step}")
+])
+decision_chain = decision_prompt | executor_llm
+
+batch_decision_msg = """
+You are an executor LLM that maps every step of an execution plan to the best tool in one pass.
+""" + tool_catalog + """
+Instructions:
+- Return exactly one decision per step, in the same order as the numbered steps.
+- Each decision has "tool" (one of the tools above), "input" as {{"query": "<text_to_pass_to_tool>"}} and "output": null.
+- Do not include any extra text or explanations.
+{format_instructions}
+""" + routing_examples
+
+batch_decision_prompt = ChatPromptTemplate.from_messages([
+    ("system", batch_decision_msg),
+    ("human", "Steps:\n{steps}")
+])
+batch_decision_chain = batch_decision_prompt.partial(format_instructions=routing_parser.get_format_instructions()) | executor_llm | routing_parser
+
+# "batched" routes the whole plan in one LLM call (falls back per step on invalid decisions); "per_step" makes one call per step
+EXECUTOR_ROUTING_MODE = os.getenv("EXECUTOR_ROUTING_MODE", "batched")
+
+
+def _numbered_steps(steps: List[ToolOutput]) -> str:
+    return "\n".join(f"{idx + 1}. {step}" for idx, step in enumerate(steps))
+
+
+def _validate_batched(routing: ToolRoutingPlan, steps: List[ToolOutput]) -> List[Optional[ToolOutput]]:
+    """
+    One decision per step; entries that fail validation are None so the
+    caller falls back to per-step routing for just those steps.
+    """
+    if len(routing.decisions) != len(steps):
+        logging.warning(f"[Executor] Batched routing returned {len(routing.decisions)} decisions for {len(steps)} steps, falling back to per-step routing")
+        return [None] * len(steps)
+
+    return [
+        decision if decision.tool in TOOLS and isinstance(decision.input, dict) else None
+        for decision in routing.decisions
+    ]
+
+
+def _route_plan_batched(steps: List[ToolOutput]) -> List[Optional[ToolOutput]]:
+    """Route every step with a single LLM call."""
+    try:
+        routing: ToolRoutingPlan = batch_decision_chain.invoke({"steps": _numbered_steps(steps)})
+    except Exception as e:
+        logging.warning(f"[Executor] Batched routing failed, falling back to per-step routing: {e}")
+        return [None] * len(steps)
+    return _validate_batched(routing, steps)
+
+
+async def _aroute_plan_batched(steps: List[ToolOutput]) -> List[Optional[ToolOutput]]:
+    """Async version of _route_plan_batched"""
+    try:
+        routing: ToolRoutingPlan = await batch_decision_chain.ainvoke({"steps": _numbered_steps(steps)})
+    except Exception as e:
+        logging.warning(f"[Executor] Batched routing failed, falling back to per-step routing: {e}")
+        return [None] * len(steps)
+    return _validate_batched(routing, steps)
+
+
+def _parse_decision(message: Any, step: ToolOutput) -> ToolOutput:
+    decision_content = getattr(message, "content", None) or str(step)
+    return tool_parser.parse(decision_content)
+
+
+def _route_step(step: ToolOutput) -> ToolOutput:
+    """Ask the LLM to pick a tool for a single step."""
+    return _parse_decision(decision_chain.invoke({"step": step}), step)
+
+
+async def _aroute_step(step: ToolOutput) -> ToolOutput:
+    """Async version of _route_step"""
+    return _parse_decision(await decision_chain.ainvoke({"step": step}), step)
+
+
+# Step 5: Concurrency settings
+# Max number of plan steps routed/executed at the same time (1 = run the plan sequentially)
+EXECUTOR_MAX_PARALLEL_STEPS = int(os.getenv("EXECUTOR_MAX_PARALLEL_STEPS", "4"))
+
+
+def _step_dependencies(steps: List[ToolOutput]) -> List[Set[int]]:
+    """
+    Resolve each step's `depends_on` ids to indexes of earlier steps.
+    Only backward references are kept, so the result is always a DAG.
+    """
+    index_by_id = {}
+    for idx, step in enumerate(steps):
+        if step.step is not None:
+            index_by_id.setdefault(str(step.step), idx)
+
+    dependencies = []
+    for idx, step in enumerate(steps):
+        resolved = set()
+        for dep in step.depends_on or []:
+            dep_idx = index_by_id.get(str(dep))
+            if dep_idx is not None and dep_idx < idx:
+                resolved.add(dep_idx)
+            else:
+                logging.warning(f"[Executor] Ignoring unknown or forward dependency {dep!r} on step {idx}")
+        dependencies.append(resolved)
+    return dependencies
+
+
+def _run_plan_concurrently(steps: List[ToolOutput], run_step: Callable[[int, ToolOutput], Optional[ToolOutput]], max_parallel: int) -> List[Optional[ToolOutput]]:
+    """
+    Run steps as a dependency graph: a step starts once all of its dependencies
+    finished, with at most `max_parallel` steps in flight. Results keep plan order.
+    """
+    dependencies = _step_dependencies(steps)
+    results: List[Optional[ToolOutput]] = [None] * len(steps)
+    pending = list(range(len(steps)))
+    finished: Set[int] = set()
+    running: Dict[Future, int] = {}
+
+    with ContextThreadPoolExecutor(max_workers=max_parallel) as pool:
+        while pending or running:
+            ready = [idx for idx in pending if dependencies[idx] <= finished]
+            for idx in ready[: max_parallel - len(running)]:
+                pending.remove(idx)
+                running[pool.submit(run_step, idx, steps[idx])] = idx
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = running.pop(future)
+                results[idx] = future.result()
+                finished.add(idx)
+
+    return results
+
+
+async def _arun_plan_concurrently(steps: List[ToolOutput], run_step: Callable[[int, ToolOutput], Awaitable[Optional[ToolOutput]]], max_parallel: int) -> List[Optional[ToolOutput]]:
+    """Async version of _run_plan_concurrently (one task per step, gated by a semaphore)"""
+    dependencies = _step_dependencies(steps)
+    semaphore = asyncio.Semaphore(max_parallel)
+    tasks: List[asyncio.Task] = []
+
+    async def run(idx: int) -> Optional[ToolOutput]:
+        # dependencies always point at earlier steps, whose tasks already exist
+        if dependencies[idx]:
+            await asyncio.gather(*(tasks[dep] for dep in dependencies[idx]))
+        async with semaphore:
+            return await run_step(idx, steps[idx])
+
+    for idx in range(len(steps)):
+        tasks.append(asyncio.ensure_future(run(idx)))
+    return list(await asyncio.gather(*tasks))
+
+
+# Step 6: Route and run a single plan step
+def _json_safe(tool_result: Any) -> Any:
+    if hasattr(tool_result, "model_dump"):
+        return tool_result.model_dump()
+    if hasattr(tool_result, "dict"):
+        return tool_result.dict()
+    return tool_result
+
+
+def _tool_call(decision: ToolOutput, query: str, verbose: bool) -> Optional[str]:
+    """Return the query to send to the decided tool, or None if the tool is unknown."""
+    if decision.tool not in TOOLS:
+        if verbose:
+            print(f"[Warning] Tool {decision.tool} not found, skipping step.")
+        return None
+    return decision.input.get("query") or query
+
+
+def _record_observation(decision: ToolOutput, step_id: Any, tool_result: Any, verbose: bool) -> ToolOutput:
+    decision.output = tool_result
+    decision.step = step_id
+
+    if verbose:
+        print(f"[Executor] Step: {step_id}")
+        print(f"[Executor] Tool: {decision.tool}")
+        print(f"[Executor] Result: {tool_result}\n")
+
+    return decision
+
+
+def _run_step(idx: int, step: ToolOutput, query: str, verbose: bool = False, decision: Optional[ToolOutput] = None, tool_memo: Optional[ToolMemo] = None) -> Optional[ToolOutput]:
+    # Ensure step id is JSON-safe
+    step_id = getattr(step, "step", str(idx))
 
-    for idx, step in enumerate(plan_result.plan):
-        # Ensure step id is JSON-safe
-        step_id = getattr(step, "step", str(idx))
-        # Step 1️: LLM chooses tool for this step
-        decision_msg =  """
-        You are an executor LLM that maps execution plan steps to the best tool.
-
-        Available tools and purpose:
-        - geo_lookup: get location info from IP or address
-        - wikipedia_search: fetch factual background from Wikipedia
-        - gnews_tool: get recent housing/real estate news and listings
-        - tavily_tool: search structured/local housing info (listings, policies, assistance)
-        - time_tool: get current date/time in ISO format
-        - broad_duckduckgo_search: general purpose web search
-        - bing_rss_tool: fetch recent tenant rights & affordable housing updates (California and New York focus)
-        - legiscan_tool: search U.S. state legislation and bills (housing, tenant rights, eviction laws, rental policies)
-        - chat_tool: follow-up Q&A agent using conversation history
-
-        Instructions:
-        - For each step, choose the tool that best matches the intent.
-        - Return EXACTLY one JSON object like this:
-
-        {{
-        "tool": "<name_of_tool>",
-        "input": {{"query": "<text_to_pass_to_tool>"}},
-        "output": null
-        }}
-
-        - "tool" must be one of the tools above.
-        - Do not include any extra text or explanations.
-        - Make sure the JSON is valid.
-        Examples:
-        Step: "Find recent housing news in Brooklyn" -> tool: "gnews_tool", input.query: "recent housing news Brooklyn"
-        Step: "Check local rent prices for apartments" -> tool: "tavily_tool", input.query: "rent prices apartments"
-        Step: "Ask user if they want more details or Q&A" -> tool: "chat_tool", input.query: "Follow up with user for more questions"
-        """
-
-        decision_prompt = ChatPromptTemplate.from_messages([
-            ("system",decision_msg),
-            ("human", "Step: {step}")
-        ])
-
-        decision_chain = decision_prompt | executor_llm
-        decision_content = getattr(decision_chain.invoke({"step": step}), "content", None)
-        decision_content = decision_content or str(step)
-
-        # Parse LLM decision
-        decision: ToolOutput = tool_parser.parse(decision_content)
-        tool_name = decision.tool
-        tool_query = decision.input.get("query") or query
-
-        # Step 3: Guard
-        if tool_name not in TOOLS:
-            if verbose:
-                print(f"[Warning] Tool {tool_name} not found, skipping step.")
-            continue
-
-        # Step 4: Safe tool execution
+    # LLM chooses tool for this step (unless it was already routed locally or in a batch)
+    if decision is None:
+        decision = _route_step(step)
+
+    # Guard
+    tool_query = _tool_call(decision, query, verbose)
+    if tool_query is None:
+        return None
+    tool_name = decision.tool
+
+    # Reuse a result the planner (or an earlier step) already fetched
+    tool_result = tool_memo.get(tool_name, {"query": tool_query}) if tool_memo else None
+    if tool_result is not None:
+        if verbose:
+            print(f"[Executor] Reusing memoized {tool_name} result for step {step_id}")
+    else:
+        # Safe tool execution
         tool_instance = TOOLS[tool_name]
-        tool_result = None
-        
+
         if hasattr(tool_instance, "invoke"):
             tool_result = tool_instance.invoke({"query": tool_query}, verbose=verbose)
         elif hasattr(tool_instance, "run"):
             tool_result = tool_instance.run(tool_query)
 
         # Ensure output is JSON-safe
-        if hasattr(tool_result, "model_dump"):
-            tool_result = tool_result.model_dump()
-        elif hasattr(tool_result, "dict"):
-            tool_result = tool_result.dict()
+        tool_result = _json_safe(tool_result)
+        if tool_memo:
+            tool_memo.put(tool_name, {"query": tool_query}, tool_result)
+
+    return _record_observation(decision, step_id, tool_result, verbose)
+
 
-        decision.output = tool_result
-        decision.step = step_id
-        observations.append(decision)
+async def _arun_step(idx: int, step: ToolOutput, query: str, verbose: bool = False, decision: Optional[ToolOutput] = None, tool_memo: Optional[ToolMemo] = None) -> Optional[ToolOutput]:
+    """Async version of _run_step (ainvoke for routing and tools)"""
+    step_id = getattr(step, "step", str(idx))
 
+    if decision is None:
+        decision = await _aroute_step(step)
+
+    tool_query = _tool_call(decision, query, verbose)
+    if tool_query is None:
+        return None
+    tool_name = decision.tool
+
+    tool_result = tool_memo.get(tool_name, {"query": tool_query}) if tool_memo else None
+    if tool_result is not None:
         if verbose:
-            print(f"[Executor] Step: {step_id}")
-            print(f"[Executor] Tool: {tool_name}")
-            print(f"[Executor] Result: {tool_result}\n")
+            print(f"[Executor] Reusing memoized {tool_name} result for step {step_id}")
+    else:
+        tool_instance = TOOLS[tool_name]
 
-    synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a helpful research assistant. Use the observations to answer clearly and concisely."),
-    ("human",
-    """
-    User query: {query}
+        if hasattr(tool_instance, "ainvoke"):
+            tool_result = await tool_instance.ainvoke({"query": tool_query}, verbose=verbose)
+        elif hasattr(tool_instance, "run"):
+            tool_result = await asyncio.to_thread(tool_instance.run, tool_query)
+
+        tool_result = _json_safe(tool_result)
+        if tool_memo:
+            tool_memo.put(tool_name, {"query": tool_query}, tool_result)
+
+    return _record_observation(decision, step_id, tool_result, verbose)
 
-    Observations from tools:
-    {observations}
 
-    Instructions:
-    - Provide a concise answer to the user.
-    - Integrate relevant information from all tools.
-    - Provide links to helpful and relevant resources
-    - Do NOT include raw tool outputs, only the synthesized answer.
-    """)
-    ])
-    synthesis_chain = synthesis_prompt | synth_llm
+# Step 7: Synthesis chain
+synthesis_prompt = ChatPromptTemplate.from_messages([
+("system", "You are a helpful research assistant. Use the observations to answer clearly and concisely."),
+("human",
+"""
+User query: {query}
 
-    final_answer_msg = synthesis_chain.invoke({
-        "query": query,
-        "observations": [obs.model_dump() for obs in observations]
-    })
+Observations from tools:
+{observations}
 
-    final_answer_text = getattr(final_answer_msg, "content", str(final_answer_msg))
+Instructions:
+- Provide a concise answer to the user.
+- Integrate relevant information from all tools.
+- Provide links to helpful and relevant resources
+- Do NOT include raw tool outputs, only the synthesized answer.
+""")
+])
+synthesis_chain = synthesis_prompt | synth_llm
 
-    # Return serialized observations 
+
+# Step 8: Executor Agent
+def _route_locally(steps: List[ToolOutput], query: str, router_threshold: Optional[float]) -> List[Optional[ToolOutput]]:
+    """Deterministic routing for obvious steps (None = needs the LLM)"""
+    return [route_locally(step, query, TOOL_DESCRIPTIONS, threshold=router_threshold) for step in steps]
+
+
+def _unsure_steps(decisions: List[Optional[ToolOutput]], routing_mode: Optional[str]) -> List[int]:
+    """Indexes of steps still needing LLM routing, if they should be batched"""
+    unsure = [idx for idx, decision in enumerate(decisions) if decision is None]
+    return unsure if (routing_mode or EXECUTOR_ROUTING_MODE) == "batched" and len(unsure) > 1 else []
+
+
+def _executor_output(final_answer_text: str, results: List[Optional[ToolOutput]], memo: ToolMemo) -> ExecutorOutput:
+    # Return serialized observations
     return ExecutorOutput(
         final_answer=final_answer_text,
-        observations=observations  
-)
+        observations=[obs for obs in results if obs is not None],
+        duplicate_calls_avoided=memo.hits
+    )
+
+
+@traceable
+def execute_agent(rag_result: RagAgentResponse, plan_result: ExecutionPlan, query: str, verbose=False, max_parallel_steps: Optional[int] = None, routing_mode: Optional[str] = None, router_threshold: Optional[float] = None, tool_memo: Optional[Dict[str, Any]] = None) -> ExecutorOutput:
+    """
+    Route and run every plan step, then synthesize a final answer.
+    Independent steps run concurrently (up to `max_parallel_steps`);
+    observations are always returned in plan order.
+    `routing_mode` is "batched" or "per_step" (defaults to EXECUTOR_ROUTING_MODE).
+    Obvious steps are routed locally first; only steps the local router is
+    unsure about (below `router_threshold`) cost an LLM routing call.
+    `tool_memo` holds results already fetched for this request (e.g. by the
+    planner); matching tool calls reuse them instead of hitting the API again.
+    """
+    if isinstance(plan_result, dict):
+        plan_result = ExecutionPlan(**plan_result)
+
+    steps = plan_result.plan
+    max_parallel = max_parallel_steps or EXECUTOR_MAX_PARALLEL_STEPS
+    memo = ToolMemo(tool_memo)
+
+    decisions = _route_locally(steps, query, router_threshold)
+
+    # Route the remaining steps in one call when batching is enabled
+    unsure = _unsure_steps(decisions, routing_mode)
+    if unsure:
+        for idx, decision in zip(unsure, _route_plan_batched([steps[i] for i in unsure])):
+            decisions[idx] = decision
+
+    def run_step(idx: int, step: ToolOutput) -> Optional[ToolOutput]:
+        return _run_step(idx, step, query, verbose=verbose, decision=decisions[idx], tool_memo=memo)
+
+    if max_parallel <= 1 or len(steps) <= 1:
+        results = [run_step(idx, step) for idx, step in enumerate(steps)]
+    else:
+        results = _run_plan_concurrently(steps, run_step, max_parallel)
+
+    # Only the synthesis streams to the request's token sink (e.g. Slack), not tool LLM calls
+    with streaming_answer():
+        final_answer_text = invoke_streaming(synthesis_chain, {
+            "query": query,
+            "observations": [obs.model_dump() for obs in results if obs is not None]
+        })
+
+    return _executor_output(final_answer_text, results, memo)
+
+
+@traceable
+async def aexecute_agent(rag_result: RagAgentResponse, plan_result: ExecutionPlan, query: str, verbose=False, max_parallel_steps: Optional[int] = None, routing_mode: Optional[str] = None, router_threshold: Optional[float] = None, tool_memo: Optional[Dict[str, Any]] = None) -> ExecutorOutput:
+    """Async version of execute_agent: same routing and DAG semantics on ainvoke/asyncio tasks."""
+    if isinstance(plan_result, dict):
+        plan_result = ExecutionPlan(**plan_result)
+
+    steps = plan_result.plan
+    max_parallel = max_parallel_steps or EXECUTOR_MAX_PARALLEL_STEPS
+    memo = ToolMemo(tool_memo)
+
+    decisions = _route_locally(steps, query, router_threshold)
+
+    unsure = _unsure_steps(decisions, routing_mode)
+    if unsure:
+        for idx, decision in zip(unsure, await _aroute_plan_batched([steps[i] for i in unsure])):
+            decisions[idx] = decision
+
+    async def run_step(idx: int, step: ToolOutput) -> Optional[ToolOutput]:
+        return await _arun_step(idx, step, query, verbose=verbose, decision=decisions[idx], tool_memo=memo)
+
+    results = await _arun_plan_concurrently(steps, run_step, max(1, max_parallel))
+
+    with streaming_answer():
+        final_answer_text = await ainvoke_streaming(synthesis_chain, {
+            "query": query,
+            "observations": [obs.model_dump() for obs in results if obs is not None]
+        })
+
+    return _executor_output(final_answer_text, results, memo)
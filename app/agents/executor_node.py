@@ -1,50 +1,89 @@
 import logging
 from langsmith import traceable
-from app.agents.executor_agent import execute_agent
-from app.services.redis_helpers import add_message
+from app.agents.executor_agent import execute_agent, aexecute_agent
+from app.models.schemas import ExecutorOutput, ExecutionPlan
+from app.services.redis_helpers import add_message, aadd_message
+from app.services.context_builder import schedule_summary_update
 from app.services.serializers import serialize_tool_output, ensure_execution_plan
 
+
+def _executor_kwargs(state: dict, plan_obj: ExecutionPlan) -> dict:
+    return dict(
+        rag_result=state.get("rag_response"),
+        plan_result=plan_obj,
+        query=state.get("query"),
+        verbose=True,
+        max_parallel_steps=state.get("max_parallel_steps"),
+        tool_memo=state.get("tool_memo")
+    )
+
+
+def _executed_state(state: dict, plan_obj: ExecutionPlan, executor_result: ExecutorOutput) -> dict:
+    # JSON-safe serialization
+    new_state = state.copy()
+    new_state["executor_response"] = executor_result.final_answer
+    new_state["executor_observations"] = serialize_tool_output(executor_result.observations)
+    new_state["plan"] = serialize_tool_output(plan_obj.plan)
+    new_state["duplicate_calls_avoided"] = executor_result.duplicate_calls_avoided
+    return new_state
+
+
+def _failed_executor_state(state: dict, error: Exception) -> dict:
+    logging.error(f"[ExecutorNode] Error: {str(error)}")
+    new_state = state.copy()
+    new_state["executor_response"] = f"Executor failed: {error}"
+    new_state["executor_observations"] = []
+    return new_state
+
+
 @traceable(run_type="chain")
 def executor_node(state: dict) -> dict:
     """Runs the executor and returns JSON-safe data."""
     try:
-        plan_data = state.get("plan")
-        rag_response = state.get("rag_response")
         query = state.get("query")
         user_id = state.get("user_id")
 
-        if not plan_data:
+        if not state.get("plan"):
             logging.warning("[ExecutorNode] No plan in state.")
             return state
 
         # Ensure valid ExecutionPlan object
-        plan_obj = ensure_execution_plan(plan_data)
+        plan_obj = ensure_execution_plan(state.get("plan"))
 
         # Execute agent
-        executor_result = execute_agent(
-            rag_result=rag_response,
-            plan_result=plan_obj,
-            query=query,
-            verbose=True
-        )
-
-        # JSON-safe serialization
-        serialized_observations = serialize_tool_output(executor_result.observations)
-        serialized_plan = serialize_tool_output(plan_obj.plan)
+        executor_result = execute_agent(**_executor_kwargs(state, plan_obj))
 
         if user_id:
             add_message(user_id, f"user: {query}")
             add_message(user_id, f"agent: {executor_result.final_answer}")
+            schedule_summary_update(user_id)
+
+        return _executed_state(state, plan_obj, executor_result)
+
+    except Exception as e:
+        return _failed_executor_state(state, e)
+
+
+@traceable(run_type="chain")
+async def aexecutor_node(state: dict) -> dict:
+    """Async version of executor_node."""
+    try:
+        query = state.get("query")
+        user_id = state.get("user_id")
+
+        if not state.get("plan"):
+            logging.warning("[ExecutorNode] No plan in state.")
+            return state
+
+        plan_obj = ensure_execution_plan(state.get("plan"))
+        executor_result = await aexecute_agent(**_executor_kwargs(state, plan_obj))
+
+        if user_id:
+            await aadd_message(user_id, f"user: {query}")
+            await aadd_message(user_id, f"agent: {executor_result.final_answer}")
+            schedule_summary_update(user_id)
 
-        new_state = state.copy()
-        new_state["executor_response"] = executor_result.final_answer
-        new_state["executor_observations"] = serialized_observations
-        new_state["plan"] = serialized_plan
-        return new_state
+        return _executed_state(state, plan_obj, executor_result)
 
     except Exception as e:
-        logging.error(f"[ExecutorNode] Error: {str(e)}")
-        new_state = state.copy()
-        new_state["executor_response"] = f"Executor failed: {e}"
-        new_state["executor_observations"] = []
-        return new_state
+        return _failed_executor_state(state, e)
@@ -3,9 +3,15 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_openai import ChatOpenAI
 from app.models.schemas import ExecutionPlan, ToolOutput
 from app.tools import geo_tools, wikipedia_tools, tavily_tools, time_tools
+from app.services.tool_cache import cache_tools
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langsmith import traceable
+from typing import List, Optional
 
+import asyncio
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 
@@ -27,12 +33,22 @@ plan_parser = PydanticOutputParser(pydantic_object=ExecutionPlan)
 AVAILABLE_TOOLS = [geo_tools.geo_tool, wikipedia_tools.wikipedia_tool, tavily_tools.tavily_tool, time_tools.time_tool ]
 tool_descriptions = [f"- {t.name}: {t.description}" for t in AVAILABLE_TOOLS]
 
-# Map tool names to functions for execution
-TOOL_MAP = {
+# Map tool names to functions for execution (results cached per tool TTL)
+TOOL_MAP = cache_tools({
     "geo_location": geo_tools.geo_tool,
     "wikipedia_search": wikipedia_tools.wikipedia_tool,
     "tavily_tool": tavily_tools.tavily_tool,
     "time_tool": time_tools.time_tool
+})
+
+# Planner step execution: bounded pool + per-tool timeouts (seconds)
+PLANNER_MAX_WORKERS = int(os.getenv("PLANNER_MAX_WORKERS", "4"))
+PLANNER_TOOL_TIMEOUT = float(os.getenv("PLANNER_TOOL_TIMEOUT", "15"))
+TOOL_TIMEOUTS = {
+    "geo_location": 5.0,
+    "time_tool": 2.0,
+    "wikipedia_search": PLANNER_TOOL_TIMEOUT,
+    "tavily_tool": PLANNER_TOOL_TIMEOUT,
 }
 
 # Step 3: Create system message(later will specific the tools)
@@ -53,6 +69,7 @@ Important instructions:
 - Choose tools that best help answer the user's query (do not always default to geo_location).
 - For each step, include a "tool" field (geo_location, wikipedia_search, tavily_tool, time_tool).
 - Provide concise inputs that make sense for the tool (e.g., query text, not "user's location").
+- Give every step a short unique "step" id. Only if a step needs an earlier step's result, list that id in "depends_on"; independent steps leave it empty so they can run in parallel.
 - Always return steps as JSON following these format instructions:
 {{format_instructions}}
 - Do not include any text outside of the JSON.
@@ -70,17 +87,98 @@ planner_chain = planner_prompt.partial(format_instructions=plan_parser.get_forma
 
 
 # Helper: Execute a single tool and attach output
+def _attach_result(step: ToolOutput, result) -> ToolOutput:
+    # Keep original step identifier
+    step.output = result
+    if step.step is None and hasattr(result, "step"):
+        step.step = result.step  # propagate inner step if missing
+    return step
+
+
 def execute_tool(step: ToolOutput) -> ToolOutput:
     tool_func = TOOL_MAP.get(step.tool)
     try:
         # Call the tool
-        result = tool_func.invoke(step.input)
-        # Keep original step identifier
-        step.output = result
-        if step.step is None and hasattr(result, "step"):
-            step.step = result.step  # propagate inner step if missing
+        return _attach_result(step, tool_func.invoke(step.input))
+    except Exception as e:
+        step.output = f"Error executing tool: {str(e)}"
+    return step
+
+
+async def aexecute_tool(step: ToolOutput) -> ToolOutput:
+    """Async version of execute_tool"""
+    tool_func = TOOL_MAP.get(step.tool)
+    try:
+        return _attach_result(step, await tool_func.ainvoke(step.input))
     except Exception as e:
         step.output = f"Error executing tool: {str(e)}"
     return step
 
 
+def _timeout_step(step: ToolOutput, timeout: float) -> ToolOutput:
+    step.output = f"Error executing tool: {step.tool} timed out after {timeout:g}s"
+    return step
+
+
+class _TimedStep:
+    """Runs a step on a pool worker and records when it actually started"""
+
+    def __init__(self, step: ToolOutput):
+        # The worker gets its own copy so a timed-out call can't mutate the returned step later
+        self.step = step.model_copy()
+        self.started = threading.Event()
+        self.started_at: Optional[float] = None
+
+    def __call__(self) -> ToolOutput:
+        self.started_at = time.monotonic()
+        self.started.set()
+        return execute_tool(self.step)
+
+
+# Helper: Execute all planned steps concurrently, keeping plan order
+def execute_tools_parallel(steps: List[ToolOutput]) -> List[ToolOutput]:
+    """
+    Run every step through `execute_tool` on a bounded thread pool.
+    A step that errors or exceeds its tool timeout keeps the error in its own
+    `output`; the other steps are unaffected. The timeout runs from when the
+    step starts, not while it waits for a worker.
+    """
+    if not steps:
+        return []
+
+    pool = ContextThreadPoolExecutor(max_workers=min(PLANNER_MAX_WORKERS, len(steps)))
+    try:
+        runs = [_TimedStep(step) for step in steps]
+        futures = [pool.submit(run) for run in runs]
+
+        results = []
+        for step, run, future in zip(steps, runs, futures):
+            timeout = TOOL_TIMEOUTS.get(step.tool, PLANNER_TOOL_TIMEOUT)
+            try:
+                # Earlier steps are settled by now; a step still queued behind a timed-out
+                # straggler's worker gets `timeout` to start
+                if not run.started.wait(timeout):
+                    raise TimeoutError
+                results.append(future.result(timeout=max(0.0, run.started_at + timeout - time.monotonic())))
+            except TimeoutError:
+                future.cancel()
+                results.append(_timeout_step(step, timeout))
+        return results
+    finally:
+        # Don't wait on stragglers that already timed out
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def aexecute_tools_parallel(steps: List[ToolOutput]) -> List[ToolOutput]:
+    """Async version of execute_tools_parallel (asyncio tasks, same limits and timeouts)"""
+    semaphore = asyncio.Semaphore(PLANNER_MAX_WORKERS)
+
+    async def run(step: ToolOutput) -> ToolOutput:
+        timeout = TOOL_TIMEOUTS.get(step.tool, PLANNER_TOOL_TIMEOUT)
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(aexecute_tool(step.model_copy()), timeout)
+            except asyncio.TimeoutError:
+                return _timeout_step(step, timeout)
+
+    return list(await asyncio.gather(*(run(step) for step in steps)))
@@ -1,60 +1,94 @@
 import logging
 from langsmith import traceable
-from app.agents.planner_agent import planner_chain, execute_tool
+from app.agents.planner_agent import planner_chain, execute_tools_parallel, aexecute_tools_parallel
 from app.models.schemas import ExecutionPlan, ToolOutput
-from app.services.redis_helpers import get_messages
+from app.services.context_builder import build_context, load_conversation, aload_conversation
 from app.services.serializers import serialize_tool_output
+from app.services.tool_memo import memo_from_plan
+
+
+def _context_query(query: str, context: str) -> str:
+    return query + "\nPrevious conversation:\n" + context if context else query
+
+
+def _raw_steps(plan_result) -> list:
+    # Unwrap plan list
+    if isinstance(plan_result, dict):
+        return plan_result.get("plan", [])
+    return getattr(plan_result, "plan", [])
+
+
+def _planned_state(state: dict, enriched_steps: list) -> dict:
+    # Wrap in ExecutionPlan (expects a list of ToolOutput objects)
+    enriched_plan = ExecutionPlan(
+        plan=[step if isinstance(step, ToolOutput) else ToolOutput(**step) for step in enriched_steps]
+    )
+
+    # Store JSON-safe version for state
+    plan_json_safe = [serialize_tool_output(step) for step in enriched_plan.plan]
+
+    new_state = state.copy()
+    new_state["plan"] = plan_json_safe
+    # Memo of tool results already fetched, so the executor can reuse them
+    new_state["tool_memo"] = memo_from_plan(plan_json_safe)
+    return new_state
+
+
+def _failed_plan_state(state: dict, error: Exception) -> dict:
+    logging.error(f"[PlannerNode] Error: {str(error)}")
+
+    # Create proper ToolOutput object for error
+    error_step = ToolOutput(tool="error", input=state.get("query"), output=str(error))
+    error_plan = ExecutionPlan(plan=[error_step])
+
+    plan_json_safe = [serialize_tool_output(step) for step in error_plan.plan]
+
+    new_state = state.copy()
+    new_state["plan"] = plan_json_safe
+    return new_state
+
 
 @traceable(run_type="tool")
 def planner_node(state: dict) -> dict:
     """Generate an execution plan and return JSON-safe data."""
     query = state.get("query")
     user_id = state.get("user_id")
-    history = state.get("history", [])
 
-    prior_messages = get_messages(user_id, limit=10) if user_id else []
-    context_query = (
-        query + "\nPrevious conversation:\n" + "\n".join(prior_messages)
-        if prior_messages else query
-    )
+    # Reuse the conversation prefetched by the pipeline when available
+    summary, prior_messages = state.get("conversation_summary") or "", state.get("previous_messages")
+    if prior_messages is None:
+        summary, prior_messages = load_conversation(user_id, limit=10)
+    context = build_context("planner", summary, prior_messages)
 
     try:
         # 1. Produce raw plan
-        plan_result = planner_chain.invoke({"query": context_query})
+        plan_result = planner_chain.invoke({"query": _context_query(query, context)})
 
-        # 2. Unwrap plan list
-        if isinstance(plan_result, dict):
-            raw_steps = plan_result.get("plan", [])
-        else:
-            raw_steps = getattr(plan_result, "plan", [])
+        # 2. Execute steps concurrently (plan order is preserved)
+        enriched_steps = execute_tools_parallel(_raw_steps(plan_result))
 
+        # 3. Wrap, serialize and memoize
+        return _planned_state(state, enriched_steps)
 
-        # 3. Execute steps
-        enriched_steps = [execute_tool(step) for step in raw_steps]
-
-        # 4. Wrap in ExecutionPlan (expects a list of ToolOutput objects)
-        enriched_plan = ExecutionPlan(
-            plan=[step if isinstance(step, ToolOutput) else ToolOutput(**step) for step in enriched_steps]
-        )
-
-        # 5. Store JSON-safe version for state/history
-        plan_json_safe = [serialize_tool_output(step) for step in enriched_plan.plan]
+    except Exception as e:
+        return _failed_plan_state(state, e)
 
-        new_state = state.copy()
-        new_state["plan"] = plan_json_safe
-        new_state["history"] = state.get("history", []) + [plan_json_safe]
-        return new_state
 
-    except Exception as e:
-        logging.error(f"[PlannerNode] Error: {str(e)}")
+@traceable(run_type="tool")
+async def aplanner_node(state: dict) -> dict:
+    """Async version of planner_node."""
+    query = state.get("query")
+    user_id = state.get("user_id")
 
-        # Create proper ToolOutput object for error
-        error_step = ToolOutput(tool="error", input=query, output=str(e))
-        error_plan = ExecutionPlan(plan=[error_step])
+    summary, prior_messages = state.get("conversation_summary") or "", state.get("previous_messages")
+    if prior_messages is None:
+        summary, prior_messages = await aload_conversation(user_id, limit=10)
+    context = build_context("planner", summary, prior_messages)
 
-        plan_json_safe = [serialize_tool_output(step) for step in error_plan.plan]
+    try:
+        plan_result = await planner_chain.ainvoke({"query": _context_query(query, context)})
+        enriched_steps = await aexecute_tools_parallel(_raw_steps(plan_result))
+        return _planned_state(state, enriched_steps)
 
-        new_state = state.copy()
-        new_state["plan"] = plan_json_safe
-        new_state["history"] = history + [plan_json_safe]
-        return new_state
+    except Exception as e:
+        return _failed_plan_state(state, e)
@@ -1,47 +1,85 @@
 import logging
 from langsmith import traceable
-from app.tools.vector_store_tool import get_context
+from app.tools.vector_store_tool import get_context, aget_context
 from app.agents.rag_agent import rag_chain
-from app.services.redis_helpers import get_messages
+from app.services.context_builder import build_context, load_conversation, aload_conversation
 from app.models.schemas import RagAgentResponse
 
+
+def _rag_inputs(state: dict, previous_context: str, vector_context) -> dict:
+    # Merge context
+    context = f"{previous_context}\n\n{vector_context}" if previous_context else vector_context
+
+    # Safe plan extraction
+    plan = state.get("plan")
+    plan_list = plan.get("plan", []) if isinstance(plan, dict) else plan
+
+    return {
+        "plan": plan_list,
+        "query": state.get("query"),
+        "context": context
+    }
+
+
+def _rag_state(state: dict, rag_result) -> dict:
+    if isinstance(rag_result, RagAgentResponse):
+        rag_result = rag_result.model_dump()
+
+    new_state = state.copy()
+    new_state["vector_context"] = None  # raw documents are not JSON-safe; don't keep them in state/checkpoints
+    new_state["rag_response"] = rag_result
+    return new_state
+
+
+def _failed_rag_state(state: dict, error: Exception) -> dict:
+    logging.error(f"[RAG Node] Error: {str(error)}")
+    return _rag_state(state, {"error": str(error)})
+
+
 @traceable(run_type="retriever")
 def rag_node(state: dict) -> dict:
     """RAG node that retrieves context and returns JSON-safe dicts."""
     query = state.get("query")
-    plan = state.get("plan")
     user_id = state.get("user_id")
 
     try:
-        # 1. Previous messages
-        previous_messages = get_messages(user_id, limit=10) if user_id else []
-        previous_context = "\n".join(previous_messages)
+        # 1. Conversation context within the RAG token budget (prefetched by the pipeline when available)
+        summary, previous_messages = state.get("conversation_summary") or "", state.get("previous_messages")
+        if previous_messages is None:
+            summary, previous_messages = load_conversation(user_id, limit=10)
+        previous_context = build_context("rag", summary, previous_messages)
 
-        # 2. Vector store retrieval
-        vector_context = get_context(query).output
+        # 2. Vector store retrieval (may already have run alongside the planner)
+        vector_context = state.get("vector_context")
+        if vector_context is None:
+            vector_context = get_context(query).output
 
-        # 3. Merge context
-        context = f"{previous_context}\n\n{vector_context}" if previous_context else vector_context
+        # 3. Run RAG chain
+        rag_result = rag_chain.invoke(_rag_inputs(state, previous_context, vector_context))
+        return _rag_state(state, rag_result)
 
-        # 4. Safe plan extraction
-        plan_list = plan.get("plan", []) if isinstance(plan, dict) else plan
+    except Exception as e:
+        return _failed_rag_state(state, e)
 
-        # 5. Run RAG chain
-        rag_result = rag_chain.invoke({
-            "plan": plan_list,
-            "query": query,
-            "context": context
-        })
 
-        if isinstance(rag_result, RagAgentResponse):
-            rag_result = rag_result.model_dump()
+@traceable(run_type="retriever")
+async def arag_node(state: dict) -> dict:
+    """Async version of rag_node."""
+    query = state.get("query")
+    user_id = state.get("user_id")
+
+    try:
+        summary, previous_messages = state.get("conversation_summary") or "", state.get("previous_messages")
+        if previous_messages is None:
+            summary, previous_messages = await aload_conversation(user_id, limit=10)
+        previous_context = build_context("rag", summary, previous_messages)
+
+        vector_context = state.get("vector_context")
+        if vector_context is None:
+            vector_context = (await aget_context(query)).output
 
-        new_state = state.copy()
-        new_state["rag_response"] = rag_result
-        return new_state
+        rag_result = await rag_chain.ainvoke(_rag_inputs(state, previous_context, vector_context))
+        return _rag_state(state, rag_result)
 
     except Exception as e:
-        logging.error(f"[RAG Node] Error: {str(e)}")
-        new_state = state.copy()
-        new_state["rag_response"] = {"error": str(e)}
-        return new_state
+        return _failed_rag_state(state, e)
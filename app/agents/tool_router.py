@@ -0,0 +1,101 @@
+# tool_router.py
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+from app.models.schemas import ToolOutput
+from app.services import metrics
+from app.services.tool_memo import canonical_tool_name
+
+# Min confidence (0-1) needed to route a step locally instead of asking the LLM
+LOCAL_ROUTER_THRESHOLD = float(os.getenv("LOCAL_ROUTER_THRESHOLD", "0.6"))
+
+# Score weights
+PLANNER_HINT_WEIGHT = 0.5   # planner already tagged the step with a known tool (not enough on its own)
+KEYWORD_RULE_WEIGHT = 1.0   # per keyword rule that matches
+
+# Obvious keyword -> tool mappings
+KEYWORD_RULES: Dict[str, List[str]] = {
+    "time_tool": [r"\bcurrent (date|time)\b", r"\btoday'?s date\b", r"\bwhat time\b", r"\bdate and time\b"],
+    "legiscan_tool": [r"\bbills?\b", r"\blegislation\b", r"\blegislative\b", r"\blegiscan\b", r"\bstatutes?\b"],
+    "gnews_tool": [r"\bnews\b", r"\bheadlines?\b", r"\barticles?\b"],
+    "bing_rss_tool": [r"\brss\b", r"\bbing\b"],
+    "geo_lookup": [r"\bip address\b", r"\bgeo ?location\b", r"\buser'?s location\b", r"\bwhere the user is\b"],
+    "wikipedia_search": [r"\bwikipedia\b", r"\bdefinitions?\b", r"\bdefine\b", r"\bbackground\b", r"\bhistory of\b"],
+    "tavily_tool": [r"\brental assistance\b", r"\blistings?\b", r"\brent prices?\b", r"\bassistance programs?\b"],
+    "broad_duckduckgo_search": [r"\bduckduckgo\b", r"\bweb search\b"],
+    "chat_tool": [r"\bfollow[- ]?up\b", r"\bask (the )?user\b"],
+}
+
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "for", "to", "in", "on", "or", "with", "from", "by", "is", "are",
+    "use", "this", "that", "get", "find", "search", "about", "info", "information", "e", "g", "etc",
+}
+
+
+def _tokens(text: str) -> set:
+    return {tok for tok in re.findall(r"[a-z0-9]+", text.lower()) if tok not in STOPWORDS and len(tok) > 1}
+
+
+def step_query(step: ToolOutput, default: str) -> str:
+    """Best text to pass to the tool for this step"""
+    if isinstance(step.input, dict) and step.input.get("query"):
+        return str(step.input["query"])
+    if isinstance(step.input, str) and step.input.strip():
+        return step.input
+    return default
+
+
+def _step_text(step: ToolOutput) -> str:
+    parts = [str(step.step or ""), step_query(step, "")]
+    return " ".join(part for part in parts if part)
+
+
+def score_tools(step: ToolOutput, descriptions: Dict[str, str]) -> List[Tuple[str, float]]:
+    """Score every tool for a step: planner hint + keyword rules + lexical overlap with the tool description"""
+    text = _step_text(step).lower()
+    step_tokens = _tokens(text)
+    hint = canonical_tool_name(step.tool)
+
+    scores = []
+    for name, description in descriptions.items():
+        score = PLANNER_HINT_WEIGHT if name == hint else 0.0
+        score += KEYWORD_RULE_WEIGHT * sum(1 for pattern in KEYWORD_RULES.get(name, []) if re.search(pattern, text))
+        if step_tokens:
+            score += len(step_tokens & _tokens(f"{name} {description}")) / len(step_tokens)
+        scores.append((name, score))
+    return sorted(scores, key=lambda item: item[1], reverse=True)
+
+
+def route_locally(step: ToolOutput, query: str, descriptions: Dict[str, str], threshold: Optional[float] = None) -> Optional[ToolOutput]:
+    """
+    Pick a tool for the step without an LLM call.
+    Returns None when the router is unsure so the caller falls back to the LLM.
+    """
+    threshold = LOCAL_ROUTER_THRESHOLD if threshold is None else threshold
+    ranked = score_tools(step, descriptions)
+    if not ranked:
+        return None
+
+    best_name, best = ranked[0]
+    second = ranked[1][1] if len(ranked) > 1 else 0.0
+    # margin over the runner-up, discounted when the best score is itself weak (lexical only)
+    confidence = ((best - second) / best) * min(1.0, best) if best > 0 else 0.0
+
+    if confidence < threshold:
+        metrics.incr("router.llm")
+        return None
+
+    metrics.incr("router.local")
+    logging.info(f"[ToolRouter] Routed step {step.step!r} -> {best_name} (confidence {confidence:.2f})")
+    return ToolOutput(tool=best_name, input={"query": step_query(step, query)}, output=None)
+
+
+def get_router_stats() -> Dict[str, float]:
+    """How often steps were routed locally vs. sent to the LLM"""
+    counters = metrics.get_metrics()["counters"]
+    return {
+        "local": counters.get("router.local", 0),
+        "llm": counters.get("router.llm", 0),
+        "local_hit_rate": metrics.hit_rate("router.local", "router.llm"),
+    }
@@ -1,8 +1,37 @@
-from typing import List, TypedDict
+import json
+import os
+from typing import Annotated, Any, Dict, List, Optional, TypedDict
 from app.models.schemas import ExecutionPlan
 
+# Bounds on the multi-turn history kept in each checkpoint
+CHECKPOINT_MAX_TURNS = int(os.getenv("CHECKPOINT_MAX_TURNS", "10"))
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", "200000"))
+
+
+def bounded_history(current: Optional[List[dict]], update: Optional[List[dict]]) -> List[dict]:
+    """
+    Reducer for `history`: nodes pass the full list, which replaces the current one,
+    keeping only the last CHECKPOINT_MAX_TURNS turns and dropping the oldest
+    until the serialized history fits in CHECKPOINT_MAX_BYTES.
+    """
+    history = list(update if update is not None else current or [])[-CHECKPOINT_MAX_TURNS:]
+    while len(history) > 1 and len(json.dumps(history, default=str)) > CHECKPOINT_MAX_BYTES:
+        history.pop(0)
+    return history
+
+
 class PipelineState(TypedDict, total=False):
     user_id: str
     query: str
     plan: ExecutionPlan | None
-    history: List[ExecutionPlan]  # multi-turn memory
+    history: Annotated[List[dict], bounded_history]  # multi-turn memory (one dict per turn)
+    max_parallel_steps: int  # per-request cap on concurrently executed plan steps
+    tool_memo: Dict[str, Any]  # (tool, normalized input) -> result, shared by planner and executor
+    duplicate_calls_avoided: int  # tool calls the executor reused from tool_memo this run
+    previous_messages: List[str]  # recent chat messages prefetched once for planner + RAG
+    conversation_summary: str  # rolling summary of messages older than previous_messages
+    location: Optional[str]  # user's state from their session
+    vector_context: Any  # vector store documents prefetched while the planner runs
+    rag_response: Any
+    executor_response: str
+    executor_observations: List[dict]
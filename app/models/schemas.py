@@ -9,11 +9,23 @@ class ToolOutput(BaseModel):
     input: Any
     output: Any
     step: Optional[Union[str, int]] = None
+    depends_on: Optional[List[Union[str, int]]] = Field(
+        default=None,
+        description="Ids of earlier steps this step must wait for; steps without dependencies can run in parallel"
+    )
 
 # Define Schema for Execution Output
 class ExecutorOutput(BaseModel):
     final_answer: str
     observations: List[ToolOutput]=[] 
+    duplicate_calls_avoided: int = 0
+
+
+# Defines schema for routing a whole plan in a single LLM call
+class ToolRoutingPlan(BaseModel):
+    decisions: List[ToolOutput] = Field(
+        description="One tool decision per plan step, in the same order as the steps"
+    )
 
 
 # Defines schema for the Plan
@@ -24,4 +36,27 @@ class ExecutionPlan(BaseModel):
 
 class RagAgentResponse(BaseModel):
     query: str = Field(description="User's original query to the RAG agent")
-    response: str = Field(description="The information the RAG agent was able to gather based on the context provided and the user's query")
\ No newline at end of file
+    response: str = Field(description="The information the RAG agent was able to gather based on the context provided and the user's query")
+
+# Defines schema for a rate limit decision (shown in Slack replies)
+class RateLimitResult(BaseModel):
+    allowed: bool
+    remaining: int = Field(description="Requests left in the tightest tier")
+    reset_in: float = Field(description="Seconds until the tightest tier frees up a request")
+    limit: int = Field(description="Limit of the tightest tier")
+    tier: str = Field(description="Tier that decided the result: user, workspace or global")
+
+
+class UserSession(BaseModel):
+    user_id: str
+    location: Optional[str] = None
+    summary: str = Field(default="", description="Rolling summary of older messages")
+    messages: List[str] = Field(default_factory=list, description="Recent messages not yet in the summary, newest first")
+    turns: List[dict] = Field(default_factory=list, description="Last pipeline turns, oldest first")
+    last_thread: Optional[str] = None
+
+
+class AdmissionResult(BaseModel):
+    admitted: bool
+    busy: bool = Field(default=False, description="Admitted, but the queue is backed up")
+    position: int = Field(description="Place in its priority class's queue, counting this request")
@@ -1,27 +1,184 @@
+import asyncio
+import logging
+import os
+from typing import Optional
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.redis.aio import AsyncRedisSaver
 from app.models.pipeline_state import PipelineState
-from app.agents.rag_node import rag_node
-from app.agents.executor_node import executor_node
-from app.agents.planner_node import planner_node
+from app.agents.rag_node import rag_node, arag_node
+from app.agents.executor_node import executor_node, aexecutor_node
+from app.agents.planner_node import planner_node, aplanner_node
+from app.services.redis_helpers import REDIS_URL, aadd_message
+from app.services.context_builder import schedule_summary_update
+from app.services.history_store import append_turn, aappend_turn
+from app.services.serializers import serialize_tool_output
+from app.services.user_session import aload_session
+from app.services.prefetch import aprefetched
+from app.models.schemas import UserSession
+from app.tools.vector_store_tool import aget_context
 
-def build_pipeline_graph():
+# Idle minutes before a user's checkpoints expire (reads refresh the TTL)
+CHECKPOINT_TTL_MINUTES = int(os.getenv("CHECKPOINT_TTL_MINUTES", "1440"))
 
-    checkpointer = InMemorySaver()
 
-    graph = StateGraph(PipelineState, memory_saver=checkpointer)
+def thread_id_for(user_id: str) -> str:
+    return f"pipeline_thread:{user_id}"
+
+
+def _turn(state: dict) -> dict:
+    return {
+        "query": state.get("query"),
+        "plan": {"plan": serialize_tool_output(state.get("plan") or [])},
+        "rag_response": state.get("rag_response"),
+        "executor_response": state.get("executor_response", "No response from executor"),
+        "executor_observations": state.get("executor_observations", []),
+        "duplicate_calls_avoided": state.get("duplicate_calls_avoided", 0)
+    }
+
+
+def _recorded_state(state: dict, turn: dict) -> dict:
+    # Per-turn scratch data is cleared so checkpoints only carry history + the last answer
+    return {
+        "history": (state.get("history") or []) + [turn],
+        "tool_memo": {},
+        "previous_messages": None,
+        "conversation_summary": "",
+        "location": None,
+        "vector_context": None,
+        "executor_observations": []
+    }
+
+
+def record_turn_node(state: dict) -> dict:
+    """Append this turn to the checkpointed history and to the user's history stream (read by chat_tool)."""
+    turn = _turn(state)
+    if state.get("user_id"):
+        append_turn(state["user_id"], turn)
+    return _recorded_state(state, turn)
+
+
+async def arecord_turn_node(state: dict) -> dict:
+    """Async version of record_turn_node."""
+    turn = _turn(state)
+    if state.get("user_id"):
+        await aappend_turn(state["user_id"], turn)
+    return _recorded_state(state, turn)
+
+
+async def aplanner_prefetch_node(state: dict) -> dict:
+    """Planner node that retrieves vector context (and loads the user's session if not given) while the planner runs."""
+    vector_task = asyncio.ensure_future(aget_context(state["query"]))
+    try:
+        if state.get("previous_messages") is None:
+            session = await aload_session(state.get("user_id"))
+            state = {**state, **_session_state(session)}
+        new_state = await aplanner_node(state)
+        vector_result = await aprefetched(vector_task, "vector context")
+    finally:
+        vector_task.cancel()
+    new_state["vector_context"] = vector_result.output if vector_result else None
+    return new_state
+
+
+def build_pipeline_graph(checkpointer=None, use_async: bool = False):
+    """
+    Compile the planner -> rag -> executor -> record_turn graph.
+    `use_async` wires in the async nodes (run with ainvoke); the checkpointer
+    defaults to an in-memory saver for local runs.
+    """
+    checkpointer = checkpointer or InMemorySaver()
+
+    graph = StateGraph(PipelineState)
 
     # Add nodes
-    graph.add_node("planner", planner_node)
-    graph.add_node("rag", rag_node)
-    graph.add_node("executor", executor_node)
+    graph.add_node("planner", aplanner_prefetch_node if use_async else planner_node)
+    graph.add_node("rag", arag_node if use_async else rag_node)
+    graph.add_node("executor", aexecutor_node if use_async else executor_node)
+    graph.add_node("record_turn", arecord_turn_node if use_async else record_turn_node)
 
     # Define edges
-    graph.add_edge(START, "planner") 
+    graph.add_edge(START, "planner")
     graph.add_edge("planner", "rag")
     graph.add_edge("rag", "executor")
-    graph.add_edge("executor", END)
+    graph.add_edge("executor", "record_turn")
+    graph.add_edge("record_turn", END)
 
     compiled_graph = graph.compile(checkpointer=checkpointer)
 
-    return compiled_graph, checkpointer
\ No newline at end of file
+    return compiled_graph, checkpointer
+
+
+_async_graph = None
+_async_graph_lock = asyncio.Lock()
+
+
+async def aget_pipeline_graph():
+    """Async graph checkpointed in Redis, built once per process."""
+    global _async_graph
+    async with _async_graph_lock:
+        if _async_graph is None:
+            checkpointer = AsyncRedisSaver(
+                redis_url=REDIS_URL,
+                ttl={"default_ttl": CHECKPOINT_TTL_MINUTES, "refresh_on_read": True}
+            )
+            await checkpointer.asetup()
+            _async_graph, _ = build_pipeline_graph(checkpointer=checkpointer, use_async=True)
+            logging.info(f"[PipelineGraph] Redis checkpointer ready (ttl={CHECKPOINT_TTL_MINUTES}m)")
+    return _async_graph
+
+
+def _session_state(session: Optional[UserSession]) -> dict:
+    if session is None:
+        return {"previous_messages": None, "conversation_summary": "", "location": None}
+    return {"previous_messages": session.messages, "conversation_summary": session.summary, "location": session.location}
+
+
+def _turn_input(user_query: str, user_id: str, max_parallel_steps: Optional[int], session: Optional[UserSession]) -> dict:
+    # Reset per-turn keys so nothing from the previous checkpointed turn leaks in
+    return {
+        "query": user_query,
+        "user_id": user_id,
+        "max_parallel_steps": max_parallel_steps,
+        "plan": None,
+        "tool_memo": {},
+        **_session_state(session),
+        "vector_context": None,
+        "rag_response": None,
+        "executor_response": None,
+        "executor_observations": [],
+        "duplicate_calls_avoided": 0
+    }
+
+
+async def arun_pipeline_graph(user_query: str, user_id: str, max_parallel_steps: Optional[int] = None, session: Optional[UserSession] = None) -> str:
+    """
+    Run one turn on the Redis-checkpointed graph. The thread is per user, so
+    history comes from the checkpoint instead of reloading the JSON blob, and
+    any MCP worker can pick up the conversation. A caller's UserSession seeds
+    the conversation and location so the nodes don't read them again.
+    """
+    logging.info(f"[PipelineGraph] Running query: {user_query}")
+    graph = await aget_pipeline_graph()
+    config = {"configurable": {"thread_id": thread_id_for(user_id)}}
+
+    # Only the final state is checkpointed (one Redis write per turn)
+    result = await graph.ainvoke(_turn_input(user_query, user_id, max_parallel_steps, session), config=config, durability="exit")
+    return result.get("executor_response") or "No response from executor"
+
+
+async def arecord_answer(user_query: str, user_id: str, answer: str) -> None:
+    """
+    Record an answer this user got without running the graph (semantic cache hit,
+    coalesced run) as a turn in their checkpoint, history stream and message log.
+    """
+    graph = await aget_pipeline_graph()
+    config = {"configurable": {"thread_id": thread_id_for(user_id)}}
+    snapshot = await graph.aget_state(config)
+    turn = _turn({"query": user_query, "executor_response": answer})
+    new_state = _recorded_state(snapshot.values, turn)
+    await graph.aupdate_state(config, {**new_state, "executor_response": answer}, as_node="record_turn")
+    await aappend_turn(user_id, turn)
+    await aadd_message(user_id, f"user: {user_query}")
+    await aadd_message(user_id, f"agent: {answer}")
+    schedule_summary_update(user_id)
@@ -1,46 +1,88 @@
+import asyncio
 import logging
-import json
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langsmith import traceable
-from app.services.redis_helpers import get_cached_result, cache_result, get_user_location
-from app.agents.planner_node import planner_node
-from app.agents.rag_node import rag_node
-from app.agents.executor_node import executor_node
+from app.services.redis_helpers import aadd_message
+from app.services.context_builder import schedule_summary_update
+from app.services.history_store import append_turn, aappend_turn
+from app.services.user_session import load_session, aload_session
+from app.services.prefetch import prefetched, aprefetched
+from app.tools.vector_store_tool import get_context, aget_context
+from app.agents.planner_node import planner_node, aplanner_node
+from app.agents.rag_node import rag_node, arag_node
+from app.agents.executor_node import executor_node, aexecutor_node
 from app.services.serializers import (
     serialize_tool_output,
     serialize_execution_plan,
     ensure_execution_plan
 )
-from app.models.schemas import ExecutionPlan
+from app.models.schemas import ExecutionPlan, UserSession
 from app.models.pipeline_state import PipelineState
+from typing import Optional
+
+
+# Previous turns loaded into state for each run
+HISTORY_CONTEXT_TURNS = 5
+
+
+def _log_history(history: list) -> list:
+    if history:
+        logging.info(f"[Pipeline] Loaded {len(history)} previous turns from history")
+    return history
+
+
+def _history_turn(user_query: str, plan_obj: ExecutionPlan, rag_result: dict, executor_result: dict) -> dict:
+    duplicate_calls_avoided = executor_result.get("duplicate_calls_avoided", 0)
+    logging.info(f"[Pipeline] Executor reused {duplicate_calls_avoided} planner tool results")
+    return {
+        "query": user_query,
+        "plan": serialize_execution_plan(plan_obj),
+        "rag_response": rag_result.get("rag_response"),
+        "executor_response": executor_result.get("executor_response", "No response from executor"),
+        "executor_observations": serialize_tool_output(executor_result.get("executor_observations")),
+        "duplicate_calls_avoided": duplicate_calls_avoided
+    }
+
 
 @traceable(run_type="chain", name="Pipeline Execution")
-def pipeline_query(user_query: str, user_id: str) -> str:
+def pipeline_query(user_query: str, user_id: str, max_parallel_steps: Optional[int] = None, session: Optional[UserSession] = None) -> str:
     """
     Run the Rights2Roof pipeline with multi-turn support.
     Maintains history between queries for the same user.
+    `max_parallel_steps` caps how many plan steps the executor runs at once
+    (defaults to EXECUTOR_MAX_PARALLEL_STEPS). `session` is the caller's already
+    loaded UserSession; without one it is loaded here (one Redis round trip).
     """
     logging.info(f"[Pipeline] Running query: {user_query}")
 
-    # Cache key for multi-turn history
-    cache_key = f"user:{user_id}:history"
-    cached = get_cached_result(cache_key)
-    history = []
-    if cached:
-        history = json.loads(cached).get("history", [])
-        logging.info(f"[Pipeline] Loaded {len(history)} previous steps from history")
+    with ContextThreadPoolExecutor(max_workers=1) as prefetch:
+        # Start retrieval right away; it doesn't depend on the plan
+        vector_future = prefetch.submit(lambda: get_context(user_query).output)
+        session = session or load_session(user_id, turn_limit=HISTORY_CONTEXT_TURNS)
+        history = _log_history(session.turns)
+        summary, previous_messages = session.summary, session.messages
 
-    # Planner node -> returns dict
-    plan_result = planner_node({"query": user_query, "user_id": user_id, "history": history})
-    plan_obj: ExecutionPlan = ensure_execution_plan(plan_result)
+        # Planner node -> returns dict (vector retrieval keeps running meanwhile)
+        plan_result = planner_node({
+            "query": user_query,
+            "user_id": user_id,
+            "history": history,
+            "previous_messages": previous_messages,
+            "conversation_summary": summary
+        })
+        plan_obj: ExecutionPlan = ensure_execution_plan(plan_result)
+
+        # RAG node -> receives JSON-safe plan and the prefetched context
+        rag_result = rag_node({
+            "query": user_query,
+            "plan": serialize_execution_plan(plan_obj)["plan"],
+            "history": history,
+            "user_id": user_id,
+            "previous_messages": previous_messages,
+            "conversation_summary": summary,
+            "vector_context": prefetched(vector_future, "vector context")
+        })
 
-    # RAG node -> receives JSON-safe plan
-    rag_result = rag_node({
-        "query": user_query,
-        "plan": serialize_execution_plan(plan_obj)["plan"],
-        "history": history,
-        "user_id": user_id
-    })
-    location = get_user_location(user_id)
     # Executor node -> receives proper ExecutionPlan object
     executor_result = executor_node({
         "query": user_query,
@@ -48,22 +90,80 @@ def pipeline_query(user_query: str, user_id: str) -> str:
         "rag_response": rag_result.get("rag_response"),
         "history": history,
         "user_id": user_id,
-        "location": location
+        "location": session.location,
+        "max_parallel_steps": max_parallel_steps,
+        "tool_memo": plan_result.get("tool_memo", {})
     })
 
-    executor_response = executor_result.get("executor_response", "No response from executor")
+    # Append the new turn to the user's history
+    turn = _history_turn(user_query, plan_obj, rag_result, executor_result)
+    append_turn(user_id, turn)
+
+    return turn["executor_response"]
 
-    # Update history with the new turn
-    history.append({
+
+@traceable(run_type="chain", name="Async Pipeline Execution")
+async def apipeline_query(user_query: str, user_id: str, max_parallel_steps: Optional[int] = None, session: Optional[UserSession] = None) -> str:
+    """
+    Async version of pipeline_query built on ainvoke, async tools and redis.asyncio.
+    Doesn't hold a worker thread for the run, so one process can serve many
+    concurrent pipelines.
+    """
+    logging.info(f"[Pipeline] Running async query: {user_query}")
+
+    # Start retrieval right away; it doesn't depend on the plan
+    vector_task = asyncio.ensure_future(aget_context(user_query))
+    try:
+        session = session or await aload_session(user_id, turn_limit=HISTORY_CONTEXT_TURNS)
+        history = _log_history(session.turns)
+        summary, previous_messages = session.summary, session.messages
+
+        # Planner node (vector retrieval keeps running meanwhile)
+        plan_result = await aplanner_node({
+            "query": user_query,
+            "user_id": user_id,
+            "history": history,
+            "previous_messages": previous_messages,
+            "conversation_summary": summary
+        })
+        plan_obj: ExecutionPlan = ensure_execution_plan(plan_result)
+
+        vector_result = await aprefetched(vector_task, "vector context")
+        rag_result = await arag_node({
+            "query": user_query,
+            "plan": serialize_execution_plan(plan_obj)["plan"],
+            "history": history,
+            "user_id": user_id,
+            "previous_messages": previous_messages,
+            "conversation_summary": summary,
+            "vector_context": vector_result.output if vector_result else None
+        })
+    finally:
+        vector_task.cancel()
+
+    executor_result = await aexecutor_node({
         "query": user_query,
-        "plan": serialize_execution_plan(plan_obj),
+        "plan": plan_obj,
         "rag_response": rag_result.get("rag_response"),
-        "executor_response": executor_response,
-        "executor_observations": serialize_tool_output(executor_result.get("executor_observations"))
+        "history": history,
+        "user_id": user_id,
+        "location": session.location,
+        "max_parallel_steps": max_parallel_steps,
+        "tool_memo": plan_result.get("tool_memo", {})
     })
 
-    # Cache updated history
-    cache_result(cache_key, json.dumps({"history": history}))
+    turn = _history_turn(user_query, plan_obj, rag_result, executor_result)
+    await aappend_turn(user_id, turn)
 
-    return executor_response
+    return turn["executor_response"]
 
+
+async def arecord_answer(user_query: str, user_id: str, answer: str) -> None:
+    """
+    Record an answer this user got without running the pipeline (semantic cache
+    hit, coalesced run) in their history and message log.
+    """
+    await aappend_turn(user_id, _history_turn(user_query, ExecutionPlan(plan=[]), {}, {"executor_response": answer}))
+    await aadd_message(user_id, f"user: {user_query}")
+    await aadd_message(user_id, f"agent: {answer}")
+    schedule_summary_update(user_id)
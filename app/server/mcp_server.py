@@ -1,21 +1,56 @@
 #MCP Server goes here
-from fastmcp import FastMCP            
+from fastmcp import FastMCP, Context
 from typing import Optional, Dict, Any  
 import asyncio
+import os
+from time import perf_counter
+from contextlib import asynccontextmanager
 from app.tools.wikipedia_tools import wikipedia_search
 from app.tools.geo_tools import get_location_from_ip
 from app.tools.tavily_tools import tavily_search
 from app.tools.time_tools import time_tool_fn
-from app.pipelines.pipeline_query import pipeline_query
+from app.pipelines.pipeline_query import apipeline_query, arecord_answer as arecord_query_answer
+from app.pipelines.pipeline_graph import arun_pipeline_graph, arecord_answer as arecord_graph_answer
 from app.tools.bing_rss_tool import fetch_rss_news
 from app.tools.legal_scan_tool import legiscan_search
 from app.tools.chat_tool import chat_tool_fn
-from app.tools.vector_store_tool import get_context
+from app.tools.vector_store_tool import aget_context
 from langsmith import traceable
 from app.services.serializers import serialize_tool_output
+from app.services.metrics import get_metrics
+from app.services.streaming import stream_tokens_to, ThrottledSink
+from app.agents.tool_router import get_router_stats
+from app.services.semantic_cache import acheck_answer, astore_answer, get_semantic_cache_stats
+from app.services.tool_cache import get_tool_cache_stats
+from app.services.request_coalescing import acoalesced
+from app.services.redis_helpers import aclose_redis, arequest_scope, get_round_trip_stats
+from app.services.user_session import aload_session
+from app.services.admission import admitted, get_admission_stats
 
 
-rights2roof_server = FastMCP("rights2roof_tools")
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    yield
+    # Release pooled Redis connections on shutdown
+    await aclose_redis()
+
+
+rights2roof_server = FastMCP("rights2roof_tools", lifespan=lifespan)
+
+# Min seconds between streamed answer updates sent as MCP progress notifications
+STREAM_PROGRESS_INTERVAL = float(os.getenv("STREAM_PROGRESS_INTERVAL", "0.3"))
+
+# "graph" runs the Redis-checkpointed LangGraph; "query" the hand-wired pipeline_query
+PIPELINE_RUNNER = os.getenv("PIPELINE_RUNNER", "graph")
+
+# Fire-and-forget tasks (cache writes) kept referenced until they finish
+_background_tasks = set()
+
+
+def _in_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 # == Tools for agents to use ==
@@ -27,8 +62,8 @@ def fetch_location_from_ip(ip:Optional[str] = None) -> Dict[str, Any]:
 def wikipedia_lookup(query: str) -> Dict[str, Any]:
     return {"result": wikipedia_search(query)}
 
-@rights2roof_server.tool(description="Return the current date and time in ISO format.")
-def time()-> Dict[str, Any]:
+@rights2roof_server.tool(name="time", description="Return the current date and time in ISO format.")
+def time_now()-> Dict[str, Any]:
     return{"result": time_tool_fn()}
 
 @rights2roof_server.tool(description="Search Tavily for recent/local housing info and return structured output.")
@@ -44,8 +79,9 @@ def legiscan(query: str, state: str = "CA") -> Dict[str, Any]:
     return {"result": legiscan_search(query, state)}
 
 @rights2roof_server.tool(description="Retreive legal housing context from PDFs stored in Redis")
-def vector_lookup(query: str) -> Dict[str, Any]:
-    result = get_context(query)  
+async def vector_lookup(query: str) -> Dict[str, Any]:
+    async with admitted("vector"):
+        result = await aget_context(query)
     return {
         "tool": result.tool,
         "input": result.input,
@@ -55,8 +91,9 @@ def vector_lookup(query: str) -> Dict[str, Any]:
 
 @rights2roof_server.tool(description="Follow-up Q&A using conversation history")
 async def chat_tool(query: str, user_id: str) -> Dict[str, Any]:
-    # Run chat_tool_fn in a thread to avoid blocking
-    result = await asyncio.to_thread(chat_tool_fn, user_id, query)
+    # chat_tool_fn is async and already runs its blocking work in a thread
+    async with admitted("followup"):
+        result = await chat_tool_fn(user_id, query)
     return {"result": result.output}
  
 
@@ -64,14 +101,66 @@ async def chat_tool(query: str, user_id: str) -> Dict[str, Any]:
 
 # == Agent pipeline as tools ==
 @rights2roof_server.tool(description="Run full Rights2Roof pipeline and return final answer")
-def pipeline_tool(query: str, user_id: str, location: str = None) -> dict:
+async def pipeline_tool(query: str, user_id: str, ctx: Context, location: str = None, max_parallel_steps: Optional[int] = None) -> dict:
     """
     Run full pipeline and return JSON-safe response for Slack and logging.
+    `max_parallel_steps` limits how many plan steps run concurrently for this request.
+    While the final answer is synthesized, the text so far is streamed to the
+    caller as progress notifications (progress = answer length, message = text).
+    Near-identical questions from the same state are answered from the semantic cache,
+    and identical questions already in flight (any MCP process) share that run's answer.
+    The user's session is read from Redis once and handed to the pipeline.
     """
-    if location:
-        query = f"{query} (State: {location})"
-    final_answer = pipeline_query(query, user_id)
-    return {"result": final_answer}
+    # Round trips are counted per request; history, thread and cache writes go out in one flush
+    async with arequest_scope("pipeline_tool"):
+        run_pipeline = arun_pipeline_graph if PIPELINE_RUNNER == "graph" else apipeline_query
+        record_answer = arecord_graph_answer if PIPELINE_RUNNER == "graph" else arecord_query_answer
+
+        session = await aload_session(user_id)
+        state = location or session.location
+        cached_answer = await acheck_answer(query, state)
+        if cached_answer:
+            # Keep the user's history complete so follow-ups still have context
+            await record_answer(query, user_id, cached_answer)
+            return {"result": cached_answer}
+
+        pipeline_query_text = f"{query} (State: {location})" if location else query
+        loop = asyncio.get_running_loop()
+
+        def send_progress(text: str) -> None:
+            # Safe from the event loop and from worker threads
+            asyncio.run_coroutine_threadsafe(ctx.report_progress(progress=len(text), message=text), loop)
+
+        async def run() -> str:
+            # Only the leader takes a pipeline slot (OverloadedError if none frees in time);
+            # cache hits and coalesced followers just wait for an answer
+            async with admitted("pipeline"):
+                # Async pipeline: no worker thread is held while LLM/tool calls are in flight
+                sink = ThrottledSink(send_progress, STREAM_PROGRESS_INTERVAL)
+                start = perf_counter()
+                with stream_tokens_to(sink):
+                    answer = await run_pipeline(pipeline_query_text, user_id, max_parallel_steps=max_parallel_steps, session=session)
+                sink.flush()
+            # Cache write (embedding + Redis) stays off the response path
+            _in_background(astore_answer(query, state, answer, (perf_counter() - start) * 1000))
+            return answer
+
+        final_answer, shared = await acoalesced(query, state, run)
+        if shared:
+            await record_answer(query, user_id, final_answer)
+        return {"result": final_answer}
+
+
+@rights2roof_server.tool(description="Return in-process pipeline metrics (counters, timings, tool routing and cache hit rates)")
+def pipeline_metrics() -> Dict[str, Any]:
+    return {
+        **get_metrics(),
+        "router": get_router_stats(),
+        "semantic_cache": get_semantic_cache_stats(),
+        "tool_cache": get_tool_cache_stats(),
+        "redis_round_trips": get_round_trip_stats(),
+        "admission": get_admission_stats(),
+    }
 
 
 def ping() -> str:
@@ -0,0 +1,94 @@
+# admission.py
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from app.models.schemas import AdmissionResult
+from app.services import metrics
+from app.services.job_queue import JOB_CLASSES, aqueue_waiting
+
+# === Queue-depth admission (webhook) ===
+# Past the busy depth a request is still queued but the user is told where it
+# stands; past the shed depth it is refused up front instead of waiting in a
+# queue it can't get through in time.
+QUEUE_BUSY_DEPTH = {
+    "pipeline": int(os.getenv("QUEUE_BUSY_DEPTH_PIPELINE", "10")),
+    "interactive": int(os.getenv("QUEUE_BUSY_DEPTH_INTERACTIVE", "50")),
+}
+QUEUE_SHED_DEPTH = {
+    "pipeline": int(os.getenv("QUEUE_SHED_DEPTH_PIPELINE", "100")),
+    "interactive": int(os.getenv("QUEUE_SHED_DEPTH_INTERACTIVE", "500")),
+}
+
+# === Concurrency caps (per process) ===
+# Every admitted stage also takes a slot of the global cap, so no mix of
+# stages can oversubscribe the process's OpenAI / Redis capacity.
+ADMISSION_GLOBAL_CONCURRENCY = int(os.getenv("ADMISSION_GLOBAL_CONCURRENCY", "32"))
+STAGE_CONCURRENCY = {
+    "pipeline": int(os.getenv("STAGE_CONCURRENCY_PIPELINE", "8")),
+    "followup": int(os.getenv("STAGE_CONCURRENCY_FOLLOWUP", "16")),
+    "vector": int(os.getenv("STAGE_CONCURRENCY_VECTOR", "16")),
+}
+ADMISSION_WAIT_TIMEOUT = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "30"))  # seconds before a waiting call is shed
+
+_global_slots = asyncio.Semaphore(ADMISSION_GLOBAL_CONCURRENCY)
+_stage_slots = {stage: asyncio.Semaphore(limit) for stage, limit in STAGE_CONCURRENCY.items()}
+_active = {stage: 0 for stage in STAGE_CONCURRENCY}
+
+
+class OverloadedError(RuntimeError):
+    """A stage stayed at capacity for longer than the admission timeout"""
+
+
+OVERLOADED_MESSAGE = "Rights2Roof is at capacity"  # also how callers of the MCP tools recognize it
+
+
+def is_overloaded_message(text: str) -> bool:
+    return OVERLOADED_MESSAGE in text
+
+
+async def aadmit_job(kind: str) -> AdmissionResult:
+    """Decide whether a new job of this kind may join its queue"""
+    priority_class = JOB_CLASSES[kind]
+    position = await aqueue_waiting(priority_class) + 1
+    if position > QUEUE_SHED_DEPTH[priority_class]:
+        metrics.incr(f"admission.{kind}.shed")
+        return AdmissionResult(admitted=False, position=position)
+    busy = position > QUEUE_BUSY_DEPTH[priority_class]
+    if busy:
+        metrics.incr(f"admission.{kind}.busy")
+    return AdmissionResult(admitted=True, busy=busy, position=position)
+
+
+async def _acquire(semaphore: asyncio.Semaphore, stage: str, timeout: float) -> None:
+    try:
+        await asyncio.wait_for(semaphore.acquire(), max(timeout, 0.0))
+    except asyncio.TimeoutError:
+        metrics.incr(f"admission.{stage}.shed")
+        raise OverloadedError(f"{OVERLOADED_MESSAGE} ({stage}), try again shortly")
+
+
+@asynccontextmanager
+async def admitted(stage: str, timeout: float = ADMISSION_WAIT_TIMEOUT):
+    """Run the block within the stage's and the global concurrency caps (OverloadedError if no slot frees in time)"""
+    start = time.perf_counter()
+    await _acquire(_stage_slots[stage], stage, timeout)
+    try:
+        await _acquire(_global_slots, stage, timeout - (time.perf_counter() - start))
+        metrics.observe(f"admission.{stage}.wait", (time.perf_counter() - start) * 1000)
+        _active[stage] += 1
+        try:
+            yield
+        finally:
+            _active[stage] -= 1
+            _global_slots.release()
+    finally:
+        _stage_slots[stage].release()
+
+
+def get_admission_stats() -> dict:
+    """Active calls vs limits per stage and globally (this process)"""
+    return {
+        "global": {"active": sum(_active.values()), "limit": ADMISSION_GLOBAL_CONCURRENCY},
+        "stages": {stage: {"active": _active[stage], "limit": limit} for stage, limit in STAGE_CONCURRENCY.items()},
+    }
@@ -0,0 +1,199 @@
+# context_builder.py
+import asyncio
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import tiktoken
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from app.services.redis_helpers import redis_client, async_redis_client
+from app.services.request_coalescing import RELEASE_LOCK_SCRIPT
+
+# Token budget for conversation context, per prompt
+CONTEXT_BUDGETS = {
+    "planner": int(os.getenv("CONTEXT_BUDGET_PLANNER", "600")),
+    "rag": int(os.getenv("CONTEXT_BUDGET_RAG", "1200")),
+    "chat": int(os.getenv("CONTEXT_BUDGET_CHAT", "2000")),
+}
+MAX_MESSAGE_TOKENS = 300  # a single long answer can't take the whole budget
+
+# Rolling summary: once more than SUMMARY_KEEP_RECENT + SUMMARY_MIN_BATCH messages
+# are not yet summarized, the older ones are folded into the user's summary.
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+SUMMARY_MIN_BATCH = 4
+SUMMARY_MAX_TOKENS = 250
+SUMMARY_TTL = 24 * 3600  # same lifetime as the message log
+SUMMARY_LOCK_TIMEOUT = 60  # seconds
+
+# Messages that repeat what is already in the log (full pipeline dumps)
+REDUNDANT_PREFIXES = ("FULL_PIPELINE:",)
+
+summary_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, max_tokens=SUMMARY_MAX_TOKENS)
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "You maintain a running summary of a tenant's conversation with a housing-rights assistant. "
+     f"Merge the new messages into the summary in at most {SUMMARY_MAX_TOKENS} tokens. Keep the user's "
+     "location, situation, questions asked and key legal points from the answers; drop pleasantries."),
+    ("human", "Current summary:\n{summary}\n\nNew messages:\n{messages}")
+])
+summary_chain = summary_prompt | summary_llm
+
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+_summary_tasks = set()
+
+
+# === Token counting ===
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception as e:  # encoding files unavailable (offline)
+        logging.warning(f"[ContextBuilder] tiktoken unavailable, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    return len(encoding.encode(text)) if encoding else len(text) // 4 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens"""
+    encoding = _encoding()
+    if encoding is None:
+        return text if len(text) <= max_tokens * 4 else text[: max_tokens * 4] + "…"
+    tokens = encoding.encode(text)
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens]) + "…"
+
+
+# === Loading ===
+def summary_key(user_id: str) -> str:
+    return f"user:{user_id}:summary"
+
+
+def unsummarized(raw_summary: Optional[str], entries: list) -> Tuple[str, List[str]]:
+    """(summary, messages it doesn't cover yet) from a raw summary record and (message, score) entries"""
+    record = json.loads(raw_summary) if raw_summary else {}
+    covered_until = record.get("covered_until", 0)
+    return record.get("summary", ""), [message for message, score in entries if score > covered_until]
+
+
+def load_conversation(user_id: str, limit: int = 10) -> Tuple[str, List[str]]:
+    """(rolling summary, newest-first messages not yet in the summary) in one round trip"""
+    if not user_id:
+        return "", []
+    pipe = redis_client.pipeline()
+    pipe.get(summary_key(user_id))
+    pipe.zrevrange(f"user:{user_id}:messages", 0, limit - 1, withscores=True)
+    return unsummarized(*pipe.execute())
+
+
+async def aload_conversation(user_id: str, limit: int = 10) -> Tuple[str, List[str]]:
+    """Async version of load_conversation"""
+    if not user_id:
+        return "", []
+    pipe = async_redis_client.pipeline()
+    pipe.get(summary_key(user_id))
+    pipe.zrevrange(f"user:{user_id}:messages", 0, limit - 1, withscores=True)
+    return unsummarized(*await pipe.execute())
+
+
+# === Building ===
+def build_context(stage: str, summary: str, messages: List[str]) -> str:
+    """
+    Conversation context for a prompt within the stage's token budget:
+    the summary first, then as many of the newest (deduplicated) messages as fit,
+    in chronological order.
+    """
+    budget = CONTEXT_BUDGETS[stage]
+    summary = truncate_tokens(summary, budget // 3) if summary else ""
+    used = count_tokens(summary) if summary else 0
+
+    recent, seen = [], set()
+    for message in messages:  # newest first
+        if message.startswith(REDUNDANT_PREFIXES) or message in seen:
+            continue
+        seen.add(message)
+        message = truncate_tokens(message, MAX_MESSAGE_TOKENS)
+        tokens = count_tokens(message)
+        if used + tokens > budget:
+            break
+        recent.append(message)
+        used += tokens
+
+    parts = [f"Summary of earlier conversation: {summary}"] if summary else []
+    return "\n".join(parts + list(reversed(recent)))
+
+
+# === Rolling summary (off the request path) ===
+def _fold_batch(raw_summary: Optional[str], entries: list) -> Optional[Tuple[str, float, List[str]]]:
+    record = json.loads(raw_summary) if raw_summary else {}
+    pending = [(m, s) for m, s in entries if not m.startswith(REDUNDANT_PREFIXES)]
+    if len(pending) < SUMMARY_KEEP_RECENT + SUMMARY_MIN_BATCH:
+        return None
+    batch = pending[:-SUMMARY_KEEP_RECENT]
+    return record.get("summary", ""), batch[-1][1], [truncate_tokens(m, MAX_MESSAGE_TOKENS) for m, _ in batch]
+
+
+def update_summary(user_id: str) -> None:
+    """Fold older unsummarized messages into the user's rolling summary"""
+    lock_key, token = f"{summary_key(user_id)}:lock", uuid.uuid4().hex
+    if not redis_client.set(lock_key, token, nx=True, ex=SUMMARY_LOCK_TIMEOUT):
+        return  # another process is already updating it
+    try:
+        raw_summary = redis_client.get(summary_key(user_id))
+        covered_until = json.loads(raw_summary).get("covered_until", 0) if raw_summary else 0
+        entries = redis_client.zrangebyscore(f"user:{user_id}:messages", f"({covered_until}", "+inf", withscores=True)
+        folded = _fold_batch(raw_summary, entries)
+        if folded is None:
+            return
+        summary, covered_until, batch = folded
+        message = summary_chain.invoke({"summary": summary or "(none)", "messages": "\n".join(batch)})
+        record = {"summary": message.content.strip(), "covered_until": covered_until}
+        redis_client.set(summary_key(user_id), json.dumps(record), ex=SUMMARY_TTL)
+        logging.info(f"[ContextBuilder] Folded {len(batch)} messages into the summary for {user_id}")
+    except Exception as e:
+        logging.warning(f"[ContextBuilder] Summary update failed for {user_id}: {e}")
+    finally:
+        # Only our own lock: a slow summarizer's may have expired and been re-taken
+        redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+
+async def aupdate_summary(user_id: str) -> None:
+    """Async version of update_summary"""
+    lock_key, token = f"{summary_key(user_id)}:lock", uuid.uuid4().hex
+    if not await async_redis_client.set(lock_key, token, nx=True, ex=SUMMARY_LOCK_TIMEOUT):
+        return
+    try:
+        raw_summary = await async_redis_client.get(summary_key(user_id))
+        covered_until = json.loads(raw_summary).get("covered_until", 0) if raw_summary else 0
+        entries = await async_redis_client.zrangebyscore(f"user:{user_id}:messages", f"({covered_until}", "+inf", withscores=True)
+        folded = _fold_batch(raw_summary, entries)
+        if folded is None:
+            return
+        summary, covered_until, batch = folded
+        message = await summary_chain.ainvoke({"summary": summary or "(none)", "messages": "\n".join(batch)})
+        record = {"summary": message.content.strip(), "covered_until": covered_until}
+        await async_redis_client.set(summary_key(user_id), json.dumps(record), ex=SUMMARY_TTL)
+        logging.info(f"[ContextBuilder] Folded {len(batch)} messages into the summary for {user_id}")
+    except Exception as e:
+        logging.warning(f"[ContextBuilder] Summary update failed for {user_id}: {e}")
+    finally:
+        await async_redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+
+def schedule_summary_update(user_id: str) -> None:
+    """Update the summary in the background (event-loop task if one is running, else a worker thread)"""
+    if not user_id:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(aupdate_summary(user_id))
+    except RuntimeError:
+        _summary_pool.submit(update_summary, user_id)
+        return
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
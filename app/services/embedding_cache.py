@@ -0,0 +1,110 @@
+# embedding_cache.py
+import hashlib
+import logging
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+from app.services import metrics
+from app.services.redis_helpers import binary_redis_client, async_binary_redis_client
+
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+EMBEDDING_CACHE_LOCAL_MAX = int(os.getenv("EMBEDDING_CACHE_LOCAL_MAX", "2048"))  # vectors kept in-process
+
+
+def _to_bytes(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()  # float32: 12 KB for text-embedding-3-large
+
+
+def _from_bytes(raw: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(raw)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Query embeddings cached in an in-process LRU and in Redis (float32 bytes),
+    keyed by a hash of model + text. Document embeddings (ingestion) pass through.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str):
+        self.underlying = underlying
+        self.model = model
+        self._local: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> str:
+        return "embedding:" + hashlib.sha256(f"{self.model}\0{text}".encode()).hexdigest()
+
+    def _local_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._local.get(key)
+            if vector is not None:
+                self._local.move_to_end(key)
+            return vector
+
+    def _local_put(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._local[key] = vector
+            self._local.move_to_end(key)
+            while len(self._local) > EMBEDDING_CACHE_LOCAL_MAX:
+                self._local.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._local_get(key)
+        if vector is not None:
+            metrics.incr("embedding_cache.local_hit")
+            return vector
+        try:
+            raw = binary_redis_client.get(key)
+        except Exception as e:
+            logging.warning(f"[EmbeddingCache] Redis read failed: {e}")
+            raw = None
+        if raw is not None:
+            metrics.incr("embedding_cache.redis_hit")
+            vector = _from_bytes(raw)
+        else:
+            metrics.incr("embedding_cache.miss")
+            with metrics.timed("embedding_cache.upstream"):
+                vector = self.underlying.embed_query(text)
+            try:
+                binary_redis_client.set(key, _to_bytes(vector), ex=EMBEDDING_CACHE_TTL)
+            except Exception as e:
+                logging.warning(f"[EmbeddingCache] Redis write failed: {e}")
+        self._local_put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._local_get(key)
+        if vector is not None:
+            metrics.incr("embedding_cache.local_hit")
+            return vector
+        try:
+            raw = await async_binary_redis_client.get(key)
+        except Exception as e:
+            logging.warning(f"[EmbeddingCache] Redis read failed: {e}")
+            raw = None
+        if raw is not None:
+            metrics.incr("embedding_cache.redis_hit")
+            vector = _from_bytes(raw)
+        else:
+            metrics.incr("embedding_cache.miss")
+            with metrics.timed("embedding_cache.upstream"):
+                vector = await self.underlying.aembed_query(text)
+            try:
+                await async_binary_redis_client.set(key, _to_bytes(vector), ex=EMBEDDING_CACHE_TTL)
+            except Exception as e:
+                logging.warning(f"[EmbeddingCache] Redis write failed: {e}")
+        self._local_put(key, vector)
+        return vector
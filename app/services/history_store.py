@@ -0,0 +1,131 @@
+# history_store.py
+import argparse
+import json
+import logging
+import os
+from typing import List
+from redis.exceptions import WatchError
+from app.services.redis_helpers import redis_client, async_redis_client
+
+# Per-user conversation turns in a Redis Stream: O(1) append, trimmed to the
+# last HISTORY_MAXLEN turns, O(k) reads of the last k. Replaces the
+# user:{id}:history JSON blob that was rewritten in full on every turn.
+HISTORY_MAXLEN = int(os.getenv("HISTORY_MAXLEN", "50"))
+HISTORY_TTL = int(os.getenv("HISTORY_TTL", str(24 * 3600)))  # seconds since the last turn
+
+# Append atomically unless the user still has a legacy blob (it must be migrated
+# first so old turns stay ahead of new ones); returns 0 in that case.
+APPEND_TURN_SCRIPT = """
+if redis.call("EXISTS", KEYS[2]) == 1 then
+    return 0
+end
+local id = redis.call("XADD", KEYS[1], "MAXLEN", "~", ARGV[2], "*", "turn", ARGV[1])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+return id
+"""
+
+
+def history_key(user_id: str) -> str:
+    return f"user:{user_id}:turns"
+
+
+def legacy_history_key(user_id: str) -> str:
+    return f"user:{user_id}:history"
+
+
+def parse_turns(entries: list) -> List[dict]:
+    """Turns (oldest -> newest) from XREVRANGE entries, which are newest first"""
+    return [json.loads(fields["turn"]) for _, fields in reversed(entries)]
+
+
+# === Migration from the JSON blob ===
+def migrate_history_blob(user_id: str) -> int:
+    """Move a user's legacy history blob into the stream (atomic via WATCH/MULTI). Returns turns moved."""
+    blob_key = legacy_history_key(user_id)
+    with redis_client.pipeline() as pipe:
+        try:
+            pipe.watch(blob_key)
+            raw = pipe.get(blob_key)
+            if raw is None:
+                return 0
+            turns = json.loads(raw).get("history", [])[-HISTORY_MAXLEN:]
+            pipe.multi()
+            for turn in turns:
+                pipe.xadd(history_key(user_id), {"turn": json.dumps(turn)}, maxlen=HISTORY_MAXLEN, approximate=True)
+            pipe.expire(history_key(user_id), HISTORY_TTL)
+            pipe.delete(blob_key)
+            pipe.execute()
+        except WatchError:
+            return 0  # another writer migrated it first
+    logging.info(f"[HistoryStore] Migrated {len(turns)} turns for {user_id}")
+    return len(turns)
+
+
+async def amigrate_history_blob(user_id: str) -> int:
+    """Async version of migrate_history_blob"""
+    blob_key = legacy_history_key(user_id)
+    async with async_redis_client.pipeline() as pipe:
+        try:
+            await pipe.watch(blob_key)
+            raw = await pipe.get(blob_key)
+            if raw is None:
+                return 0
+            turns = json.loads(raw).get("history", [])[-HISTORY_MAXLEN:]
+            pipe.multi()
+            for turn in turns:
+                pipe.xadd(history_key(user_id), {"turn": json.dumps(turn)}, maxlen=HISTORY_MAXLEN, approximate=True)
+            pipe.expire(history_key(user_id), HISTORY_TTL)
+            pipe.delete(blob_key)
+            await pipe.execute()
+        except WatchError:
+            return 0
+    logging.info(f"[HistoryStore] Migrated {len(turns)} turns for {user_id}")
+    return len(turns)
+
+
+# === Append / read ===
+def append_turn(user_id: str, turn: dict) -> None:
+    """Append one turn (single atomic round trip; migrates a legacy blob first if needed)"""
+    keys = [history_key(user_id), legacy_history_key(user_id)]
+    args = [json.dumps(turn, default=str), HISTORY_MAXLEN, HISTORY_TTL]
+    if not redis_client.eval(APPEND_TURN_SCRIPT, 2, *keys, *args):
+        migrate_history_blob(user_id)
+        redis_client.eval(APPEND_TURN_SCRIPT, 2, *keys, *args)
+
+
+async def aappend_turn(user_id: str, turn: dict) -> None:
+    """Async version of append_turn"""
+    keys = [history_key(user_id), legacy_history_key(user_id)]
+    args = [json.dumps(turn, default=str), HISTORY_MAXLEN, HISTORY_TTL]
+    if not await async_redis_client.eval(APPEND_TURN_SCRIPT, 2, *keys, *args):
+        await amigrate_history_blob(user_id)
+        await async_redis_client.eval(APPEND_TURN_SCRIPT, 2, *keys, *args)
+
+
+def last_turns(user_id: str, k: int = 5) -> List[dict]:
+    """The user's last k turns, oldest first"""
+    entries = redis_client.xrevrange(history_key(user_id), count=k)
+    if not entries and migrate_history_blob(user_id):
+        entries = redis_client.xrevrange(history_key(user_id), count=k)
+    return parse_turns(entries)
+
+
+async def alast_turns(user_id: str, k: int = 5) -> List[dict]:
+    """Async version of last_turns"""
+    entries = await async_redis_client.xrevrange(history_key(user_id), count=k)
+    if not entries and await amigrate_history_blob(user_id):
+        entries = await async_redis_client.xrevrange(history_key(user_id), count=k)
+    return parse_turns(entries)
+
+
+# Usage: uv run -m app.services.history_store --migrate
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate user:{id}:history blobs to history streams")
+    parser.add_argument("--migrate", action="store_true")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrated = 0
+        for blob_key in redis_client.scan_iter(match="user:*:history", count=500):
+            migrated += migrate_history_blob(blob_key[len("user:"):-len(":history")])
+        print(f"✅ Migrated {migrated} turns")
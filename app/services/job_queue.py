@@ -0,0 +1,227 @@
+# job_queue.py
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from app.services import metrics
+from app.services.redis_helpers import async_redis_client
+
+# Durable queue for Slack work in Redis Streams read by a consumer group: the
+# webhook only enqueues, workers (app/workers/slack_worker.py) process. An entry
+# stays pending until a worker acks it, so jobs survive restarts and deploys;
+# entries a dead worker left pending are reclaimed by the others after
+# JOB_CLAIM_IDLE_MS. Workers heartbeat the entries they hold, so only a worker
+# that stopped loses its jobs, however long they run.
+#
+# Each priority class has its own stream so cheap interactive jobs (thread
+# follow-ups, location replies) never wait behind full pipelines.
+PRIORITY_CLASSES = ("interactive", "pipeline")  # highest priority first
+JOB_CLASSES = {
+    "followup": "interactive",
+    "location": "interactive",
+    "pipeline": "pipeline",
+}
+JOB_GROUP = "slack_workers"
+DEAD_LETTER_STREAM = "slack:jobs:dead"
+JOB_QUEUE_MAXLEN = int(os.getenv("JOB_QUEUE_MAXLEN", "10000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "2"))  # seconds, doubled per attempt
+JOB_CLAIM_IDLE_MS = int(os.getenv("JOB_CLAIM_IDLE_MS", str(5 * 60 * 1000)))  # held jobs are heartbeated well within this
+
+Job = Tuple[str, dict]  # (stream entry id, fields)
+
+
+def job_stream(priority_class: str) -> str:
+    return f"slack:jobs:{priority_class}"
+
+
+def job_class(fields: dict) -> str:
+    return JOB_CLASSES[fields["kind"]]
+
+
+def job_payload(fields: dict) -> dict:
+    return json.loads(fields["payload"])
+
+
+async def aenqueue_job(kind: str, payload: dict, attempts: int = 0) -> str:
+    """Add a job to its priority class's queue; returns its stream entry id"""
+    fields = {
+        "job_id": uuid.uuid4().hex,  # kept across retries (the stream entry id is not)
+        "kind": kind,
+        "user_id": payload.get("user_id", ""),
+        "payload": json.dumps(payload),
+        "enqueued_at": f"{time.time():.3f}",
+        "attempts": str(attempts),
+    }
+    entry_id = await async_redis_client.xadd(job_stream(JOB_CLASSES[kind]), fields, maxlen=JOB_QUEUE_MAXLEN, approximate=True)
+    metrics.incr(f"jobs.{kind}.enqueued")
+    return entry_id
+
+
+async def aensure_groups() -> None:
+    """Create the consumer group (and the stream) of every class if they don't exist yet"""
+    for priority_class in PRIORITY_CLASSES:
+        try:
+            await async_redis_client.xgroup_create(job_stream(priority_class), JOB_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+async def aread_jobs(consumer: str, counts: Dict[str, int], block_ms: Optional[int] = None) -> List[Job]:
+    """
+    New jobs for this consumer, up to counts[class] per priority class
+    (blocks up to block_ms when every requested queue is empty).
+    """
+    counts = {c: count for c, count in counts.items() if count > 0}
+    if not counts:
+        return []
+    # XREADGROUP's COUNT applies per stream, so each class is read with its own count (one round trip)
+    pipe = async_redis_client.pipeline(transaction=False)
+    for priority_class, count in counts.items():
+        pipe.xreadgroup(JOB_GROUP, consumer, {job_stream(priority_class): ">"}, count=count)
+    jobs = [entry for response in await pipe.execute() for _, entries in response or [] for entry in entries]
+    if jobs or not block_ms:
+        return jobs
+    # Nothing queued: wait for the first job on any of the streams
+    streams = {job_stream(priority_class): ">" for priority_class in counts}
+    response = await async_redis_client.xreadgroup(JOB_GROUP, consumer, streams, count=1, block=block_ms)
+    return [entry for _, entries in response or [] for entry in entries]
+
+
+async def aclaim_stale_jobs(consumer: str, priority_class: str, count: int) -> List[Job]:
+    """
+    Take over jobs of a class left pending by a worker that stopped or died mid-job.
+    Every delivery that never finished counts as a failed attempt, so a job that
+    keeps killing its worker is dead-lettered instead of reclaimed forever.
+    """
+    stream = job_stream(priority_class)
+    _, entries, *_ = await async_redis_client.xautoclaim(
+        stream, JOB_GROUP, consumer, min_idle_time=JOB_CLAIM_IDLE_MS, start_id="0-0", count=count
+    )
+    entries = [(entry_id, fields) for entry_id, fields in entries if fields]  # trimmed entries come back empty
+    if not entries:
+        return []
+    metrics.incr("jobs.reclaimed", len(entries))
+
+    pipe = async_redis_client.pipeline(transaction=False)
+    for entry_id, _ in entries:
+        pipe.xpending_range(stream, JOB_GROUP, min=entry_id, max=entry_id, count=1)
+    claimed = []
+    for (entry_id, fields), pending in zip(entries, await pipe.execute()):
+        deliveries = pending[0]["times_delivered"] if pending else 1
+        attempts = int(fields.get("attempts", 0)) + deliveries - 1
+        fields = {**fields, "attempts": str(attempts)}
+        if attempts >= JOB_MAX_ATTEMPTS:
+            await _adead_letter(entry_id, fields, f"worker lost the job {deliveries - 1} times")
+        else:
+            claimed.append((entry_id, fields))
+    return claimed
+
+
+async def aheartbeat_jobs(consumer: str, entries: Dict[str, List[str]]) -> None:
+    """
+    Reset the idle time of jobs this consumer still holds (entry ids per class),
+    so a long-running job isn't reclaimed and run twice. JUSTID leaves the
+    delivery count alone.
+    """
+    entries = {c: ids for c, ids in entries.items() if ids}
+    if not entries:
+        return
+    pipe = async_redis_client.pipeline(transaction=False)
+    for priority_class, entry_ids in entries.items():
+        pipe.xclaim(job_stream(priority_class), JOB_GROUP, consumer, min_idle_time=0, message_ids=entry_ids, justid=True)
+    await pipe.execute()
+
+
+async def aack_job(entry_id: str, fields: dict) -> None:
+    stream = job_stream(job_class(fields))
+    pipe = async_redis_client.pipeline(transaction=True)
+    pipe.xack(stream, JOB_GROUP, entry_id)
+    pipe.xdel(stream, entry_id)
+    await pipe.execute()
+
+
+async def aretry_job(entry_id: str, fields: dict, error: str) -> None:
+    """
+    Re-enqueue a failed job after a backoff, or move it to the dead-letter stream
+    after JOB_MAX_ATTEMPTS. The original stays pending until then, so a crash
+    during the backoff doesn't lose it.
+    """
+    kind, attempts = fields["kind"], int(fields.get("attempts", 0)) + 1
+    if attempts >= JOB_MAX_ATTEMPTS:
+        await _adead_letter(entry_id, {**fields, "attempts": str(attempts)}, error)
+        return
+    await asyncio.sleep(JOB_RETRY_BACKOFF * 2 ** (attempts - 1))
+    metrics.incr(f"jobs.{kind}.retried")
+    stream = job_stream(job_class(fields))
+    pipe = async_redis_client.pipeline(transaction=True)
+    pipe.xadd(stream, {**fields, "attempts": str(attempts)}, maxlen=JOB_QUEUE_MAXLEN, approximate=True)
+    pipe.xack(stream, JOB_GROUP, entry_id)
+    pipe.xdel(stream, entry_id)
+    await pipe.execute()
+
+
+async def _adead_letter(entry_id: str, fields: dict, error: str) -> None:
+    kind, stream = fields["kind"], job_stream(job_class(fields))
+    logging.error(f"[JobQueue] {kind} job {entry_id} dead-lettered after {fields.get('attempts')} attempts: {error}")
+    metrics.incr(f"jobs.{kind}.dead_lettered")
+    pipe = async_redis_client.pipeline(transaction=True)
+    pipe.xadd(DEAD_LETTER_STREAM, {**fields, "error": error[:1000]}, maxlen=JOB_QUEUE_MAXLEN, approximate=True)
+    pipe.xack(stream, JOB_GROUP, entry_id)
+    pipe.xdel(stream, entry_id)
+    await pipe.execute()
+
+
+async def aqueue_waiting(priority_class: str) -> int:
+    """Jobs of a class not yet picked up by a worker (one round trip)"""
+    stream = job_stream(priority_class)
+    pipe = async_redis_client.pipeline(transaction=False)
+    pipe.xlen(stream)
+    pipe.xpending(stream, JOB_GROUP)
+    try:
+        length, pending = await pipe.execute()
+    except Exception:  # group not created yet: no worker has started
+        return await async_redis_client.xlen(stream)
+    return max(0, length - (pending["pending"] if pending else 0))
+
+
+async def aqueue_stats() -> Dict[str, dict]:
+    """
+    Per priority class: jobs waiting for a worker, jobs being processed and
+    how long the oldest waiting job has been queued (seconds).
+    """
+    stats = {}
+    for priority_class in PRIORITY_CLASSES:
+        stream = job_stream(priority_class)
+        pipe = async_redis_client.pipeline(transaction=False)
+        pipe.xlen(stream)
+        pipe.xpending(stream, JOB_GROUP)
+        pipe.xinfo_groups(stream)
+        try:
+            length, pending, groups = await pipe.execute()
+        except Exception:  # stream/group not created yet
+            stats[priority_class] = {"waiting": 0, "in_progress": 0, "oldest_wait_s": 0.0}
+            continue
+        in_progress = pending["pending"] if pending else 0
+        group = next((g for g in groups if g["name"] == JOB_GROUP), {})
+        oldest_wait = 0.0
+        last_delivered = group.get("last-delivered-id")
+        if last_delivered:
+            head = await async_redis_client.xrange(stream, min=f"({last_delivered}", count=1)
+            if head:
+                oldest_wait = max(0.0, time.time() - int(head[0][0].split("-")[0]) / 1000)
+        stats[priority_class] = {
+            "waiting": max(0, length - in_progress),
+            "in_progress": in_progress,
+            "oldest_wait_s": round(oldest_wait, 1),
+        }
+    return stats
+
+
+async def adead_letters(count: int = 20) -> List[Job]:
+    """Most recent dead-lettered jobs, newest first"""
+    return await async_redis_client.xrevrange(DEAD_LETTER_STREAM, count=count)
@@ -0,0 +1,68 @@
+# job_scheduler.py
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from app.services.job_queue import PRIORITY_CLASSES, Job, job_class
+
+# In-process scheduling for a queue worker (app/workers/slack_worker.py): which
+# of the jobs it has read starts next, and whether a slot is free for it. Kept
+# apart from the worker so it has no Slack/LLM imports.
+
+
+class FairScheduler:
+    """
+    Jobs this worker has read but not started, by priority class. The highest
+    class with a runnable job goes first; within a class users take turns
+    (round-robin), so one user's burst can't hold every slot.
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, "OrderedDict[str, Deque[Job]]"] = {c: OrderedDict() for c in PRIORITY_CLASSES}
+
+    def push(self, job: Job) -> None:
+        users = self._queues[job_class(job[1])]
+        users.setdefault(job[1].get("user_id", ""), deque()).append(job)
+
+    def pop(self, runnable: Callable[[str], bool]) -> Optional[Tuple[str, Job]]:
+        for priority_class in PRIORITY_CLASSES:
+            users = self._queues[priority_class]
+            if not users or not runnable(priority_class):
+                continue
+            user_id, jobs = next(iter(users.items()))
+            job = jobs.popleft()
+            if jobs:
+                users.move_to_end(user_id)  # next user's turn
+            else:
+                del users[user_id]
+            return priority_class, job
+        return None
+
+    def size(self, priority_class: str) -> int:
+        return sum(len(jobs) for jobs in self._queues[priority_class].values())
+
+    def entry_ids(self, priority_class: str) -> List[str]:
+        return [entry_id for jobs in self._queues[priority_class].values() for entry_id, _ in jobs]
+
+
+class JobSlots:
+    """
+    Jobs running per priority class against the worker's concurrency.
+    Pipelines may fill all but `reserved_interactive` slots, so follow-ups
+    don't queue behind them; interactive jobs can use every slot.
+    """
+
+    def __init__(self, concurrency: int, reserved_interactive: int):
+        self.concurrency = concurrency
+        self.limits = {"interactive": concurrency, "pipeline": max(1, concurrency - reserved_interactive)}
+        self.running = {c: 0 for c in PRIORITY_CLASSES}
+
+    def runnable(self, priority_class: str) -> bool:
+        return sum(self.running.values()) < self.concurrency and self.running[priority_class] < self.limits[priority_class]
+
+    def start(self, priority_class: str) -> None:
+        self.running[priority_class] += 1
+
+    def finish(self, priority_class: str) -> None:
+        self.running[priority_class] -= 1
+
+    def busy(self) -> bool:
+        return any(self.running.values())
@@ -0,0 +1,262 @@
+# mcp_pool.py
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+import anyio
+import httpx
+from fastmcp import Client
+from fastmcp.exceptions import ToolError
+from mcp.shared.exceptions import McpError
+from app.services import metrics
+
+# Long-lived MCP client sessions for the Slack service: connected once per
+# process (FastAPI lifespan), pinged in the background, reconnected with
+# backoff when they drop, and guarded by a circuit breaker so requests fail
+# fast while the MCP server is down instead of each retrying on its own.
+# MCP_SERVER_URL = "http://127.0.0.1:5200/mcp" # local dev
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://mcp-sever.railway.internal:5300/mcp")
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "15"))  # seconds between pings
+MCP_BREAKER_FAILURES = int(os.getenv("MCP_BREAKER_FAILURES", "5"))  # consecutive failures that open the breaker
+MCP_BREAKER_RESET = float(os.getenv("MCP_BREAKER_RESET", "30"))  # seconds open before a trial call
+MCP_RECONNECT_MAX_BACKOFF = 30.0
+
+
+class MCPUnavailableError(RuntimeError):
+    """No healthy MCP session, or the circuit breaker is open"""
+
+
+def _is_transport_error(e: BaseException) -> bool:
+    """
+    The session's connection is gone (reconnect it). Protocol errors and
+    timeouts are answers or slowness of the server: the session is still usable.
+    """
+    if isinstance(e, httpx.TimeoutException):
+        return False
+    return isinstance(e, (httpx.TransportError, ConnectionError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream))
+
+
+def _is_timeout(e: BaseException) -> bool:
+    return isinstance(e, (TimeoutError, httpx.TimeoutException)) or (
+        isinstance(e, McpError) and e.error.code == httpx.codes.REQUEST_TIMEOUT
+    )
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures -> half-open (one trial call) after `reset_timeout`"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_cancelled(self) -> None:
+        self._trial_in_flight = False  # a cancelled call says nothing about the server
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial_in_flight:
+                logging.warning(f"[MCPPool] Circuit breaker open after {self.failures} failures")
+                metrics.incr("mcp_pool.breaker_open")
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+class MCPClientPool:
+    def __init__(self, url: str = MCP_SERVER_URL, size: int = MCP_POOL_SIZE):
+        self.url = url
+        self.size = size
+        self.breaker = CircuitBreaker(MCP_BREAKER_FAILURES, MCP_BREAKER_RESET)
+        self._clients: List[Optional[Client]] = [None] * size
+        # Calls share a slot's session, so a replaced session is closed only once its calls finish
+        self._in_use: Dict[int, int] = {}  # id(client) -> calls in flight
+        self._retiring: Dict[int, Client] = {}
+        self._reconnecting: Dict[int, asyncio.Task] = {}
+        self._closing: set = set()
+        self._next = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+        self._started = False
+        self._start_lock = asyncio.Lock()
+
+    # === Lifecycle ===
+    async def start(self) -> None:
+        """Connect every slot (failed slots keep retrying in the background) and start health checks"""
+        async with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            await asyncio.gather(*(self._connect(slot) for slot in range(self.size)))
+            for slot in range(self.size):
+                if self._clients[slot] is None:
+                    self._schedule_reconnect(slot)
+            self._health_task = asyncio.create_task(self._health_loop())
+            logging.info(f"[MCPPool] {self.healthy_count()}/{self.size} sessions connected to {self.url}")
+
+    async def close(self) -> None:
+        self._started = False
+        tasks = [*self._reconnecting.values(), *([self._health_task] if self._health_task else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._reconnecting.clear()
+        retiring, self._retiring = list(self._retiring.values()), {}
+        await asyncio.gather(
+            *(self._disconnect(slot) for slot in range(self.size)),
+            *(self._close_client(client) for client in retiring),
+            *self._closing
+        )
+
+    def healthy_count(self) -> int:
+        return sum(client is not None for client in self._clients)
+
+    # === Connections ===
+    async def _connect(self, slot: int) -> bool:
+        client = Client(self.url)
+        try:
+            await client.__aenter__()
+            await client.ping()
+        except Exception as e:
+            logging.warning(f"[MCPPool] Session {slot} failed to connect: {e}")
+            await self._close_client(client)
+            return False
+        self._clients[slot] = client
+        return True
+
+    async def _close_client(self, client: Client) -> None:
+        try:
+            await client.__aexit__(None, None, None)
+        except Exception as e:
+            logging.debug(f"[MCPPool] Error closing session: {e}")
+
+    async def _disconnect(self, slot: int) -> None:
+        client, self._clients[slot] = self._clients[slot], None
+        if client is not None:
+            await self._close_client(client)
+
+    def _close_when_idle(self, client: Client) -> None:
+        if self._in_use.get(id(client)):
+            self._retiring[id(client)] = client  # closed by _release
+            return
+        task = asyncio.create_task(self._close_client(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _acquire(self, client: Client) -> None:
+        self._in_use[id(client)] = self._in_use.get(id(client), 0) + 1
+
+    def _release(self, client: Client) -> None:
+        remaining = self._in_use.pop(id(client)) - 1
+        if remaining:
+            self._in_use[id(client)] = remaining
+        elif id(client) in self._retiring:
+            self._close_when_idle(self._retiring.pop(id(client)))
+
+    async def _reconnect_loop(self, slot: int) -> None:
+        backoff = 1.0
+        try:
+            while self._started:
+                metrics.incr("mcp_pool.reconnect_attempt")
+                if await self._connect(slot):
+                    logging.info(f"[MCPPool] Session {slot} reconnected")
+                    return
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MCP_RECONNECT_MAX_BACKOFF)
+        finally:
+            self._reconnecting.pop(slot, None)
+
+    def _schedule_reconnect(self, slot: int) -> None:
+        if self._started and slot not in self._reconnecting:
+            self._reconnecting[slot] = asyncio.create_task(self._reconnect_loop(slot))
+
+    def _mark_down(self, slot: int, client: Client) -> None:
+        """Take a broken session out of rotation and reconnect the slot; calls still on it finish first"""
+        if self._clients[slot] is not client:
+            return  # already replaced
+        self._clients[slot] = None
+        self._close_when_idle(client)
+        self._schedule_reconnect(slot)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(MCP_HEALTH_CHECK_INTERVAL)
+            for slot, client in enumerate(self._clients):
+                if client is None:
+                    continue
+                try:
+                    await client.ping()
+                except Exception as e:
+                    logging.warning(f"[MCPPool] Session {slot} failed health check: {e}")
+                    self._mark_down(slot, client)
+
+    def _pick(self) -> Optional[int]:
+        start = next(self._next)
+        for i in range(self.size):
+            slot = (start + i) % self.size
+            if self._clients[slot] is not None:
+                return slot
+        return None
+
+    # === Calls ===
+    async def call_tool(self, name: str, arguments: Dict[str, Any], **kwargs) -> Any:
+        """Call an MCP tool on a pooled session; raises MCPUnavailableError without trying when the breaker is open"""
+        await self.start()
+        if not self.breaker.allow():
+            metrics.incr("mcp_pool.rejected")
+            raise MCPUnavailableError("MCP server unavailable (circuit open), try again shortly")
+        slot = self._pick()
+        if slot is None:
+            self.breaker.record_failure()
+            metrics.incr("mcp_pool.rejected")
+            raise MCPUnavailableError("No MCP session available, reconnecting")
+
+        client = self._clients[slot]
+        metrics.incr("mcp_pool.calls")
+        self._acquire(client)
+        try:
+            result = await client.call_tool(name, arguments, **kwargs)
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+        except Exception as e:
+            if isinstance(e, ToolError) or (isinstance(e, McpError) and not _is_timeout(e)):
+                self.breaker.record_success()  # the server answered; the session is fine
+                raise
+            self.breaker.record_failure()
+            metrics.incr("mcp_pool.failures")
+            logging.warning(f"[MCPPool] {name} failed on session {slot}: {e}")
+            if _is_transport_error(e):
+                self._mark_down(slot, client)
+            raise
+        finally:
+            self._release(client)
+        self.breaker.record_success()
+        return result
+
+
+mcp_pool = MCPClientPool()
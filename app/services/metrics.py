@@ -0,0 +1,55 @@
+# metrics.py
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# In-process counters and timings (per MCP / webhook process)
+_lock = threading.Lock()
+_counters: Dict[str, int] = defaultdict(int)
+_timings: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Increment a named counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name: str, value_ms: float) -> None:
+    """Record a duration (in milliseconds) for a named timing"""
+    with _lock:
+        timing = _timings[name]
+        timing["count"] += 1
+        timing["total_ms"] += value_ms
+        timing["max_ms"] = max(timing["max_ms"], value_ms)
+
+
+@contextmanager
+def timed(name: str):
+    """Context manager that records how long the block took"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def hit_rate(hits: str, misses: str) -> float:
+    """Return hits / (hits + misses) for two counters, 0.0 when nothing was recorded"""
+    with _lock:
+        total = _counters[hits] + _counters[misses]
+        return _counters[hits] / total if total else 0.0
+
+
+def get_metrics() -> Dict[str, Any]:
+    """Snapshot of all counters and timings (JSON-safe)"""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "timings": {
+                name: {**timing, "avg_ms": timing["total_ms"] / timing["count"] if timing["count"] else 0.0}
+                for name, timing in _timings.items()
+            },
+        }
@@ -0,0 +1,26 @@
+# prefetch.py
+import asyncio
+import logging
+from concurrent.futures import Future
+from typing import Any
+
+# Work the pipelines start early (e.g. the vector store lookup while the planner
+# runs). A failed prefetch isn't fatal: the node that needs it fetches it itself.
+
+
+def prefetched(future: Future, label: str) -> Any:
+    """Result of a prefetch, or None (so the node fetches it itself) if it failed."""
+    try:
+        return future.result()
+    except Exception as e:
+        logging.warning(f"[Pipeline] Prefetch of {label} failed: {e}")
+        return None
+
+
+async def aprefetched(task: asyncio.Future, label: str) -> Any:
+    """Async version of prefetched"""
+    try:
+        return await task
+    except Exception as e:
+        logging.warning(f"[Pipeline] Prefetch of {label} failed: {e}")
+        return None
@@ -1,12 +1,123 @@
+import logging
+import threading
 import time
+import uuid
 import redis
+import redis.asyncio as aioredis
 import os
 from dotenv import load_dotenv
 load_dotenv()
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from typing import List , Any, Optional
+from app.models.schemas import RateLimitResult
+from app.services import metrics
 
 REDIS_URL = os.getenv("REDIS_URL") or f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}"
-redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+_USE_SSL = REDIS_URL.startswith("rediss://")
+
+
+# === Round-trip accounting ===
+class _RoundTrips:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def incr(self) -> None:
+        with self._lock:
+            self.count += 1
+
+
+_request_round_trips: ContextVar[Optional[_RoundTrips]] = ContextVar("redis_round_trips", default=None)
+
+
+def _count_round_trip() -> None:
+    metrics.incr("redis.round_trips")
+    counter = _request_round_trips.get()
+    if counter is not None:
+        counter.incr()
+
+
+@contextmanager
+def count_round_trips(name: str):
+    """Count the block's Redis round trips (tasks and to_thread calls it starts included) under `name`"""
+    if _request_round_trips.get() is not None:
+        yield  # already counted by an outer request
+        return
+    counter = _RoundTrips()
+    token = _request_round_trips.set(counter)
+    try:
+        yield
+    finally:
+        _request_round_trips.reset(token)
+        metrics.incr(f"redis.requests.{name}")
+        metrics.incr(f"redis.request_round_trips.{name}", counter.count)
+        logging.debug(f"[Redis] {name}: {counter.count} round trips")
+
+
+def get_round_trip_stats() -> dict:
+    """Requests and average Redis round trips per request, by request name"""
+    counters = metrics.get_metrics()["counters"]
+    stats = {}
+    for key, requests in counters.items():
+        if key.startswith("redis.requests.") and requests:
+            name = key[len("redis.requests."):]
+            round_trips = counters.get(f"redis.request_round_trips.{name}", 0)
+            stats[name] = {"requests": requests, "round_trips": round_trips, "avg_per_request": round_trips / requests}
+    return stats
+
+
+# Connections count every network round trip (a pipeline flush is one) in metrics
+class _CountingConnection(redis.SSLConnection if _USE_SSL else redis.Connection):
+    def send_packed_command(self, command, check_health=True):
+        _count_round_trip()
+        return super().send_packed_command(command, check_health)
+
+
+class _AsyncCountingConnection(aioredis.SSLConnection if _USE_SSL else aioredis.Connection):
+    async def send_packed_command(self, command, check_health=True):
+        _count_round_trip()
+        return await super().send_packed_command(command, check_health)
+
+
+redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True, connection_class=_CountingConnection)
+
+# asyncio pool shared by the webhook handlers, async pipeline and MCP tools.
+# Blocking pool: under bursts callers wait up to REDIS_POOL_TIMEOUT for a free
+# connection instead of failing with "Too many connections".
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))  # seconds idle before a PING on checkout
+
+
+def _async_pool(**kwargs) -> aioredis.BlockingConnectionPool:
+    return aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True,
+        connection_class=_AsyncCountingConnection,
+        **kwargs
+    )
+
+
+# asyncio client (same keys as redis_client)
+async_redis_client = aioredis.Redis(connection_pool=_async_pool(decode_responses=True))
+# raw-bytes clients (embedding vectors)
+binary_redis_client = redis.Redis.from_url(REDIS_URL, connection_class=_CountingConnection)
+async_binary_redis_client = aioredis.Redis(connection_pool=_async_pool())
+
+
+async def aclose_redis() -> None:
+    """Close the asyncio pools (app shutdown)"""
+    await async_redis_client.aclose(close_connection_pool=True)
+    await async_binary_redis_client.aclose(close_connection_pool=True)
 # connect to Redis
 # redis_client = redis.Redis(
 #     host=os.getenv("REDIS_HOST"),
@@ -15,40 +126,237 @@ redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
 #     decode_responses=True
 # )
 
-# Rate limit config
-MAX_REQUESTS_PER_HOUR = 10
-RATE_LIMIT_WINDOW = 3600  # seconds in 1 hour
+# === Batched writes (unit of work) ===
+# Inside batched_writes()/abatched_writes() the write helpers below queue their
+# commands instead of sending them; the whole request's history, thread and
+# cache writes are flushed together in one MULTI/EXEC when the block exits.
+# Outside a batch each helper still sends its commands in a single round trip.
+class _WriteBatch:
+    def __init__(self):
+        self.ops: list = []
+        self.open = True
+        self._lock = threading.Lock()
+
+    def add(self, ops: tuple) -> bool:
+        # False once flushed: tasks/threads that outlive the block write directly
+        with self._lock:
+            if self.open:
+                self.ops.extend(ops)
+            return self.open
+
+    def close(self) -> list:
+        with self._lock:
+            self.open = False
+            return self.ops
+
+
+_pending_writes: ContextVar[Optional[_WriteBatch]] = ContextVar("pending_redis_writes", default=None)
+
+
+def _apply(pipe, ops: list) -> None:
+    for method, args, kwargs in ops:
+        getattr(pipe, method)(*args, **kwargs)
+
+
+def _write(*ops: tuple) -> None:
+    batch = _pending_writes.get()
+    if batch is not None and batch.add(ops):
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    _apply(pipe, ops)
+    pipe.execute()
+
+
+async def _awrite(*ops: tuple) -> None:
+    batch = _pending_writes.get()
+    if batch is not None and batch.add(ops):
+        return
+    pipe = async_redis_client.pipeline(transaction=False)
+    _apply(pipe, ops)
+    await pipe.execute()
+
+
+@contextmanager
+def batched_writes():
+    """Queue the block's helper writes and flush them in one transaction (joins an open batch)"""
+    if _pending_writes.get() is not None:
+        yield
+        return
+    batch = _WriteBatch()
+    token = _pending_writes.set(batch)
+    try:
+        yield
+    finally:
+        _pending_writes.reset(token)
+        ops = batch.close()
+        if ops:
+            pipe = redis_client.pipeline(transaction=True)
+            _apply(pipe, ops)
+            pipe.execute()
+
+
+@asynccontextmanager
+async def abatched_writes():
+    """Async version of batched_writes (sync helpers called from worker threads join the batch too)"""
+    if _pending_writes.get() is not None:
+        yield
+        return
+    batch = _WriteBatch()
+    token = _pending_writes.set(batch)
+    try:
+        yield
+    finally:
+        _pending_writes.reset(token)
+        ops = batch.close()
+        if ops:
+            pipe = async_redis_client.pipeline(transaction=True)
+            _apply(pipe, ops)
+            await pipe.execute()
+
+
+@asynccontextmanager
+async def arequest_scope(name: str):
+    """One request's Redis unit of work: round trips counted under `name`, writes flushed once"""
+    with count_round_trips(name):
+        async with abatched_writes():
+            yield
+
 
 # === Rate Limits ===
-# Helper Function to check user rate limits(10 requests per hour)
-def check_rate_limit(user_id:str)->bool:
+# Budgets per request kind and tier: (max requests, window in seconds).
+# Full pipelines are expensive; follow-ups are one LLM call.
+RATE_LIMIT_WINDOW = 3600  # seconds in 1 hour
+MAX_REQUESTS_PER_HOUR = int(os.getenv("RATE_LIMIT_PIPELINE_PER_HOUR", "10"))
+RATE_LIMITS = {
+    "pipeline": {
+        "user": (MAX_REQUESTS_PER_HOUR, RATE_LIMIT_WINDOW),
+        "workspace": (int(os.getenv("RATE_LIMIT_PIPELINE_WORKSPACE_PER_HOUR", "200")), RATE_LIMIT_WINDOW),
+        "global": (int(os.getenv("RATE_LIMIT_PIPELINE_GLOBAL_PER_HOUR", "1000")), RATE_LIMIT_WINDOW),
+    },
+    "followup": {
+        "user": (int(os.getenv("RATE_LIMIT_FOLLOWUP_PER_HOUR", "60")), RATE_LIMIT_WINDOW),
+        "workspace": (int(os.getenv("RATE_LIMIT_FOLLOWUP_WORKSPACE_PER_HOUR", "1000")), RATE_LIMIT_WINDOW),
+        "global": (int(os.getenv("RATE_LIMIT_FOLLOWUP_GLOBAL_PER_HOUR", "5000")), RATE_LIMIT_WINDOW),
+    },
+}
+# "sliding_window" (exact count over the window) or "token_bucket" (steady refill, allows bursts up to the limit)
+RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_MODE", "sliding_window")
+
+# Both scripts check every tier and only record the request if all tiers allow it,
+# in one atomic round trip. ARGV: now, member, then (limit, window) per key.
+# Returns {allowed, remaining, reset_in, limit, tier index} for the tightest tier.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed, remaining, reset_in, limit, tier = 1, math.huge, 0, 0, 1
+for i, key in ipairs(KEYS) do
+    local max, window = tonumber(ARGV[2 * i + 1]), tonumber(ARGV[2 * i + 2])
+    redis.call("ZREMRANGEBYSCORE", key, 0, now - window)
+    local count = redis.call("ZCARD", key)
+    local left = max - count
+    local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")[2]
+    local reset = oldest and (tonumber(oldest) + window - now) or window
+    if left <= 0 then
+        if allowed == 1 or reset > reset_in then
+            allowed, remaining, reset_in, limit, tier = 0, 0, reset, max, i
+        end
+    elseif allowed == 1 and left - 1 < remaining then
+        remaining, reset_in, limit, tier = left - 1, reset, max, i
+    end
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call("ZADD", key, now, ARGV[2])
+        redis.call("EXPIRE", key, tonumber(ARGV[2 * i + 2]))
+    end
+end
+return {allowed, remaining, tostring(reset_in), limit, tier}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed, remaining, reset_in, limit, tier = 1, math.huge, 0, 0, 1
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local max, window = tonumber(ARGV[2 * i + 1]), tonumber(ARGV[2 * i + 2])
+    local rate = max / window
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local tokens = tonumber(bucket[1]) or max
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(max, tokens + (now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        local reset = (1 - tokens) / rate
+        if allowed == 1 or reset > reset_in then
+            allowed, remaining, reset_in, limit, tier = 0, 0, reset, max, i
+        end
+    elseif allowed == 1 and math.floor(tokens - 1) < remaining then
+        remaining, reset_in, limit, tier = math.floor(tokens - 1), (max - tokens + 1) / rate, max, i
+    end
+end
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i]
+    if allowed == 1 then tokens = tokens - 1 end
+    redis.call("HSET", key, "tokens", tostring(tokens), "ts", tostring(now))
+    redis.call("EXPIRE", key, tonumber(ARGV[2 * i + 2]))
+end
+return {allowed, remaining, tostring(reset_in), limit, tier}
+"""
+
+_rate_limit_scripts = {
+    "sliding_window": (redis_client.register_script(SLIDING_WINDOW_SCRIPT), async_redis_client.register_script(SLIDING_WINDOW_SCRIPT)),
+    "token_bucket": (redis_client.register_script(TOKEN_BUCKET_SCRIPT), async_redis_client.register_script(TOKEN_BUCKET_SCRIPT)),
+}
+
+
+def _rate_limit_call(user_id: str, kind: str, workspace_id: Optional[str]) -> tuple:
+    """Keys, args and tier names for one rate limit check"""
+    budgets = RATE_LIMITS[kind]
+    owners = {"user": user_id, "workspace": workspace_id, "global": "all"}
+    tiers = [tier for tier in ("user", "workspace", "global") if owners[tier]]
+    now = time.time()
+    keys = [f"ratelimit:{RATE_LIMIT_MODE}:{kind}:{tier}:{owners[tier]}" for tier in tiers]
+    args = [now, f"{now}:{uuid.uuid4().hex[:8]}"]
+    for tier in tiers:
+        args.extend(budgets[tier])
+    return keys, args, tiers
+
+
+def _rate_limit_result(raw: list, tiers: list) -> RateLimitResult:
+    allowed, remaining, reset_in, limit, tier = raw
+    return RateLimitResult(
+        allowed=bool(allowed), remaining=int(remaining), reset_in=float(reset_in),
+        limit=int(limit), tier=tiers[int(tier) - 1]
+    )
+
+
+def rate_limit(user_id: str, kind: str = "pipeline", workspace_id: Optional[str] = None) -> RateLimitResult:
     """
-    Returns True if user is under rate limit, False if exceeded.
-    Uses Redis sorted sets to track request timestamps.
+    Check and record one request against the user, workspace and global budgets
+    for `kind` ("pipeline" or "followup") in a single atomic Redis call.
     """
-    now = time.time()
-    key = f"user:{user_id}:requests"
-    # remove expired requests from the sorted set
-    redis_client.zremrangebyscore(key, 0, now - RATE_LIMIT_WINDOW)
-
-    # Count how many requests remain in the last hour:
-    current_count = redis_client.zcard(key)
-    if current_count >= MAX_REQUESTS_PER_HOUR:
-        return False
-    
-    # Add the new request timestamp
-    redis_client.zadd(key, {str(now): now})
-    #  ensures key expires eventually(if user goes inactive)
-    redis_client.expire(key, RATE_LIMIT_WINDOW)
-    return True
+    keys, args, tiers = _rate_limit_call(user_id, kind, workspace_id)
+    script = _rate_limit_scripts[RATE_LIMIT_MODE][0]
+    return _rate_limit_result(script(keys=keys, args=args), tiers)
+
+
+async def arate_limit(user_id: str, kind: str = "pipeline", workspace_id: Optional[str] = None) -> RateLimitResult:
+    """Async version of rate_limit"""
+    keys, args, tiers = _rate_limit_call(user_id, kind, workspace_id)
+    script = _rate_limit_scripts[RATE_LIMIT_MODE][1]
+    return _rate_limit_result(await script(keys=keys, args=args), tiers)
+
+
+# Helper Function to check user rate limits (pipeline budget)
+def check_rate_limit(user_id:str)->bool:
+    """Returns True if user is under rate limit, False if exceeded."""
+    return rate_limit(user_id).allowed
 
 # === Chat History APIs (add & get messages)===
 def add_message(user_id:str, message: str, expire_days: int = 1) -> None:
     """Add a message to Redis sorted set with timestamps"""
     now = time.time()
     key = f"user:{user_id}:messages"
-    redis_client.zadd(key,{message:now})
-    redis_client.expire(key, expire_days * 24 * 3600)
+    _write(("zadd", (key, {message: now}), {}), ("expire", (key, expire_days * 24 * 3600), {}))
 
 def get_messages(user_id: str, limit: int = 20) -> List[str]:
     """Get last N messages for a user"""
@@ -59,7 +367,7 @@ def get_messages(user_id: str, limit: int = 20) -> List[str]:
 def set_last_thread(user_id:str, thread_ts: str, expire_days: int = 1)-> None:
     """Stores the last slack thread_timestamp for a user"""
     key = f"user:{user_id}:last_thread"
-    redis_client.setex(key, expire_days * 24 * 3600, thread_ts)
+    _write(("setex", (key, expire_days * 24 * 3600, thread_ts), {}))
 
 def get_last_thread(user_id:str)-> str | None:
     """Retrieve the last slack thread_ts for a user"""
@@ -69,14 +377,77 @@ def get_last_thread(user_id:str)-> str | None:
 # Caching APIs
 def cache_result(key: str, value: Any, expire_seconds: int = 3600) -> None:
     """Cache any result in redis"""
-    redis_client.set(key, value, ex=expire_seconds)
+    _write(("set", (key, value), {"ex": expire_seconds}))
 
 def get_cached_result(key:str) -> Optional[str]:
     """Return cached value if exists, else None"""
     return redis_client.get(key)
 
 def set_user_location(user_id: str, location: str):
-    redis_client.set(f"user:{user_id}:location", location)
+    _write(("set", (f"user:{user_id}:location", location), {}))
 
 def get_user_location(user_id: str):
-    return redis_client.get(f"user:{user_id}:location") 
\ No newline at end of file
+    return redis_client.get(f"user:{user_id}:location")
+
+
+# === Async counterparts (used by the async pipeline) ===
+async def aadd_message(user_id: str, message: str, expire_days: int = 1) -> None:
+    """Async version of add_message"""
+    now = time.time()
+    key = f"user:{user_id}:messages"
+    await _awrite(("zadd", (key, {message: now}), {}), ("expire", (key, expire_days * 24 * 3600), {}))
+
+async def aget_messages(user_id: str, limit: int = 20) -> List[str]:
+    """Async version of get_messages"""
+    key = f"user:{user_id}:messages"
+    return await async_redis_client.zrevrange(key, 0, limit - 1)
+
+async def acache_result(key: str, value: Any, expire_seconds: int = 3600) -> None:
+    """Async version of cache_result"""
+    await _awrite(("set", (key, value), {"ex": expire_seconds}))
+
+async def aget_cached_result(key: str) -> Optional[str]:
+    """Async version of get_cached_result"""
+    return await async_redis_client.get(key)
+
+async def aget_user_location(user_id: str):
+    """Async version of get_user_location"""
+    return await async_redis_client.get(f"user:{user_id}:location")
+
+async def aset_user_location(user_id: str, location: str):
+    """Async version of set_user_location"""
+    await _awrite(("set", (f"user:{user_id}:location", location), {}))
+
+async def aset_last_thread(user_id: str, thread_ts: str, expire_days: int = 1) -> None:
+    """Async version of set_last_thread"""
+    await _awrite(("setex", (f"user:{user_id}:last_thread", expire_days * 24 * 3600, thread_ts), {}))
+
+async def aget_last_thread(user_id: str) -> str | None:
+    """Async version of get_last_thread"""
+    return await async_redis_client.get(f"user:{user_id}:last_thread")
+
+# === Slack event dedup ===
+SLACK_EVENT_DEDUP_TTL = int(os.getenv("SLACK_EVENT_DEDUP_TTL", "600"))  # seconds; Slack retries within ~5 minutes
+
+async def aclaim_event(event_id: str) -> bool:
+    """True the first time an event id is seen; False for Slack's retried deliveries of it"""
+    return bool(await async_redis_client.set(f"slack:event:{event_id}", "1", nx=True, ex=SLACK_EVENT_DEDUP_TTL))
+
+async def arelease_event(event_id: str) -> None:
+    """Forget a claimed event id (handling failed), so Slack's next retry of it is processed"""
+    await async_redis_client.delete(f"slack:event:{event_id}")
+
+# === Slack messages posted per queued job ===
+# A retried job reuses the messages its earlier attempts posted instead of posting them again
+SLACK_JOB_MESSAGES_TTL = 24 * 3600  # seconds
+
+async def aget_job_message(job_id: str, step: str) -> Optional[str]:
+    """ts of the message a job already posted for `step`, or None"""
+    return await async_redis_client.hget(f"slack:job:{job_id}:messages", step)
+
+async def aset_job_message(job_id: str, step: str, ts: str) -> None:
+    # Written right away (not batched): it must survive the attempt failing later
+    pipe = async_redis_client.pipeline()
+    pipe.hset(f"slack:job:{job_id}:messages", step, ts)
+    pipe.expire(f"slack:job:{job_id}:messages", SLACK_JOB_MESSAGES_TTL)
+    await pipe.execute()
@@ -0,0 +1,123 @@
+# request_coalescing.py
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+from app.services import metrics
+from app.services.redis_helpers import async_redis_client
+from app.services.tool_memo import normalize_tool_input
+
+# Identical in-flight pipeline runs (same normalized query + state) share one run,
+# across MCP processes: the first request takes a Redis lock and publishes its
+# answer; the others subscribe and wait for it.
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_LOCK_TIMEOUT = int(os.getenv("COALESCE_LOCK_TIMEOUT", "120"))  # seconds (slot wait + run); frees followers if the leader dies
+COALESCE_RESULT_TTL = 30  # seconds the leader's answer stays readable for late followers
+POLL_INTERVAL = 1.0  # seconds between liveness checks of the leader's lock
+COALESCE_MAX_ATTEMPTS = 3  # leader runs a follower waits through before giving up
+
+# Delete the lock only if we still own it (it may have expired and been re-taken)
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class CoalescedRunError(RuntimeError):
+    """The in-flight runs this request waited on all failed"""
+
+
+def _coalesce_key(query: str, state: Optional[str]) -> str:
+    fingerprint = f"{normalize_tool_input(query)}|{(state or '').strip().upper()}"
+    return f"coalesce:{hashlib.sha1(fingerprint.encode()).hexdigest()}"
+
+
+async def _lead(key: str, token: str, run: Callable[[], Awaitable[str]]) -> str:
+    metrics.incr("coalesce.leader")
+    try:
+        answer = await run()
+    except Exception as e:
+        # Free the lock before telling followers, so one of them can take over right away
+        await async_redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"{key}:lock", token)
+        await async_redis_client.publish(f"{key}:channel", json.dumps({"error": str(e)}))
+        raise
+    except BaseException:
+        await async_redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"{key}:lock", token)
+        raise
+    message = json.dumps({"result": answer})
+    pipe = async_redis_client.pipeline()
+    pipe.set(f"{key}:result", message, ex=COALESCE_RESULT_TTL)
+    pipe.publish(f"{key}:channel", message)
+    pipe.eval(RELEASE_LOCK_SCRIPT, 1, f"{key}:lock", token)
+    await pipe.execute()
+    return answer
+
+
+async def _follow(key: str) -> Optional[dict]:
+    """
+    Wait for the leader's outcome: {"result": ...} or {"error": ...}; None if it
+    died or took longer than the lock timeout.
+    """
+    pubsub = async_redis_client.pubsub()
+    try:
+        # Subscribe before reading the result key so a publish in between isn't missed
+        await pubsub.subscribe(f"{key}:channel")
+        deadline = time.monotonic() + COALESCE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            raw = await async_redis_client.get(f"{key}:result")
+            if raw is None:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=POLL_INTERVAL)
+                raw = message["data"] if message else None
+            if raw is not None:
+                return json.loads(raw)
+            if not await async_redis_client.exists(f"{key}:lock"):
+                # Lock released (or expired) without an answer on the channel: one last look
+                raw = await async_redis_client.get(f"{key}:result")
+                return json.loads(raw) if raw else None
+        return None
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+async def acoalesced(query: str, state: Optional[str], run: Callable[[], Awaitable[str]]) -> tuple:
+    """
+    Run `run()` unless an identical request is already in flight, in which case
+    wait for that one's answer. Returns (answer, shared) where `shared` is True
+    when the answer came from another request (the caller still records the turn).
+    When the leader fails, one follower takes over the lock and the rest keep
+    waiting; after COALESCE_MAX_ATTEMPTS failed runs the leader's error is raised.
+    """
+    if not COALESCE_ENABLED:
+        return await run(), False
+
+    key = _coalesce_key(query, state)
+    token = uuid.uuid4().hex
+    error = None
+    for attempt in range(COALESCE_MAX_ATTEMPTS):
+        try:
+            acquired = await async_redis_client.set(f"{key}:lock", token, nx=True, ex=COALESCE_LOCK_TIMEOUT)
+        except Exception as e:
+            logging.warning(f"[Coalesce] Lock unavailable, running independently: {e}")
+            return await run(), False
+
+        if acquired:
+            if attempt:
+                metrics.incr("coalesce.takeover")
+            return await _lead(key, token, run), False
+
+        metrics.incr("coalesce.follower")
+        logging.info(f"[Coalesce] Waiting for in-flight run of {query!r}")
+        outcome = await _follow(key) or {}
+        if outcome.get("result") is not None:
+            return outcome["result"], True
+        # Leader failed or vanished: race for the lock again so only one of us reruns it
+        error = outcome.get("error") or error
+
+    metrics.incr("coalesce.failed")
+    raise CoalescedRunError(f"Shared pipeline run failed: {error or 'leader did not answer'}")
@@ -0,0 +1,141 @@
+# semantic_cache.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from redisvl.extensions.cache.llm import SemanticCache
+from redisvl.query.filter import Tag
+from redisvl.utils.vectorize import CustomTextVectorizer
+from app.services import metrics
+from app.services.redis_helpers import REDIS_URL, async_redis_client
+
+# Answers for near-identical questions (same state) are served from Redis
+# instead of re-running planner -> rag -> executor.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # min cosine similarity for a hit
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))  # seconds since last hit
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+CACHE_NAME = "rights2roof_answers"
+LRU_KEY = f"{CACHE_NAME}:lru"  # sorted set: entry key -> last access time
+UNKNOWN_STATE = "unknown"
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache() -> SemanticCache:
+    """Build the cache on first use (creating the index needs Redis and one embedding call)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            # Same embedding model as the vector store
+            from app.tools.vector_store_tool import embeddings
+
+            async def aembed(text: str, **_) -> list:
+                return await embeddings.aembed_query(text)
+
+            vectorizer = CustomTextVectorizer(
+                embed=lambda text, **_: embeddings.embed_query(text),
+                aembed=aembed
+            )
+            _cache = SemanticCache(
+                name=CACHE_NAME,
+                redis_url=REDIS_URL,
+                vectorizer=vectorizer,
+                distance_threshold=1 - SEMANTIC_CACHE_THRESHOLD,
+                ttl=SEMANTIC_CACHE_TTL,
+                filterable_fields=[{"name": "state", "type": "tag"}]
+            )
+    return _cache
+
+
+def _state_tag(state: Optional[str]) -> str:
+    return state.strip().upper() if state and state.strip() else UNKNOWN_STATE
+
+
+def _is_cacheable(answer: Optional[str]) -> bool:
+    return bool(answer) and not answer.startswith(("Executor failed", "No response from executor"))
+
+
+def _record_hit(hit: dict, lookup_ms: float) -> str:
+    metrics.incr("semantic_cache.hit")
+    saved_ms = float((hit.get("metadata") or {}).get("latency_ms", 0)) - lookup_ms
+    metrics.observe("semantic_cache.saved_latency", max(saved_ms, 0.0))
+    logging.info(f"[SemanticCache] Hit (distance {float(hit.get('vector_distance', 0)):.3f}): {hit.get('prompt')!r}")
+    return hit["response"]
+
+
+def _stale_before() -> float:
+    return time.time() - SEMANTIC_CACHE_TTL
+
+
+# === Lookup ===
+async def acheck_answer(query: str, state: Optional[str]) -> Optional[str]:
+    """Cached answer for a semantically similar query from the same state, or None"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    start = time.perf_counter()
+    try:
+        cache = _cache or await asyncio.to_thread(_get_cache)
+        hits = await cache.acheck(prompt=query, num_results=1, filter_expression=Tag("state") == _state_tag(state))
+    except Exception as e:
+        logging.warning(f"[SemanticCache] Lookup failed: {e}")
+        return None
+    lookup_ms = (time.perf_counter() - start) * 1000
+    metrics.observe("semantic_cache.lookup", lookup_ms)
+
+    if not hits:
+        metrics.incr("semantic_cache.miss")
+        return None
+    await async_redis_client.zadd(LRU_KEY, {hits[0]["key"]: time.time()})
+    return _record_hit(hits[0], lookup_ms)
+
+
+# === Store + LRU eviction ===
+def _trim_pipeline(client):
+    """Pipeline that drops expired entries from the LRU index and counts the rest"""
+    pipe = client.pipeline()
+    pipe.zremrangebyscore(LRU_KEY, 0, _stale_before())
+    pipe.zcard(LRU_KEY)
+    return pipe
+
+
+async def astore_answer(query: str, state: Optional[str], answer: str, latency_ms: float) -> None:
+    """Cache a pipeline answer along with how long it took to produce"""
+    if not SEMANTIC_CACHE_ENABLED or not _is_cacheable(answer):
+        return
+    try:
+        cache = _cache or await asyncio.to_thread(_get_cache)
+        key = await cache.astore(
+            prompt=query,
+            response=answer,
+            metadata={"latency_ms": round(latency_ms, 1)},
+            filters={"state": _state_tag(state)}
+        )
+        await async_redis_client.zadd(LRU_KEY, {key: time.time()})
+        _, size = await _trim_pipeline(async_redis_client).execute()
+        overflow = size - SEMANTIC_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = [member for member, _ in await async_redis_client.zpopmin(LRU_KEY, overflow)]
+            await async_redis_client.delete(*evicted)
+            metrics.incr("semantic_cache.evicted", len(evicted))
+    except Exception as e:
+        logging.warning(f"[SemanticCache] Store failed: {e}")
+
+
+def get_semantic_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counts, hit rate and latency saved by cache hits"""
+    snapshot = metrics.get_metrics()
+    counters, timings = snapshot["counters"], snapshot["timings"]
+    saved = timings.get("semantic_cache.saved_latency", {})
+    return {
+        "hits": counters.get("semantic_cache.hit", 0),
+        "misses": counters.get("semantic_cache.miss", 0),
+        "hit_rate": metrics.hit_rate("semantic_cache.hit", "semantic_cache.miss"),
+        "evicted": counters.get("semantic_cache.evicted", 0),
+        "saved_latency_ms_total": saved.get("total_ms", 0.0),
+        "lookup_ms_avg": timings.get("semantic_cache.lookup", {}).get("avg_ms", 0.0),
+    }
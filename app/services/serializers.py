@@ -12,7 +12,8 @@ def serialize_tool_output(obj):
             "tool": obj.tool,
             "input": serialize_tool_output(obj.input) if isinstance(obj.input, (ToolOutput, dict, list)) else obj.input,
             "output": serialize_tool_output(obj.output) if isinstance(obj.output, (ToolOutput, dict, list)) else obj.output,
-            "step": str(obj.step) if obj.step is not None else None
+            "step": str(obj.step) if obj.step is not None else None,
+            "depends_on": [str(dep) for dep in obj.depends_on] if obj.depends_on else None
         }
     elif isinstance(obj, list):
         return [serialize_tool_output(i) for i in obj]
@@ -2,23 +2,38 @@ import re
 import asyncio
 import logging
 import json
-from fastmcp import Client
+import time
+from typing import Optional
 # from slack_sdk import WebClient
 from slack_sdk.web.async_client import AsyncWebClient
-from app.services.redis_helpers import add_message, set_last_thread, get_cached_result, get_user_location, set_user_location
+from slack_sdk.errors import SlackApiError
+from fastmcp.exceptions import ToolError
+from redis.exceptions import RedisError
+from app.services.redis_helpers import (
+    aadd_message, aset_last_thread, aget_cached_result, aget_user_location, aset_user_location, arequest_scope,
+    aget_job_message, aset_job_message
+)
+from app.services.mcp_pool import mcp_pool, MCPUnavailableError
+from app.services.admission import OverloadedError, is_overloaded_message
+from app.services import metrics
 from langsmith import traceable
 from app.tools.chat_tool import chat_tool_fn
+from app.services.streaming import stream_tokens_to, streaming_answer
 import os 
 from dotenv import load_dotenv
 
 
 load_dotenv()
-# MCP_SERVER_URL = "http://127.0.0.1:5200/mcp" # local dev 
-MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://mcp-sever.railway.internal:5300/mcp")
-
 SLACK_BOT_TOKEN=os.getenv("SLACK_BOT_TOKEN")
 client = AsyncWebClient(token=SLACK_BOT_TOKEN)
 
+# Min seconds between in-place edits of a streaming message (chat.update is rate limited)
+SLACK_STREAM_UPDATE_INTERVAL = float(os.getenv("SLACK_STREAM_UPDATE_INTERVAL", "1.2"))
+
+# Seconds a user waits for the pipeline before getting the vector-store answer
+SLACK_PIPELINE_DEADLINE = float(os.getenv("SLACK_PIPELINE_DEADLINE", "60"))
+WEAK_ANSWER_CHARS = 40  # shorter pipeline answers are replaced by the vector-store answer
+
 
 
 # Allowed patterns for user query santitation
@@ -55,120 +70,358 @@ def sanitize_query(query:str)-> str:
 
 
 
-# Helper Function: Post Threaded response
-@traceable
-async def post_slack_thread(client: AsyncWebClient,channel_id: str, user_id: str, query_text: str):
+# Helper Class: Stream text into one Slack message by editing it in place
+class SlackMessageStreamer:
     """
-    Runs the Planner agent and sends the final answer as a private DM to the user.
+    Edits a posted Slack message (`chat_update`) as answer text streams in.
+    Edits are throttled to one per `min_interval` seconds and back off on
+    Slack rate limits; `finish()` always delivers the final text.
     """
-    try:
-        logging.info(f"[Right2Roof Bot] simulating pipeline for {user_id}:{query_text}")
-        location = get_user_location(user_id)
 
-        if not location:
-            await client.chat_postMessage(
-                channel=channel_id,
-                user=user_id,
-                text="🏠 Before I run your tenant-rights search, what *state* are you in? (Example: CA, NY, TX)"
-            )
+    def __init__(self, client: AsyncWebClient, channel: str, ts: str, prefix: str = "", min_interval: float = SLACK_STREAM_UPDATE_INTERVAL):
+        self.client = client
+        self.channel = channel
+        self.ts = ts
+        self.prefix = prefix
+        self.min_interval = min_interval
+        self._loop = asyncio.get_running_loop()
+        self._latest: Optional[str] = None
+        self._sent: Optional[str] = None
+        self._next_send_at = 0.0
+        self._progress = -1.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    def feed(self, text: str) -> None:
+        """Record the latest text and schedule an edit (call from the event loop)"""
+        if self._closed or not text:
             return
-        
-        mcp_client = None
-        for attempt in range(5):  
+        self._latest = text
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def feed_threadsafe(self, text: str) -> None:
+        """Same as feed(), callable from worker threads (e.g. a token sink)"""
+        self._loop.call_soon_threadsafe(self.feed, text)
+
+    async def progress_handler(self, progress: float, total: Optional[float], message: Optional[str]) -> None:
+        """MCP progress handler: the pipeline streams the answer so far as the progress message"""
+        if not message:
+            return
+        # A shorter message that the current text extends is a late update of
+        # this stream; anything else shorter starts a new stream
+        if progress < self._progress and self._latest and self._latest.startswith(message):
+            return
+        self._progress = progress
+        self.feed(message)
+
+    async def _flush_later(self) -> None:
+        delay = self._next_send_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not self._closed:
+            await self._send(self._latest)
+
+    async def _send(self, text: Optional[str]) -> bool:
+        async with self._send_lock:
+            if text is None or text == self._sent:
+                return True
             try:
-                mcp_client = await Client(MCP_SERVER_URL).__aenter__()
-                await mcp_client.ping()
-                break
-            except Exception as e:
-                wait_time = 2 ** attempt  
-                logging.warning(f"[Right2Roof Bot] MCP connection failed (attempt {attempt+1}). Retrying in {wait_time}s...")
-                await asyncio.sleep(wait_time)
-        else:
-            raise RuntimeError("Unable to connect to MCP server after multiple attempts")
-        
-        
-        # call the pipeline tool
-        result = await mcp_client.call_tool(
-            "pipeline_tool",
-            {
-                "query": query_text,
-                "user_id": user_id,
-                "location": location
-            }
-        )
+                await self.client.chat_update(channel=self.channel, ts=self.ts, text=f"{self.prefix}{text}")
+                self._sent = text
+                self._next_send_at = time.monotonic() + self.min_interval
+                return True
+            except SlackApiError as e:
+                if e.response.get("error") == "ratelimited":
+                    retry_after = float(e.response.headers.get("Retry-After", 1))
+                    self._next_send_at = time.monotonic() + retry_after
+                    logging.warning(f"[SlackStreamer] Rate limited, backing off {retry_after}s")
+                else:
+                    logging.warning(f"[SlackStreamer] chat_update failed: {e}")
+                return False
 
-        # exit MCP client context
-        await mcp_client.__aexit__(None, None, None)
+    async def finish(self, text: str, attempts: int = 3) -> None:
+        """Stop streaming and make sure the final text is shown"""
+        self._closed = True
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        for _ in range(attempts):
+            delay = self._next_send_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if await self._send(text):
+                return
 
-        logging.info(f"MCP result: {result}")
 
-        # Extract executor response from MCP result
-        try:
-            raw_text = result.content[0].text  # MCP returns JSON string
-            pipeline_response = json.loads(raw_text).get("result", "No result available")
-        except Exception as e:
-            logging.error(f"Failed to parse MCP result: {e}")
-            pipeline_response = str(result)
+# Helper Functions: queued-job retries
+def is_transient_error(e: BaseException) -> bool:
+    """Failures the job queue should retry: nothing is wrong with the request itself"""
+    return isinstance(e, (MCPUnavailableError, OverloadedError, RedisError))
+
 
+async def _call_tool(name: str, arguments: dict, **kwargs):
+    try:
+        return await mcp_pool.call_tool(name, arguments, **kwargs)
+    except ToolError as e:
+        # The MCP server sheds load with OverloadedError; it arrives as a ToolError
+        if is_overloaded_message(str(e)):
+            raise OverloadedError(str(e)) from e
+        raise
+
+
+async def _post_once(client: AsyncWebClient, job_id: Optional[str], step: str, **kwargs) -> str:
+    """
+    chat_postMessage at most once per queued job and step, so a retried job
+    reuses what its earlier attempts posted. Returns the message ts.
+    """
+    if job_id:
+        ts = await aget_job_message(job_id, step)
+        if ts:
+            return ts
+    ts = (await client.chat_postMessage(**kwargs))["ts"]
+    if job_id:
+        await aset_job_message(job_id, step, ts)
+    return ts
+
+
+# Helper Functions: pipeline answer with a speculative vector-store fallback
+async def _pipeline_tool_answer(arguments: dict, progress_handler) -> str:
+    # call the pipeline tool on a pooled session (answer chunks arrive as progress notifications)
+    result = await _call_tool("pipeline_tool", arguments, progress_handler=progress_handler)
+    logging.info(f"MCP result: {result}")
+
+    # Extract executor response from MCP result
+    try:
+        raw_text = result.content[0].text  # MCP returns JSON string
+        return json.loads(raw_text).get("result", "No result available")
+    except Exception as e:
+        logging.error(f"Failed to parse MCP result: {e}")
+        return str(result)
+
+
+async def _vector_answer(query_text: str) -> str:
+    vector_result = await _call_tool("vector_lookup", {"query": query_text})
+    raw_vector = vector_result.content[0].text
+    fallback_context = json.loads(raw_vector).get("output", [])
+    return "📚 From our tenant rights guide:\n" + "\n".join(fallback_context[:3]) if fallback_context else ""
 
-        # fallback if pipeline is empty or weak 
-        if not pipeline_response or len(pipeline_response) < 40:  
+
+async def _settled(task: asyncio.Task, label: str) -> Optional[str]:
+    try:
+        return await task
+    except Exception as e:
+        logging.warning(f"[Right2Roof Bot] {label} failed: {e}")
+        return None
+
+
+def _is_weak(answer: Optional[str]) -> bool:
+    return not answer or len(answer) < WEAK_ANSWER_CHARS
+
+
+async def _answer_with_fallback(client: AsyncWebClient, channel: str, thread_ts: str, streamer: SlackMessageStreamer, arguments: dict, job_id: Optional[str] = None) -> str:
+    """
+    Run pipeline_tool with the vector-store fallback retrieved alongside it.
+    A strong pipeline answer cancels the fallback; a weak or failed one is
+    replaced by it. If the pipeline misses SLACK_PIPELINE_DEADLINE, whichever
+    usable answer lands first is shown; when that is the fallback, the full
+    answer is posted in the thread when it lands.
+    """
+    pipeline_task = asyncio.create_task(_pipeline_tool_answer(arguments, streamer.progress_handler))
+    vector_task = asyncio.create_task(_vector_answer(arguments["query"]))
+    try:
+        done, _ = await asyncio.wait({pipeline_task}, timeout=SLACK_PIPELINE_DEADLINE)
+        if not done:
+            metrics.incr("slack.pipeline_deadline_missed")
+            # A hanging retrieval mustn't hold back a pipeline answer that lands first
+            done, _ = await asyncio.wait({pipeline_task, vector_task}, return_when=asyncio.FIRST_COMPLETED)
+            fallback = None if pipeline_task in done else await _settled(vector_task, "Vector fallback")
+            if fallback:
+                logging.info("Pipeline missed the deadline. Answering from the vector store first...")
+                await streamer.finish(f"{fallback}\n\n_Still researching, the full answer will follow in this thread._")
+                answer = await _settled(pipeline_task, "Pipeline")
+                if _is_weak(answer):
+                    return fallback
+                await _post_once(client, job_id, "full_answer", channel=channel, thread_ts=thread_ts, text=f"{streamer.prefix}{answer}")
+                return answer
+
+        answer = await _settled(pipeline_task, "Pipeline")
+        if _is_weak(answer):
             logging.info("Pipeline weak. Falling back to vector store...")
-            async with Client(MCP_SERVER_URL) as mcp_client:
-                vector_result = await mcp_client.call_tool(
-                    "vector_lookup", {"query": query_text}
-                )
-            raw_vector = vector_result.content[0].text
-            fallback_context = json.loads(raw_vector).get("output", [])
-            pipeline_response = "📚 From our tenant rights guide:\n" + "\n".join(fallback_context[:3])
+            metrics.incr("slack.vector_fallback")
+            answer = await _settled(vector_task, "Vector fallback") or answer
+        if not answer:
+            error = pipeline_task.exception() if not pipeline_task.cancelled() else None
+            if error is not None and is_transient_error(error):
+                raise error
+            raise RuntimeError("No answer from the pipeline or the vector store")
 
-        dm_response = await client.conversations_open(users=user_id)
-        dm_channel_id = dm_response["channel"]["id"]
+        # Final answer replaces whatever was streamed
+        await streamer.finish(answer)
+        return answer
+    finally:
+        vector_task.cancel()
+        pipeline_task.cancel()
 
 
-        placeholder = await client.chat_postMessage(
-            channel=dm_channel_id,
-            text=f"<@{user_id}> Fetching information about: {query_text}..."
-        )
+# Helper Function: Post Threaded response
+@traceable
+async def post_slack_thread(client: AsyncWebClient,channel_id: str, user_id: str, query_text: str, location: Optional[str] = None, job_id: Optional[str] = None, retryable: bool = False):
+    """
+    Runs the Planner agent and sends the final answer as a private DM to the user.
+    `location` is the state the caller already looked up (read from Redis if not given).
+    From a queued job: messages are posted once per `job_id` (a retry reuses them), and
+    with `retryable` transient errors are raised for the queue to retry instead of reported.
+    """
+    # All of this request's Redis writes go out in one flush at the end
+    async with arequest_scope("slack_pipeline"):
+        streamer = None
+        try:
+            if job_id and await aget_job_message(job_id, "answered"):
+                return  # an earlier attempt answered and failed afterwards
+            logging.info(f"[Right2Roof Bot] simulating pipeline for {user_id}:{query_text}")
+            location = location or await aget_user_location(user_id)
 
-        # creates placeholder for message to respond in the thread 
-        thread_ts = placeholder["ts"]
-        set_last_thread(user_id, thread_ts)
+            if not location:
+                await _post_once(
+                    client, job_id, "location_prompt",
+                    channel=channel_id,
+                    user=user_id,
+                    text="🏠 Before I run your tenant-rights search, what *state* are you in? (Example: CA, NY, TX)"
+                )
+                return
+        
+            # Post the thread right away so the answer can stream into it
+            dm_response = await client.conversations_open(users=user_id)
+            dm_channel_id = dm_response["channel"]["id"]
 
-        # Post final answer in the thread
-        await client.chat_postMessage(
-            channel=dm_channel_id,
-            thread_ts=thread_ts,
-            text=f"🏠 Rights2Roof:\n{pipeline_response}"
-        )
+            # creates placeholder for message to respond in the thread 
+            thread_ts = await _post_once(
+                client, job_id, "thread",
+                channel=dm_channel_id,
+                text=f"<@{user_id}> Fetching information about: {query_text}..."
+            )
+            await aset_last_thread(user_id, thread_ts)
+
+            # Answer message that is edited in place as the pipeline streams tokens
+            answer_prefix = "🏠 Rights2Roof:\n"
+            answer_ts = await _post_once(
+                client, job_id, "answer",
+                channel=dm_channel_id,
+                thread_ts=thread_ts,
+                text=f"{answer_prefix}_Researching your question..._"
+            )
+            streamer = SlackMessageStreamer(client, dm_channel_id, answer_ts, prefix=answer_prefix)
 
-        # Call chat_tool for follow-up Q&A
-        # Prepare follow-up context in background but do NOT post it
-        follow_up_query = f"Based on the answer:\n{pipeline_response}\nThe user asks a follow-up: {query_text}"
-        asyncio.create_task(chat_tool_fn(user_id, follow_up_query))
+            # Vector-store fallback is fetched alongside the pipeline (see _answer_with_fallback)
+            pipeline_response = await _answer_with_fallback(
+                client, dm_channel_id, thread_ts, streamer,
+                {
+                    "query": query_text,
+                    "user_id": user_id,
+                    "location": location
+                },
+                job_id=job_id
+            )
+            if job_id:
+                await aset_job_message(job_id, "answered", answer_ts)
+
+            # Call chat_tool for follow-up Q&A
+            # Prepare follow-up context in background but do NOT post it
+            follow_up_query = f"Based on the answer:\n{pipeline_response}\nThe user asks a follow-up: {query_text}"
+            asyncio.create_task(chat_tool_fn(user_id, follow_up_query))
        
-        # post follow up - question
-        await client.chat_postMessage(
-        channel=dm_channel_id,
-        user=user_id,
-        thread_ts=thread_ts,
-        text="💬 Want to dive deeper? Ask me a follow-up question here in this thread."
-    )
+            # post follow up - question
+            await _post_once(
+                client, job_id, "followup_prompt",
+                channel=dm_channel_id,
+                user=user_id,
+                thread_ts=thread_ts,
+                text="💬 Want to dive deeper? Ask me a follow-up question here in this thread."
+            )
 
-        # save result in redis 
-        cache_key = f"user:{user_id}:query:{query_text}"
-        full_pipeline_result = get_cached_result(cache_key) or ""
-        add_message(user_id, f"FULL_PIPELINE: {full_pipeline_result}")
+            # save result in redis 
+            cache_key = f"user:{user_id}:query:{query_text}"
+            full_pipeline_result = await aget_cached_result(cache_key) or ""
+            await aadd_message(user_id, f"FULL_PIPELINE: {full_pipeline_result}")
  
-        print(f"[Thread] Channel: {channel_id} | User: {user_id} | Answer: {pipeline_response}")
+            print(f"[Thread] Channel: {channel_id} | User: {user_id} | Answer: {pipeline_response}")
         
-    except Exception as e:
-        logging.exception(f"[Right2RoofBot] Error in planner agent")
+        except Exception as e:
+            if retryable and is_transient_error(e):
+                raise  # retried by the job queue, reusing the messages posted so far
+            logging.exception(f"[Right2RoofBot] Error in planner agent")
+            if streamer:
+                # Don't leave the answer message on "Researching your question..."
+                await streamer.finish(f"⚠️ Sorry, something went wrong while researching this: {str(e)}")
+            await _post_once(
+                client, job_id, "error",
+                channel=channel_id,
+                user=user_id,
+                text=f"<@{user_id}> Error fetching housing info: {str(e)}"
+            )
+  
+            await aadd_message(user_id, f"BOT_ERROR: {str(e)}")
+
+
+async def run_followup(user_id: str, channel_id: str, thread_ts: str, text: str, job_id: Optional[str] = None, retryable: bool = False):
+    """
+    Helper to run chat tool for follow-ups in thread, streaming the answer into one message.
+    `job_id` / `retryable` as in post_slack_thread.
+    """
+    async with arequest_scope("slack_followup"):
+        streamer = None
+        try:
+            if job_id and await aget_job_message(job_id, "answered"):
+                return
+            prefix = "💬 Follow-up response:\n"
+            reply_ts = await _post_once(
+                client, job_id, "reply",
+                channel=channel_id,
+                thread_ts=thread_ts,
+                text=f"{prefix}_Thinking..._"
+            )
+            streamer = SlackMessageStreamer(client, channel_id, reply_ts, prefix=prefix)
+
+            # The follow-up is the answer here: chat_tool_fn streams from a worker thread
+            # and the sink hops back onto the event loop
+            with stream_tokens_to(streamer.feed_threadsafe), streaming_answer():
+                follow_up = await chat_tool_fn(user_id, text)
+            await streamer.finish(follow_up.output)
+            if job_id:
+                await aset_job_message(job_id, "answered", reply_ts)
+        except Exception as e:
+            if retryable and is_transient_error(e):
+                raise
+            error_text = f"⚠️ Error fetching follow-up response: {str(e)}"
+            if streamer:
+                await streamer.finish(error_text)
+                return
+            await _post_once(
+                client, job_id, "error",
+                channel=channel_id,
+                thread_ts=thread_ts,
+                text=error_text
+            )
+
+
+async def handle_location_reply(user_id: str, channel_id: str, thread_ts: str, text: str):
+    """Save the state a user without a location replied with, or ask again if it isn't a state code."""
+    cleaned = text.strip().upper()
+
+    if len(cleaned) in (2, 3):
+        await aset_user_location(user_id, cleaned)
+
         await client.chat_postMessage(
             channel=channel_id,
-            user=user_id,
-            text=f"<@{user_id}> Error fetching housing info: {str(e)}"
+            thread_ts=thread_ts,
+            text=f"👍 Got it! I'll use **{cleaned}** for all tenant-rights answers."
         )
-  
-        add_message(user_id, f"BOT_ERROR: {str(e)}")
+        return
 
+    # Failed validation → ask again
+    await client.chat_postMessage(
+        channel=channel_id,
+        thread_ts=thread_ts,
+        text="⚠️ Please enter a valid 2-letter state code (ex: CA, NY, TX)."
+    )
@@ -1,42 +1,80 @@
 # slack webhook
-from fastapi import FastAPI, Form, Request
-import asyncio
+from fastapi import BackgroundTasks, FastAPI, Form, Request
+from contextlib import asynccontextmanager
 import os
+import logging
 import json
 from dotenv import load_dotenv
 from slack_sdk import WebClient
 from slack_sdk.web.async_client import AsyncWebClient
-from app.services.slack_helpers import sanitize_query, post_slack_thread 
-from app.services.redis_helpers import check_rate_limit , add_message, get_messages , get_last_thread, set_last_thread, get_user_location, set_user_location
-from app.tools.chat_tool import chat_tool_fn
+from app.services.slack_helpers import sanitize_query
+from app.services.job_queue import aenqueue_job, aqueue_stats
+from app.services.admission import aadmit_job
+from app.services.redis_helpers import (
+    arate_limit, aadd_message, aget_messages, aget_last_thread, aset_last_thread,
+    aget_user_location, aclose_redis, aclaim_event, arelease_event
+)
+from app.services import metrics
+from app.models.schemas import RateLimitResult
+from typing import Optional
 load_dotenv()
 
-app = FastAPI(title="Rights-2-Roof Slash Command")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release pooled Redis connections on shutdown
+    await aclose_redis()
+
+
+app = FastAPI(title="Rights-2-Roof Slash Command", lifespan=lifespan)
 
 # intialize Slack Client 
 SLACK_BOT_TOKEN=os.getenv("SLACK_BOT_TOKEN")
 # client = WebClient(token=SLACK_BOT_TOKEN)
 client = AsyncWebClient(token=SLACK_BOT_TOKEN)
 
+def _wait_text(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    return f"{minutes} min" if minutes else f"{max(1, int(seconds))} s"
+
+
+def _shed_text() -> str:
+    return "🚧 Rights2Roof is at capacity right now. Please try again in a few minutes."
+
+
+def _rate_limited_text(result: RateLimitResult) -> str:
+    scope = {"user": "You've", "workspace": "Your workspace has", "global": "Rights2Roof has"}[result.tier]
+    return f"Rate limit exceeded. {scope} used all {result.limit} requests for this hour. Try again in {_wait_text(result.reset_in)}."
+
+
 # POST/slack/rights-2-roof -> Users query and responds to slack channel with answer
 @app.post("/slack/rights-2-roof")
-async def slack_roof(text: str = Form(...),user_id: str = Form(...),channel_id: str = Form(...),):
+async def slack_roof(text: str = Form(...),user_id: str = Form(...),channel_id: str = Form(...), team_id: Optional[str] = Form(None)):
     """
     Handles /rights-2-roof <query> slash command from Slack.
-    Responds immediately, then posts final answer asynchronously.
+    Responds immediately and queues the pipeline; a slack_worker posts the final answer.
     """
-    # rate limiting 
-    if not check_rate_limit(user_id):
+    # admission: refuse up front when the pipeline queue is too deep (before spending quota)
+    admission = await aadmit_job("pipeline")
+    if not admission.admitted:
         return {
             "response_type": "ephemeral",
-            "text": f"Rate limit exceeded. You can only make 10 requests per hour."
+            "text": _shed_text()
+        }
+
+    # rate limiting (user, workspace and global pipeline budgets)
+    limit = await arate_limit(user_id, "pipeline", workspace_id=team_id)
+    if not limit.allowed:
+        return {
+            "response_type": "ephemeral",
+            "text": _rate_limited_text(limit)
         }
     try:
         # Step 1: Sanitize
         safe_text = sanitize_query(text)
-        add_message(user_id, f"USER_QUERY: {safe_text}")
+        await aadd_message(user_id, f"USER_QUERY: {safe_text}")
 
-        location = get_user_location(user_id)
+        location = await aget_user_location(user_id)
         if not location:
             return {
                 "response_type": "ephemeral",
@@ -44,13 +82,23 @@ async def slack_roof(text: str = Form(...),user_id: str = Form(...),channel_id:
                 }
 
         # step 2: Slack to respond immediately 
+        quota = f"{limit.remaining} requests left, resets in {_wait_text(limit.reset_in)}"
         ephemeral_response = {
             "response_type": "ephemeral",
-            "text": f"Got it! Running Rights2Roof search for: {safe_text}"
+            "text": (
+                f"⏳ Rights2Roof is busy: your search for {safe_text} is queued as #{admission.position} ({quota})"
+                if admission.busy else
+                f"Got it! Running Rights2Roof search for: {safe_text} ({quota})"
+            )
         }
 
-        # step 3: Trigger background task for final answer
-        asyncio.create_task(post_slack_thread(client,channel_id,user_id, safe_text))
+        # step 3: Queue the pipeline run; a slack_worker posts the final answer
+        await aenqueue_job("pipeline", {
+            "channel_id": channel_id,
+            "user_id": user_id,
+            "query": safe_text,
+            "location": location
+        })
         return ephemeral_response
     
     except ValueError as error:
@@ -63,13 +111,23 @@ async def slack_roof(text: str = Form(...),user_id: str = Form(...),channel_id:
 
 # Slack Event Subscription: Follow-ups in threads
 @app.post("/slack/events")
-async def slack_events(req: Request):
+async def slack_events(req: Request, background_tasks: BackgroundTasks):
     payload = await req.json()
 
     # Slack URL verification
     if "challenge" in payload:
         return {"challenge": payload["challenge"]}
 
+    # Ack first: Slack retries deliveries not answered within 3 s, so all
+    # Redis and Slack work happens after the response is sent
+    if req.headers.get("X-Slack-Retry-Num"):
+        metrics.incr("slack.events.retry_delivery")
+    background_tasks.add_task(handle_slack_event, payload)
+    return {"ok": True}
+
+
+async def handle_slack_event(payload: dict):
+    """Queue a thread follow-up (or location reply) once per Slack event id."""
     event = payload.get("event", {})
     text = event.get("text")
     user_id = event.get("user")
@@ -77,73 +135,76 @@ async def slack_events(req: Request):
     thread_ts = event.get("thread_ts") or event.get("ts")
 
     if not text or not user_id:
-        return {"ok": True}
+        return
 
 
     # Ignore bot messages
     if event.get("bot_id"):
-        return {"ok": True}
-    
-    user_location = get_user_location(user_id)
-
-    if not user_location:
-        cleaned = text.strip().upper()
+        return
 
-     
-        if len(cleaned) in (2, 3):
-            set_user_location(user_id, cleaned)
+    # Retried deliveries carry the same event id; only the first is processed
+    event_id = payload.get("event_id") or f"{channel_id}:{event.get('ts')}"
+    if not await aclaim_event(event_id):
+        metrics.incr("slack.events.duplicate")
+        return
 
-            await client.chat_postMessage(
-                channel=channel_id,
-                thread_ts=thread_ts,
-                text=f"👍 Got it! I'll use **{cleaned}** for all tenant-rights answers."
-            )
-            return {"ok": True}
+    try:
+        await _queue_event(payload, user_id, channel_id, thread_ts, text)
+    except Exception:
+        # Nothing was queued: forget the event id so Slack's retry of it gets through
+        logging.exception(f"[SlackEvents] Failed to handle event {event_id}")
+        metrics.incr("slack.events.failed")
+        await arelease_event(event_id)
 
-        # Failed validation → ask again
-        await client.chat_postMessage(
-            channel=channel_id,
-            thread_ts=thread_ts,
-            text="⚠️ Please enter a valid 2-letter state code (ex: CA, NY, TX)."
-        )
-        return {"ok": True}
 
+async def _queue_event(payload: dict, user_id: str, channel_id: str, thread_ts: str, text: str):
+    user_location = await aget_user_location(user_id)
 
-    if not check_rate_limit(user_id):
+    if not user_location:
+        # The reply should be their state; a slack_worker saves it or asks again
+        await aenqueue_job("location", {
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "thread_ts": thread_ts,
+            "text": text
+        })
+        return
+
+
+    # admission: refuse when the interactive queue is too deep (before spending quota)
+    admission = await aadmit_job("followup")
+    if not admission.admitted:
         await client.chat_postMessage(
             channel=channel_id,
             thread_ts=thread_ts,
-            text="Rate limit exceeded. Try again later."
+            text=_shed_text()
         )
-        return {"ok": True}
-
-    # Trigger follow-up chat tool
-    asyncio.create_task(run_followup(user_id, channel_id, thread_ts, text))
-    return {"ok": True}
+        return
 
-async def run_followup(user_id: str, channel_id: str, thread_ts: str, text: str):
-    """Helper to run chat tool for follow-ups in thread."""
-    try:
-        follow_up = await chat_tool_fn(user_id, text)
-        await client.chat_postMessage(
-            channel=channel_id,
-            thread_ts=thread_ts,
-            text=f"💬 Follow-up response:\n{follow_up.output}"
-        )
-    except Exception as e:
+    # follow-ups have their own (larger) budget
+    limit = await arate_limit(user_id, "followup", workspace_id=payload.get("team_id"))
+    if not limit.allowed:
         await client.chat_postMessage(
             channel=channel_id,
             thread_ts=thread_ts,
-            text=f"⚠️ Error fetching follow-up response: {str(e)}"
+            text=_rate_limited_text(limit)
         )
+        return
 
+    # Queue the follow-up chat tool run for a slack_worker
+    await aenqueue_job("followup", {
+        "user_id": user_id,
+        "channel_id": channel_id,
+        "thread_ts": thread_ts,
+        "text": text
+    })
 
 # POST/rights-2-roof-history -> post request and responds with message history to slack
 @app.post("/slack/rights-2-roof-history")
 async def slack_history(user_id: str = Form(...), channel_id: str = Form(...), limit: int = 10):
     """Fetches recent conversation history with only User Query + R2R Answer."""
 
-    history = get_messages(user_id, limit=limit)
+    history = await aget_messages(user_id, limit=limit)
     if not history:
         return {
             "response_type": "ephemeral",
@@ -174,7 +235,7 @@ async def slack_history(user_id: str = Form(...), channel_id: str = Form(...), l
 
 
     # Get the last thread_ts for this user
-    thread_ts = get_last_thread(user_id)
+    thread_ts = await aget_last_thread(user_id)
     if thread_ts:
         await client.chat_postMessage(
             channel=dm_channel_id,
@@ -186,7 +247,7 @@ async def slack_history(user_id: str = Form(...), channel_id: str = Form(...), l
             channel=dm_channel_id,
             text=f"📖 Your recent Rights2Roof history:\n{formatted}"
         )
-        set_last_thread(user_id, response["ts"])
+        await aset_last_thread(user_id, response["ts"])
 
     return {
         "response_type": "ephemeral",
@@ -195,6 +256,18 @@ async def slack_history(user_id: str = Form(...), channel_id: str = Form(...), l
 
 
 
+# GET /slack/queue -> depth, in-progress count and oldest wait per priority class
+@app.get("/slack/queue")
+async def slack_queue():
+    return await aqueue_stats()
+
+
+# GET /slack/metrics -> webhook counters (admission, duplicate / retried events)
+@app.get("/slack/metrics")
+def slack_metrics():
+    return metrics.get_metrics()
+
+
 @app.get("/")
 def root():
     return {"message": "Rights2Roof Slack webhook is running"}
\ No newline at end of file
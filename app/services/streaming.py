@@ -0,0 +1,99 @@
+# streaming.py
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+# Receives the answer text accumulated so far each time the LLM emits a chunk.
+# Set per request (and inherited by worker threads / to_thread calls) so the
+# pipeline nodes don't need an extra argument to stream. Only calls made inside
+# streaming_answer() stream to it: LLM calls made by tools along the way (e.g.
+# chat_tool run as a plan step) must not show up as the user's answer.
+TokenSink = Callable[[str], None]
+_token_sink: ContextVar[Optional[TokenSink]] = ContextVar("token_sink", default=None)
+_streaming_answer: ContextVar[bool] = ContextVar("streaming_answer", default=False)
+
+
+@contextmanager
+def stream_tokens_to(sink: Optional[TokenSink]):
+    """Route the streamed answer of the current request to `sink`"""
+    token = _token_sink.set(sink)
+    try:
+        yield
+    finally:
+        _token_sink.reset(token)
+
+
+@contextmanager
+def streaming_answer():
+    """Mark the LLM call(s) inside as producing the answer the request's sink receives"""
+    token = _streaming_answer.set(True)
+    try:
+        yield
+    finally:
+        _streaming_answer.reset(token)
+
+
+def _active_sink() -> Optional[TokenSink]:
+    return _token_sink.get() if _streaming_answer.get() else None
+
+
+def invoke_streaming(runnable: Any, inputs: Any) -> str:
+    """
+    Invoke an LLM (or prompt | llm chain) and return its text.
+    Inside streaming_answer() with a token sink set, the response is streamed
+    and the sink gets the accumulated text after every chunk; otherwise this
+    is a plain invoke.
+    """
+    sink = _active_sink()
+    if sink is None:
+        message = runnable.invoke(inputs)
+        return getattr(message, "content", str(message))
+
+    text = ""
+    for chunk in runnable.stream(inputs):
+        text += getattr(chunk, "content", None) or ""
+        sink(text)
+    return text
+
+
+async def ainvoke_streaming(runnable: Any, inputs: Any) -> str:
+    """Async version of invoke_streaming (ainvoke / astream)"""
+    sink = _active_sink()
+    if sink is None:
+        message = await runnable.ainvoke(inputs)
+        return getattr(message, "content", str(message))
+
+    text = ""
+    async for chunk in runnable.astream(inputs):
+        text += getattr(chunk, "content", None) or ""
+        sink(text)
+    return text
+
+
+class ThrottledSink:
+    """Forwards at most one update per `interval` seconds; `flush()` sends the latest pending text"""
+
+    def __init__(self, sink: TokenSink, interval: float):
+        self.sink = sink
+        self.interval = interval
+        self._pending: Optional[str] = None
+        self._last_sent = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_sent < self.interval:
+                self._pending = text
+                return
+            self._pending = None
+            self._last_sent = now
+        self.sink(text)
+
+    def flush(self) -> None:
+        with self._lock:
+            text, self._pending = self._pending, None
+        if text is not None:
+            self.sink(text)
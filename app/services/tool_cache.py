@@ -0,0 +1,244 @@
+# tool_cache.py
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+from langchain_core.tools import StructuredTool
+from app.models.schemas import ToolOutput
+from app.services import metrics
+from app.services.redis_helpers import redis_client, async_redis_client
+from app.services.tool_memo import canonical_tool_name, memo_key, is_error_output
+
+# Seconds a tool result stays fresh (None = never cache), keyed by executor registry name
+TOOL_CACHE_TTLS: Dict[str, Optional[int]] = {
+    "wikipedia_search": 7 * 24 * 3600,
+    "legiscan_tool": 12 * 3600,
+    "gnews_tool": 15 * 60,
+    "bing_rss_tool": 15 * 60,
+    "tavily_tool": 6 * 3600,
+    "broad_duckduckgo_search": 6 * 3600,
+    "geo_lookup": 24 * 3600,
+    "time_tool": None,
+    "chat_tool": None,  # depends on the user's conversation
+}
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_LOCAL_MAX = int(os.getenv("TOOL_CACHE_LOCAL_MAX", "1024"))  # entries in the in-process LRU
+
+_local: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+_local_lock = threading.Lock()
+
+# Singleflight: one upstream call per key; concurrent callers wait for its result
+_inflight: Dict[str, Future] = {}
+_ainflight: Dict[str, asyncio.Task] = {}
+_inflight_lock = threading.Lock()
+
+
+# === Serialization (Redis stores JSON; ToolOutput is rebuilt on read) ===
+def _dumps(value: Any) -> str:
+    if isinstance(value, ToolOutput):
+        return json.dumps({"__tool_output__": value.model_dump(mode="json")})
+    return json.dumps(value, default=str)
+
+
+def _loads(raw: str) -> Any:
+    value = json.loads(raw)
+    if isinstance(value, dict) and "__tool_output__" in value:
+        return ToolOutput(**value["__tool_output__"])
+    return value
+
+
+def _is_cacheable(value: Any) -> bool:
+    return not is_error_output(value.output if isinstance(value, ToolOutput) else value)
+
+
+# === In-process LRU tier ===
+def _local_get(key: str) -> Optional[Any]:
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return entry[1]
+
+
+def _local_put(key: str, value: Any, ttl: int) -> None:
+    with _local_lock:
+        _local[key] = (time.time() + ttl, value)
+        _local.move_to_end(key)
+        while len(_local) > TOOL_CACHE_LOCAL_MAX:
+            _local.popitem(last=False)
+
+
+# === Lookups ===
+def _cached(tool_name: str, key: str, ttl: int) -> Optional[Any]:
+    value = _local_get(key)
+    if value is not None:
+        metrics.incr(f"tool_cache.{tool_name}.local_hit")
+        return value
+    try:
+        raw = redis_client.get(key)
+    except Exception as e:
+        logging.warning(f"[ToolCache] Redis read failed for {tool_name}: {e}")
+        return None
+    if raw is None:
+        return None
+    value = _loads(raw)
+    _local_put(key, value, ttl)
+    metrics.incr(f"tool_cache.{tool_name}.redis_hit")
+    return value
+
+
+async def _acached(tool_name: str, key: str, ttl: int) -> Optional[Any]:
+    value = _local_get(key)
+    if value is not None:
+        metrics.incr(f"tool_cache.{tool_name}.local_hit")
+        return value
+    try:
+        raw = await async_redis_client.get(key)
+    except Exception as e:
+        logging.warning(f"[ToolCache] Redis read failed for {tool_name}: {e}")
+        return None
+    if raw is None:
+        return None
+    value = _loads(raw)
+    _local_put(key, value, ttl)
+    metrics.incr(f"tool_cache.{tool_name}.redis_hit")
+    return value
+
+
+def _store(tool_name: str, key: str, value: Any, ttl: int) -> None:
+    if not _is_cacheable(value):
+        return
+    _local_put(key, value, ttl)
+    try:
+        redis_client.set(key, _dumps(value), ex=ttl)
+    except Exception as e:
+        logging.warning(f"[ToolCache] Redis write failed for {tool_name}: {e}")
+
+
+async def _astore(tool_name: str, key: str, value: Any, ttl: int) -> None:
+    if not _is_cacheable(value):
+        return
+    _local_put(key, value, ttl)
+    try:
+        await async_redis_client.set(key, _dumps(value), ex=ttl)
+    except Exception as e:
+        logging.warning(f"[ToolCache] Redis write failed for {tool_name}: {e}")
+
+
+# === Wrapper ===
+def cached_tool(tool: StructuredTool, registry_name: str) -> StructuredTool:
+    """
+    Wrap a tool with the TTL cache for its registry name (aliases share entries).
+    Tools without a TTL are returned unchanged.
+    """
+    tool_name = canonical_tool_name(registry_name)
+    ttl = TOOL_CACHE_TTLS.get(tool_name)
+    if not TOOL_CACHE_ENABLED or not ttl:
+        return tool
+
+    def call(**kwargs) -> Any:
+        key = f"tool_cache:{memo_key(tool_name, kwargs)}"
+        metrics.incr(f"tool_cache.{tool_name}.calls")
+        value = _cached(tool_name, key, ttl)
+        if value is not None:
+            return value
+
+        with _inflight_lock:
+            leader = key not in _inflight
+            if leader:
+                _inflight[key] = Future()
+            future = _inflight[key]
+        if not leader:
+            metrics.incr(f"tool_cache.{tool_name}.shared")
+            return future.result()
+
+        try:
+            metrics.incr(f"tool_cache.{tool_name}.upstream")
+            with metrics.timed(f"tool_cache.{tool_name}.upstream"):
+                value = tool.invoke(kwargs)
+            _store(tool_name, key, value, ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    async def afetch(key: str, kwargs: dict) -> Any:
+        metrics.incr(f"tool_cache.{tool_name}.upstream")
+        with metrics.timed(f"tool_cache.{tool_name}.upstream"):
+            value = await tool.ainvoke(kwargs)
+        await _astore(tool_name, key, value, ttl)
+        return value
+
+    def afetched(key: str, task: asyncio.Task) -> None:
+        if _ainflight.get(key) is task:
+            _ainflight.pop(key)
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone
+
+    async def acall(**kwargs) -> Any:
+        key = f"tool_cache:{memo_key(tool_name, kwargs)}"
+        metrics.incr(f"tool_cache.{tool_name}.calls")
+        value = await _acached(tool_name, key, ttl)
+        if value is not None:
+            return value
+
+        task = _ainflight.get(key)
+        if task is None:
+            # The upstream call runs in its own task: a caller that is cancelled
+            # (e.g. by its step timeout) stops waiting without cancelling it for the others
+            task = _ainflight[key] = asyncio.create_task(afetch(key, kwargs))
+            task.add_done_callback(lambda done: afetched(key, done))
+        else:
+            metrics.incr(f"tool_cache.{tool_name}.shared")
+        return await asyncio.shield(task)
+
+    return StructuredTool(
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+        func=call,
+        coroutine=acall,
+    )
+
+
+def cache_tools(registry: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply cached_tool to every StructuredTool in a name -> tool registry"""
+    return {
+        name: cached_tool(tool, name) if isinstance(tool, StructuredTool) else tool
+        for name, tool in registry.items()
+    }
+
+
+def get_tool_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Per-tool call counts, hit ratio and upstream latency"""
+    snapshot = metrics.get_metrics()
+    counters, timings = snapshot["counters"], snapshot["timings"]
+    stats = {}
+    for tool_name, ttl in TOOL_CACHE_TTLS.items():
+        calls = counters.get(f"tool_cache.{tool_name}.calls", 0)
+        if not ttl or not calls:
+            continue
+        hits = counters.get(f"tool_cache.{tool_name}.local_hit", 0) + counters.get(f"tool_cache.{tool_name}.redis_hit", 0)
+        stats[tool_name] = {
+            "calls": calls,
+            "local_hits": counters.get(f"tool_cache.{tool_name}.local_hit", 0),
+            "redis_hits": counters.get(f"tool_cache.{tool_name}.redis_hit", 0),
+            "shared_inflight": counters.get(f"tool_cache.{tool_name}.shared", 0),
+            "upstream_calls": counters.get(f"tool_cache.{tool_name}.upstream", 0),
+            "hit_ratio": hits / calls,
+            "upstream_avg_ms": timings.get(f"tool_cache.{tool_name}.upstream", {}).get("avg_ms", 0.0),
+        }
+    return stats
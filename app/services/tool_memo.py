@@ -0,0 +1,91 @@
+# tool_memo.py
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional
+from app.services import metrics
+
+# Planner tool names that differ from the executor registry keys
+TOOL_ALIASES = {
+    "geo_location": "geo_lookup",
+    "real_estate_news_updates": "gnews_tool",
+}
+
+
+def canonical_tool_name(tool: str) -> str:
+    """Map planner/tool-internal names onto the executor registry names"""
+    return TOOL_ALIASES.get(tool, tool)
+
+
+def _normalize_text(value: Any) -> Any:
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().lower()
+    return value
+
+
+def normalize_tool_input(tool_input: Any) -> str:
+    """
+    Normalize a tool input so equivalent calls share a key:
+    {"query": "Tenant  Rights"} and "tenant rights" both become "tenant rights".
+    """
+    if isinstance(tool_input, dict):
+        if set(tool_input) <= {"query"}:
+            return _normalize_text(tool_input.get("query") or "")
+        return json.dumps({k: _normalize_text(v) for k, v in tool_input.items()}, sort_keys=True, default=str)
+    if tool_input is None:
+        return ""
+    return _normalize_text(str(tool_input))
+
+
+def memo_key(tool: str, tool_input: Any) -> str:
+    return f"{canonical_tool_name(tool)}::{normalize_tool_input(tool_input)}"
+
+
+def is_error_output(output: Any) -> bool:
+    """
+    Failed or empty tool results; never reuse them. Tools report errors as
+    "Error..." strings or {"error": ...} dicts (geo, LegiScan non-200), and
+    LegiScan as {"status": "ERROR"}.
+    """
+    if output is None:
+        return True
+    if isinstance(output, str):
+        return not output.strip() or output.startswith("Error")
+    if isinstance(output, dict):
+        return not output or "error" in output or output.get("status") == "ERROR"
+    if isinstance(output, (list, tuple)):
+        return not output
+    return False
+
+
+class ToolMemo:
+    """
+    Per-request memo of tool results keyed by (tool, normalized input).
+    `results` is a plain JSON-safe dict so it can travel in pipeline state.
+    """
+
+    def __init__(self, results: Optional[Dict[str, Any]] = None):
+        self.results: Dict[str, Any] = results if results is not None else {}
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def get(self, tool: str, tool_input: Any) -> Optional[Any]:
+        result = self.results.get(memo_key(tool, tool_input))
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+            metrics.incr("tool_memo.duplicate_calls_avoided")
+        return result
+
+    def put(self, tool: str, tool_input: Any, output: Any) -> None:
+        if not is_error_output(output):
+            self.results[memo_key(tool, tool_input)] = output
+
+
+def memo_from_plan(plan_steps: List[dict]) -> Dict[str, Any]:
+    """Build memo entries from the planner's already-executed (JSON-safe) steps"""
+    memo = ToolMemo()
+    for step in plan_steps:
+        if isinstance(step, dict) and step.get("tool"):
+            memo.put(step["tool"], step.get("input"), step.get("output"))
+    return memo.results
@@ -0,0 +1,61 @@
+# user_session.py
+from typing import Tuple
+from app.models.schemas import UserSession
+from app.services.redis_helpers import redis_client, async_redis_client
+from app.services.context_builder import summary_key, unsummarized
+from app.services.history_store import history_key, legacy_history_key, parse_turns, last_turns, alast_turns
+
+# Everything a request reads about the user (location, rolling summary, recent
+# messages, last turns, last Slack thread) in one pipelined round trip, instead
+# of one read per module. The rate limiter's user:{id}:requests stays separate:
+# it is an atomic read-and-record Lua call.
+SESSION_MESSAGE_LIMIT = 10
+SESSION_TURN_LIMIT = 5
+
+
+def _queue_reads(pipe, user_id: str, message_limit: int, turn_limit: int) -> None:
+    pipe.get(f"user:{user_id}:location")
+    pipe.get(summary_key(user_id))
+    pipe.zrevrange(f"user:{user_id}:messages", 0, message_limit - 1, withscores=True)
+    pipe.xrevrange(history_key(user_id), count=turn_limit)
+    pipe.exists(legacy_history_key(user_id))
+    pipe.get(f"user:{user_id}:last_thread")
+
+
+def _session(user_id: str, results: list) -> Tuple[UserSession, bool]:
+    location, raw_summary, entries, turn_entries, has_legacy_blob, last_thread = results
+    summary, messages = unsummarized(raw_summary, entries)
+    session = UserSession(
+        user_id=user_id,
+        location=location,
+        summary=summary,
+        messages=messages,
+        turns=parse_turns(turn_entries),
+        last_thread=last_thread
+    )
+    # Turns still in a legacy history blob: the caller migrates them (rare, once per user)
+    return session, bool(has_legacy_blob) and not turn_entries
+
+
+def load_session(user_id: str, message_limit: int = SESSION_MESSAGE_LIMIT, turn_limit: int = SESSION_TURN_LIMIT) -> UserSession:
+    """Load the user's session in one round trip"""
+    if not user_id:
+        return UserSession(user_id="")
+    pipe = redis_client.pipeline()
+    _queue_reads(pipe, user_id, message_limit, turn_limit)
+    session, needs_migration = _session(user_id, pipe.execute())
+    if needs_migration:
+        session.turns = last_turns(user_id, turn_limit)
+    return session
+
+
+async def aload_session(user_id: str, message_limit: int = SESSION_MESSAGE_LIMIT, turn_limit: int = SESSION_TURN_LIMIT) -> UserSession:
+    """Async version of load_session"""
+    if not user_id:
+        return UserSession(user_id="")
+    pipe = async_redis_client.pipeline()
+    _queue_reads(pipe, user_id, message_limit, turn_limit)
+    session, needs_migration = _session(user_id, await pipe.execute())
+    if needs_migration:
+        session.turns = await alast_turns(user_id, turn_limit)
+    return session
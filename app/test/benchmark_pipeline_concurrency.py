@@ -0,0 +1,64 @@
+# Benchmark: concurrent pipeline throughput, sync (thread pool) vs async
+#
+# "before": pipeline_query runs on a fixed pool of worker threads, the way the
+#           sync MCP pipeline_tool tied up one thread per run.
+# "after":  apipeline_query runs all requests on a single event loop.
+#
+# Needs the same environment as the MCP server (Redis, OpenAI and tool API keys).
+# Usage: uv run -m app.test.benchmark_pipeline_concurrency --requests 8 --workers 4
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.pipelines.pipeline_query import pipeline_query, apipeline_query
+
+QUERIES = [
+    "Can my landlord raise rent 10% in CA?",
+    "How much notice does a landlord need to give before eviction in NY?",
+    "What rental assistance programs exist in California?",
+    "Who pays for repairs in a NYC apartment lease?",
+]
+
+
+def report(label: str, latencies: list, elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(
+        f"{label:<6} requests={len(latencies)} wall={elapsed:.1f}s "
+        f"throughput={len(latencies) / elapsed:.2f} req/s "
+        f"p50={statistics.median(latencies):.1f}s p95={p95:.1f}s"
+    )
+
+
+def run_sync(n: int, workers: int) -> None:
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        pipeline_query(QUERIES[i % len(QUERIES)], f"bench_sync_{i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(timed, range(n)))
+    report("sync", latencies, time.perf_counter() - start)
+
+
+async def run_async(n: int) -> None:
+    async def timed(i: int) -> float:
+        start = time.perf_counter()
+        await apipeline_query(QUERIES[i % len(QUERIES)], f"bench_async_{i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(i) for i in range(n)))
+    report("async", list(latencies), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="worker threads available to the sync pipeline")
+    args = parser.parse_args()
+
+    run_sync(args.requests, args.workers)
+    asyncio.run(run_async(args.requests))
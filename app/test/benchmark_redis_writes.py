@@ -0,0 +1,58 @@
+# Benchmark: Redis round trips per request, unbatched vs batched writes
+#
+# Each simulated request makes the writes of one Slack pipeline turn: the user
+# query, the full pipeline dump, the agent answer and a follow-up message
+# (add_message x4), the thread timestamp and a cached result.
+# "before": every helper call is its own round trip.
+# "after":  the request runs inside abatched_writes() and flushes once.
+#
+# Needs only Redis (REDIS_URL). Usage: uv run -m app.test.benchmark_redis_writes --requests 200
+import argparse
+import asyncio
+import time
+from app.services import metrics
+from app.services.redis_helpers import (
+    aadd_message, aset_last_thread, acache_result, abatched_writes, async_redis_client, aclose_redis
+)
+
+
+async def simulated_request(i: int) -> None:
+    user_id = f"bench_writes_{i}"
+    await aadd_message(user_id, "USER_QUERY: Can my landlord raise rent 10% in CA?")
+    await aset_last_thread(user_id, f"{time.time():.6f}")
+    await aadd_message(user_id, "FULL_PIPELINE: {...}")
+    await aadd_message(user_id, "agent: In California, AB 1482 caps increases...")
+    await acache_result(f"bench_writes:{i}", "cached answer", expire_seconds=60)
+    await aadd_message(user_id, "user: what about San Francisco?")
+
+
+async def run(label: str, n: int, batched: bool) -> None:
+    before = metrics.get_metrics()["counters"].get("redis.round_trips", 0)
+    start = time.perf_counter()
+    for i in range(n):
+        if batched:
+            async with abatched_writes():
+                await simulated_request(i)
+        else:
+            await simulated_request(i)
+    elapsed = time.perf_counter() - start
+    round_trips = metrics.get_metrics()["counters"].get("redis.round_trips", 0) - before
+    print(
+        f"{label:<10} requests={n} round_trips/request={round_trips / n:.1f} "
+        f"avg={elapsed / n * 1000:.2f}ms wall={elapsed:.2f}s"
+    )
+
+
+async def main(n: int) -> None:
+    await async_redis_client.ping()  # open a connection up front so it isn't counted
+    await run("unbatched", n, batched=False)
+    await run("batched", n, batched=True)
+    await async_redis_client.delete(*(f"user:bench_writes_{i}:messages" for i in range(n)))
+    await aclose_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -1,5 +1,5 @@
 import time
-from app.services.redis_helpers import check_rate_limit
+from app.services.redis_helpers import check_rate_limit, rate_limit
 
 
 if __name__ == "__main__":
@@ -9,3 +9,9 @@ if __name__ == "__main__":
         allowed = check_rate_limit(user_id)
         print(f"Request {i+1}: {'✅ Allowed' if allowed else '❌ Blocked'}")
         time.sleep(0.5)  
+
+    # Follow-ups use a separate budget; the result carries the remaining quota
+    for i in range(3):
+        result = rate_limit(user_id, "followup", workspace_id="test_workspace")
+        print(f"Follow-up {i+1}: allowed={result.allowed} remaining={result.remaining} "
+              f"reset_in={result.reset_in:.0f}s tier={result.tier}")
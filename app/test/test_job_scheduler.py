@@ -0,0 +1,98 @@
+# Unit tests for the worker's job scheduling (priority, per-user fairness, reserved slots)
+from app.services.job_scheduler import FairScheduler, JobSlots
+
+_ids = iter(range(1, 10_000))
+
+
+def _job(kind: str, user_id: str) -> tuple:
+    return f"{next(_ids)}-0", {"kind": kind, "user_id": user_id}
+
+
+def _always(priority_class: str) -> bool:
+    return True
+
+
+def _drain(scheduler: FairScheduler) -> list:
+    popped = []
+    while (item := scheduler.pop(_always)) is not None:
+        priority_class, (_, fields) = item
+        popped.append((priority_class, fields["kind"], fields["user_id"]))
+    return popped
+
+
+def _start_all(scheduler: FairScheduler, slots: JobSlots) -> list:
+    """What SlackWorker._dispatch would start, without running the jobs"""
+    started = []
+    while (item := scheduler.pop(slots.runnable)) is not None:
+        priority_class, (_, fields) = item
+        slots.start(priority_class)
+        started.append(fields["kind"])
+    return started
+
+
+def test_interactive_jobs_go_before_pipelines():
+    scheduler = FairScheduler()
+    scheduler.push(_job("pipeline", "u1"))
+    scheduler.push(_job("pipeline", "u2"))
+    scheduler.push(_job("followup", "u3"))
+    scheduler.push(_job("location", "u4"))
+
+    classes = [priority_class for priority_class, _, _ in _drain(scheduler)]
+    assert classes == ["interactive", "interactive", "pipeline", "pipeline"]
+
+
+def test_blocked_class_lets_the_next_one_run():
+    scheduler = FairScheduler()
+    scheduler.push(_job("followup", "u1"))
+    scheduler.push(_job("pipeline", "u2"))
+
+    priority_class, _ = scheduler.pop(lambda c: c != "interactive")
+    assert priority_class == "pipeline"
+    assert scheduler.size("interactive") == 1
+
+
+def test_one_users_burst_alternates_with_other_users():
+    scheduler = FairScheduler()
+    for _ in range(4):
+        scheduler.push(_job("pipeline", "burst"))
+    scheduler.push(_job("pipeline", "u2"))
+    scheduler.push(_job("pipeline", "u3"))
+
+    users = [user_id for _, _, user_id in _drain(scheduler)]
+    assert users == ["burst", "u2", "u3", "burst", "burst", "burst"]
+
+
+def test_each_users_jobs_keep_their_order():
+    scheduler = FairScheduler()
+    first, second = _job("followup", "u1"), _job("followup", "u1")
+    scheduler.push(first)
+    scheduler.push(_job("followup", "u2"))
+    scheduler.push(second)
+
+    popped = [scheduler.pop(_always)[1] for _ in range(3)]
+    assert [job for job in popped if job[1]["user_id"] == "u1"] == [first, second]
+
+
+def test_pipelines_never_take_reserved_interactive_slots():
+    scheduler, slots = FairScheduler(), JobSlots(concurrency=4, reserved_interactive=2)
+    for user_id in ("u1", "u2", "u3", "u4", "u5"):
+        scheduler.push(_job("pipeline", user_id))
+
+    assert _start_all(scheduler, slots) == ["pipeline", "pipeline"]
+    assert scheduler.size("pipeline") == 3
+
+    # The reserved slots are still free for interactive jobs
+    for user_id in ("u6", "u7", "u8"):
+        scheduler.push(_job("followup", user_id))
+    assert _start_all(scheduler, slots) == ["followup", "followup"]
+    assert slots.running == {"interactive": 2, "pipeline": 2}
+
+
+def test_interactive_jobs_can_use_every_slot():
+    scheduler, slots = FairScheduler(), JobSlots(concurrency=3, reserved_interactive=1)
+    for user_id in ("u1", "u2", "u3", "u4"):
+        scheduler.push(_job("followup", user_id))
+    scheduler.push(_job("pipeline", "u5"))
+
+    assert _start_all(scheduler, slots) == ["followup", "followup", "followup"]
+    assert scheduler.size("pipeline") == 1
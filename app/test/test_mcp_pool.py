@@ -0,0 +1,88 @@
+# Unit tests for the MCP pool's circuit breaker (pure logic, no server needed)
+from app.services import mcp_pool
+from app.services.mcp_pool import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _breaker(monkeypatch, failures: int = 3, reset: float = 30.0):
+    clock = FakeClock()
+    monkeypatch.setattr(mcp_pool.time, "monotonic", clock)
+    return CircuitBreaker(failures, reset), clock
+
+
+def test_stays_closed_below_threshold(monkeypatch):
+    breaker, _ = _breaker(monkeypatch)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_success_resets_failure_count(monkeypatch):
+    breaker, _ = _breaker(monkeypatch)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_opens_after_consecutive_failures(monkeypatch):
+    breaker, _ = _breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_allows_a_single_trial(monkeypatch):
+    breaker, clock = _breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # trial already in flight
+
+
+def test_successful_trial_closes(monkeypatch):
+    breaker, clock = _breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_for_a_full_reset_timeout(monkeypatch):
+    breaker, clock = _breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_cancelled_trial_frees_the_trial_slot(monkeypatch):
+    breaker, clock = _breaker(monkeypatch)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_cancelled()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
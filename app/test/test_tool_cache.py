@@ -0,0 +1,52 @@
+# Unit tests for the tool cache's async singleflight (Redis tiers stubbed out)
+import asyncio
+import pytest
+from langchain_core.tools import StructuredTool
+from app.services import tool_cache
+
+
+@pytest.fixture
+def slow_tool(monkeypatch):
+    async def no_cache(*args):
+        return None
+
+    async def no_store(*args):
+        return None
+
+    monkeypatch.setattr(tool_cache, "_acached", no_cache)
+    monkeypatch.setattr(tool_cache, "_astore", no_store)
+    calls = []
+
+    async def search(query: str) -> dict:
+        calls.append(query)
+        await asyncio.sleep(0.2)
+        return {"result": query}
+
+    tool = StructuredTool.from_function(coroutine=search, name="wikipedia_search", description="Search Wikipedia")
+    return tool_cache.cached_tool(tool, "wikipedia_search"), calls
+
+
+def test_concurrent_calls_share_one_upstream_call(slow_tool):
+    tool, calls = slow_tool
+
+    async def main():
+        return await asyncio.gather(*(tool.ainvoke({"query": "rent control"}) for _ in range(3)))
+
+    assert asyncio.run(main()) == [{"result": "rent control"}] * 3
+    assert calls == ["rent control"]
+
+
+def test_cancelled_leader_does_not_cancel_followers(slow_tool):
+    tool, calls = slow_tool
+
+    async def main():
+        # The leader gives up like a planner step hitting its timeout
+        leader = asyncio.create_task(asyncio.wait_for(tool.ainvoke({"query": "rent control"}), 0.05))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(tool.ainvoke({"query": "rent control"}))
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == {"result": "rent control"}
+    assert calls == ["rent control"]
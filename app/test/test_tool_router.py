@@ -0,0 +1,70 @@
+# Unit tests for the local tool router (keyword scorer + confidence fallback)
+from app.agents.tool_router import route_locally, score_tools
+from app.models.schemas import ToolOutput
+
+DESCRIPTIONS = {
+    "time_tool": "Return the current date and time",
+    "legiscan_tool": "Fetch legislative bills matching a query",
+    "gnews_tool": "Recent real estate news articles",
+    "wikipedia_search": "Search Wikipedia for background information",
+    "tavily_tool": "Search for local housing and rental assistance info",
+}
+
+
+def _step(step: str, tool: str = "", query: str = "") -> ToolOutput:
+    return ToolOutput(tool=tool, input={"query": query} if query else None, output=None, step=step)
+
+
+def test_keyword_rule_ranks_matching_tool_first():
+    ranked = score_tools(_step("Find pending bills on rent control"), DESCRIPTIONS)
+    assert ranked[0][0] == "legiscan_tool"
+
+
+def test_scores_are_sorted_high_to_low():
+    scores = [score for _, score in score_tools(_step("Latest news about evictions"), DESCRIPTIONS)]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_deadlines_do_not_route_to_time_tool():
+    ranked = score_tools(_step("Look up eviction notice deadlines"), DESCRIPTIONS)
+    assert dict(ranked)["time_tool"] == 0.0
+
+
+def test_obvious_step_routes_locally_with_its_query():
+    decision = route_locally(_step("Search legislation", query="rent control bills"), "user question", DESCRIPTIONS)
+    assert decision is not None
+    assert decision.tool == "legiscan_tool"
+    assert decision.input == {"query": "rent control bills"}
+
+
+def test_step_without_query_uses_the_user_query():
+    decision = route_locally(_step("Get the current date"), "when is rent due", DESCRIPTIONS)
+    assert decision.tool == "time_tool"
+    assert decision.input == {"query": "when is rent due"}
+
+
+def test_planner_hint_alone_is_not_enough():
+    # Tagged by the planner but nothing in the text backs it up: ask the LLM
+    assert route_locally(_step("Do step two", tool="tavily_tool"), "q", DESCRIPTIONS) is None
+
+
+def test_planner_hint_breaks_a_close_call():
+    untagged = dict(score_tools(_step("Latest news on new bills"), DESCRIPTIONS))
+    tagged = dict(score_tools(_step("Latest news on new bills", tool="gnews_tool"), DESCRIPTIONS))
+    assert untagged["gnews_tool"] == untagged["legiscan_tool"]
+    assert tagged["gnews_tool"] > tagged["legiscan_tool"]
+
+
+def test_ambiguous_step_falls_back_to_llm():
+    # One keyword rule for each of two tools: no clear winner
+    assert route_locally(_step("Latest news on new bills"), "q", DESCRIPTIONS) is None
+
+
+def test_unknown_step_falls_back_to_llm():
+    assert route_locally(_step("Think it over"), "q", DESCRIPTIONS) is None
+
+
+def test_threshold_override():
+    step = _step("Latest news on eviction bills", tool="gnews_tool")
+    assert route_locally(step, "q", DESCRIPTIONS, threshold=0.0) is not None
+    assert route_locally(step, "q", DESCRIPTIONS, threshold=1.0) is None
@@ -1,10 +1,12 @@
 # app/tools/chat_tool.py
-from app.services.redis_helpers import add_message, get_cached_result
+from app.services.redis_helpers import add_message
+from app.services.context_builder import CONTEXT_BUDGETS, build_context, schedule_summary_update, truncate_tokens
+from app.services.user_session import load_session
 from app.tools.vector_store_tool import get_context
 from app.models.schemas import ToolOutput
+from app.services.streaming import invoke_streaming
 from langchain_openai import ChatOpenAI
 import os
-import json
 from dotenv import load_dotenv
 from langchain_core.tools import StructuredTool
 
@@ -27,19 +29,21 @@ async def chat_tool_fn(user_id: str, query: str) -> ToolOutput:
     """Follow-up Q&A agent using conversation history asynchronously."""
     from app.pipelines.pipeline_query import pipeline_query
     def sync_call():
-        # === Load pipeline history ===
-        cache_key = f"user:{user_id}:history"
-        cached = get_cached_result(cache_key)
-        history = json.loads(cached).get("history", []) if cached else []
-        
-        last_turn = history[-1] if history else {}
-        prev_answer = last_turn.get("executor_response", "")
-        prev_plan = last_turn.get("plan", {})
-        prev_rag = last_turn.get("rag_response", "")
+        # === Load the last pipeline turn and the conversation (one round trip) ===
+        session = load_session(user_id, turn_limit=1)
+        last_turn = session.turns[-1] if session.turns else {}
+
+        # Each section is clipped so the prompt stays within the chat token budget
+        section_tokens = CONTEXT_BUDGETS["chat"] // 4
+        prev_answer = truncate_tokens(str(last_turn.get("executor_response") or ""), section_tokens)
+        prev_plan = truncate_tokens(str(last_turn.get("plan") or {}), section_tokens)
+        prev_rag = truncate_tokens(str(last_turn.get("rag_response") or ""), section_tokens)
+        conversation = build_context("chat", session.summary, session.messages)
 
         # add vector store lookup for deeper follow-up ===
         vector_results = get_context(query)
         vector_text = "\n".join([d.page_content for d in vector_results.output]) if vector_results.output else ""
+        vector_text = truncate_tokens(vector_text, section_tokens)
 
         prompt = f"""
         You are Rights2Roof, a tenant rights legal assistant.
@@ -47,6 +51,9 @@ async def chat_tool_fn(user_id: str, query: str) -> ToolOutput:
         **User's new follow-up question:**
         {query}
 
+        **Conversation so far:**
+        {conversation}
+
         **Previous assistant answer:**
         {prev_answer}
 
@@ -63,11 +70,13 @@ async def chat_tool_fn(user_id: str, query: str) -> ToolOutput:
         with the prior reasoning and California/US tenant law when applicable.
         """
 
-        answer = followup_llm.invoke(prompt).content
+        # Streams only when the caller marked this as the answer (run_followup); to_thread keeps the context
+        answer = invoke_streaming(followup_llm, prompt)
 
         # track follow-ups in redis history 
         add_message(user_id, f"FOLLOWUP_QUERY: {query}")
         add_message(user_id, f"FOLLOWUP_ANSWER: {answer}")
+        schedule_summary_update(user_id)
 
         return answer
     
@@ -1,10 +1,30 @@
 import requests
+import httpx
 import os
 from langchain_core.tools import StructuredTool
 from app.models.schemas import ToolOutput
 from typing import Optional
 
 
+def _is_unroutable_ip(ip: Optional[str]) -> bool:
+    return not ip or ip in ["0.0.0.0", "127.0.0.1"] or ip.startswith("100.")
+
+
+def _location_output(ip: Optional[str], data: Optional[dict] = None, error: Optional[str] = None) -> ToolOutput:
+    if error is None and (data or {}).get("status") != "success":
+        error = "LOOKUP_FAILED"
+    return ToolOutput(
+        tool="geo_location",
+        input={"ip": ip},
+        output={"error": error} if error else {
+            "city": data.get("city"),
+            "state": data.get("region"),
+            "country": data.get("country"),
+        },
+        step="Get User Location"
+    )
+
+
 def get_location_from_ip(ip: Optional[str] = None) -> ToolOutput:
     """
     Graceful geo lookup:
@@ -13,49 +33,35 @@ def get_location_from_ip(ip: Optional[str] = None) -> ToolOutput:
     """
 
     # If no IP or a known internal IP → return soft failure
-    if not ip or ip in ["0.0.0.0", "127.0.0.1"] or ip.startswith("100."):
-        return ToolOutput(
-            tool="geo_location",
-            input={"ip": ip},
-            output={"error": "NO_IP_AVAILABLE"},
-            step="Get User Location"
-        )
+    if _is_unroutable_ip(ip):
+        return _location_output(ip, error="NO_IP_AVAILABLE")
 
     try:
         url = f"http://ip-api.com/json/{ip}"
         response = requests.get(url, timeout=3)
-        data = response.json()
-
-        if data.get("status") != "success":
-            return ToolOutput(
-                tool="geo_location",
-                input={"ip": ip},
-                output={"error": "LOOKUP_FAILED"},
-                step="Get User Location"
-            )
-
-        return ToolOutput(
-            tool="geo_location",
-            input={"ip": ip},
-            output={
-                "city": data.get("city"),
-                "state": data.get("region"),
-                "country": data.get("country"),
-            },
-            step="Get User Location"
-        )
+        return _location_output(ip, response.json())
+
+    except Exception:
+        return _location_output(ip, error="LOOKUP_EXCEPTION")
+
+
+async def aget_location_from_ip(ip: Optional[str] = None) -> ToolOutput:
+    """Async version of get_location_from_ip (non-blocking HTTP call)"""
+    if _is_unroutable_ip(ip):
+        return _location_output(ip, error="NO_IP_AVAILABLE")
+
+    try:
+        async with httpx.AsyncClient(timeout=3) as http:
+            response = await http.get(f"http://ip-api.com/json/{ip}")
+        return _location_output(ip, response.json())
 
     except Exception:
-        return ToolOutput(
-            tool="geo_location",
-            input={"ip": ip},
-            output={"error": "LOOKUP_EXCEPTION"},
-            step="Get User Location"
-        )
+        return _location_output(ip, error="LOOKUP_EXCEPTION")
 
 # --- Wrap the Tools (StructuredTool) --
 geo_tool = StructuredTool.from_function(
     func=get_location_from_ip,
+    coroutine=aget_location_from_ip,
     name="geo_location",
     description="Get User's Location",
 )
\ No newline at end of file
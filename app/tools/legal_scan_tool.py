@@ -1,5 +1,6 @@
 import os
 import requests
+import httpx
 from app.models.schemas import ToolOutput
 from dotenv import load_dotenv
 from langchain_core.tools import StructuredTool
@@ -7,20 +8,32 @@ from langchain_core.tools import StructuredTool
 
 load_dotenv()
 LEGISCAN_API_KEY = os.getenv("LEGISCAN_API_KEY")
+LEGISCAN_URL = "https://api.legiscan.com/"
+
+
+def _legiscan_params(query: str, state: str) -> dict:
+    return {"key": LEGISCAN_API_KEY, "op": "search", "state": state, "q": query}
+
 
 def legiscan_search(query: str, state: str = "CA") -> ToolOutput:
     """
     Search legislation using LegiScan API.
     E.g. keyword search, filter by state (like California).
     """
-    url = "https://api.legiscan.com/?key={}&op=search".format(LEGISCAN_API_KEY)
-    params = {
-        "state": state,
-        "q": query
-    }
-    resp = requests.get(url, params=params)
+    resp = requests.get(LEGISCAN_URL, params=_legiscan_params(query, state))
     data = resp.json() if resp.status_code == 200 else {"error": resp.text}
+    return _legiscan_output(query, state, data)
+
+
+async def alegiscan_search(query: str, state: str = "CA") -> ToolOutput:
+    """Async version of legiscan_search (non-blocking HTTP call)."""
+    async with httpx.AsyncClient() as http:
+        resp = await http.get(LEGISCAN_URL, params=_legiscan_params(query, state))
+    data = resp.json() if resp.status_code == 200 else {"error": resp.text}
+    return _legiscan_output(query, state, data)
+
 
+def _legiscan_output(query: str, state: str, data: dict) -> ToolOutput:
     return ToolOutput(
         tool="legiscan_tool",
         input={"query": query, "state": state},
@@ -30,6 +43,7 @@ def legiscan_search(query: str, state: str = "CA") -> ToolOutput:
 
 legiscan_tool = StructuredTool.from_function(
     func=legiscan_search,
+    coroutine=alegiscan_search,
     name="legiscan_tool",
     description="Use this tool to fetch legislative bills (state or federal) matching a query, e.g. tenant rights, rent control, eviction laws."
 )
\ No newline at end of file
@@ -27,8 +27,21 @@ def tavily_search(query:str) -> ToolOutput:
     )
 
 
+async def atavily_search(query: str) -> ToolOutput:
+    """Async version of tavily_search."""
+    result = await tavily.ainvoke(query)
+
+    return ToolOutput(
+        tool="tavily_tool",
+        input={"query": query},
+        output=result,
+        step="Search for recent/local housing info"
+    )
+
+
 tavily_tool = StructuredTool.from_function(
     func=tavily_search,
+    coroutine=atavily_search,
     name="tavily_tool",
     description="Use this to fetch recent/local housing info (tenant rights, rental assistance programs, deadlines, city/state policies)."
 )
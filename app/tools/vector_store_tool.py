@@ -7,13 +7,16 @@ from langchain_core.tools import StructuredTool
 from app.models.schemas import ToolOutput
 from langchain_community.vectorstores.redis.base import check_index_exists
 from app.services.redis_helpers import redis_client
+from app.services.embedding_cache import CachedEmbeddings
 
 load_dotenv()
 DIRECTORY_PATH = "app/resources/files"
 
 #Vector store configurations
 INDEX_NAME = "rights2roof"
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+EMBEDDING_MODEL = "text-embedding-3-large"
+# Query embeddings are cached (Redis + in-process LRU); ingestion embeds directly
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL), model=EMBEDDING_MODEL)
 config = RedisConfig(
     index_name=INDEX_NAME,
     redis_client=redis_client,
@@ -54,9 +57,20 @@ def get_context(query: str) -> ToolOutput:
         step="Provide relevant context from vector store based on user's query"
     )
 
+async def aget_context(query: str) -> ToolOutput:
+    """Async version of get_context"""
+    context = await retriever.ainvoke(query)
+    return ToolOutput(
+        tool="vector_store_tool",
+        input=query,
+        output=context,
+        step="Provide relevant context from vector store based on user's query"
+    )
+
 # Define the tool for use in agents
 vector_store_tool = StructuredTool.from_function(
     func=get_context,
+    coroutine=aget_context,
     name="vector_store_tool",
     description="Returns the relevant context from the vector store based on the user's query. Useful for retrieving information about rental housing laws and regulations."
 )
@@ -0,0 +1,206 @@
+# slack_worker.py
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+load_dotenv()
+from app.services import metrics
+from app.services.job_queue import (
+    JOB_CLAIM_IDLE_MS, JOB_MAX_ATTEMPTS, PRIORITY_CLASSES, aensure_groups, aread_jobs, aclaim_stale_jobs, aheartbeat_jobs,
+    aack_job, aretry_job, aqueue_stats, job_payload
+)
+from app.services.job_scheduler import FairScheduler, JobSlots
+from app.services.mcp_pool import mcp_pool
+from app.services.redis_helpers import aclose_redis
+from app.services.slack_helpers import client, post_slack_thread, run_followup, handle_location_reply
+
+# Worker process for queued Slack jobs (app/services/job_queue.py). Scale by
+# running more processes; each runs up to SLACK_WORKER_CONCURRENCY jobs at once,
+# of which SLACK_WORKER_RESERVED_INTERACTIVE are kept free of full pipelines so
+# follow-ups don't queue behind them.
+SLACK_WORKER_CONCURRENCY = int(os.getenv("SLACK_WORKER_CONCURRENCY", "8"))
+SLACK_WORKER_RESERVED_INTERACTIVE = int(os.getenv("SLACK_WORKER_RESERVED_INTERACTIVE", "2"))
+SLACK_WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("SLACK_WORKER_SHUTDOWN_TIMEOUT", "120"))  # seconds to finish in-flight jobs
+READ_BLOCK_MS = 2000
+POLL_INTERVAL = 0.5  # seconds between queue polls while every slot is busy
+CLAIM_INTERVAL = 30.0  # seconds between checks for jobs abandoned by other workers
+STATS_INTERVAL = 60.0  # seconds between queue stats log lines
+HEARTBEAT_INTERVAL = JOB_CLAIM_IDLE_MS / 1000 / 4  # seconds between idle-time resets of held jobs
+
+logging.basicConfig(level=logging.INFO)
+
+
+# === Handlers (payload, job id, retryable -> Slack work) ===
+# job_id keeps a retried job from posting its Slack messages twice; with retryable,
+# transient failures are raised for the queue to retry instead of reported to the user.
+async def _run_pipeline(payload: dict, job_id: str, retryable: bool) -> None:
+    await post_slack_thread(
+        client, payload["channel_id"], payload["user_id"], payload["query"], payload.get("location"),
+        job_id=job_id, retryable=retryable
+    )
+
+
+async def _run_followup(payload: dict, job_id: str, retryable: bool) -> None:
+    await run_followup(payload["user_id"], payload["channel_id"], payload["thread_ts"], payload["text"], job_id=job_id, retryable=retryable)
+
+
+async def _run_location(payload: dict, job_id: str, retryable: bool) -> None:
+    await handle_location_reply(payload["user_id"], payload["channel_id"], payload["thread_ts"], payload["text"])
+
+
+HANDLERS: Dict[str, Callable[[dict, str, bool], Awaitable[None]]] = {
+    "pipeline": _run_pipeline,
+    "followup": _run_followup,
+    "location": _run_location,
+}
+
+
+class SlackWorker:
+    def __init__(self, concurrency: int = SLACK_WORKER_CONCURRENCY, reserved_interactive: int = SLACK_WORKER_RESERVED_INTERACTIVE):
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.slots = JobSlots(concurrency, reserved_interactive)
+        self.scheduler = FairScheduler()
+        self._running_ids: Dict[str, str] = {}  # entry id -> priority class
+        self.stopping = asyncio.Event()
+        self._job_done = asyncio.Event()
+        self._in_flight: set = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    # === Job execution ===
+    async def _process(self, priority_class: str, entry_id: str, fields: dict) -> None:
+        kind = fields.get("kind")
+        try:
+            handler = HANDLERS[kind]
+            wait_ms = (time.time() - float(fields["enqueued_at"])) * 1000
+            metrics.observe(f"jobs.{kind}.wait", wait_ms)
+            metrics.observe(f"jobs.class.{priority_class}.wait", wait_ms)
+            # The last attempt reports every failure to the user
+            retryable = int(fields.get("attempts", 0)) + 1 < JOB_MAX_ATTEMPTS
+            with metrics.timed(f"jobs.{kind}.run"):
+                await handler(job_payload(fields), fields.get("job_id") or entry_id, retryable)
+        except Exception as e:
+            logging.exception(f"[SlackWorker] {kind} job {entry_id} failed")
+            metrics.incr(f"jobs.{kind}.failed")
+            # The retry backoff doesn't hold a slot
+            self._track(aretry_job(entry_id, fields, f"{type(e).__name__}: {e}"))
+        else:
+            metrics.incr(f"jobs.{kind}.done")
+            await aack_job(entry_id, fields)
+        finally:
+            self.slots.finish(priority_class)
+            self._running_ids.pop(entry_id, None)
+            self._job_done.set()
+
+    def _track(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    def _dispatch(self) -> None:
+        while (item := self.scheduler.pop(self.slots.runnable)) is not None:
+            priority_class, (entry_id, fields) = item
+            self.slots.start(priority_class)
+            self._running_ids[entry_id] = priority_class
+            self._track(self._process(priority_class, entry_id, fields))
+
+    # === Heartbeat ===
+    def _held(self) -> Dict[str, List[str]]:
+        # Once stopping, buffered jobs are left to go idle so other workers pick them up
+        held = {c: [] if self.stopping.is_set() else self.scheduler.entry_ids(c) for c in PRIORITY_CLASSES}
+        for entry_id, priority_class in self._running_ids.items():
+            held[priority_class].append(entry_id)
+        return held
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await aheartbeat_jobs(self.consumer, self._held())
+            except Exception as e:
+                logging.warning(f"[SlackWorker] Heartbeat failed: {e}")
+
+    # === Reading ===
+    def _room(self) -> Dict[str, int]:
+        # Buffer up to one extra round per class: enough for users to take turns,
+        # small enough that buffered jobs don't wait long behind running ones
+        return {
+            c: max(0, 2 * self.slots.limits[c] - self.slots.running[c] - self.scheduler.size(c))
+            for c in PRIORITY_CLASSES
+        }
+
+    async def _fill(self, claim: bool) -> None:
+        room = self._room()
+        jobs = []
+        if claim:
+            for priority_class, count in room.items():
+                if count:
+                    jobs += await aclaim_stale_jobs(self.consumer, priority_class, count)
+        if not jobs:
+            idle = not self.slots.busy() and not any(self.scheduler.size(c) for c in PRIORITY_CLASSES)
+            # Block on the queues only when nothing is running or buffered
+            jobs = await aread_jobs(self.consumer, room, READ_BLOCK_MS if idle else None)
+        for job in jobs:
+            self.scheduler.push(job)
+
+    async def run(self) -> None:
+        await aensure_groups()
+        await mcp_pool.start()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logging.info(f"[SlackWorker] {self.consumer} consuming with concurrency {self.slots.concurrency} (limits {self.slots.limits})")
+
+        next_claim = next_stats = 0.0
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            try:
+                await self._fill(claim=now >= next_claim)
+                if now >= next_claim:
+                    next_claim = now + CLAIM_INTERVAL
+                if now >= next_stats:
+                    next_stats = now + STATS_INTERVAL
+                    logging.info(f"[SlackWorker] queues {await aqueue_stats()} running {self.slots.running}")
+            except Exception as e:
+                logging.warning(f"[SlackWorker] Queue read failed: {e}")
+                await asyncio.sleep(1)
+            self._dispatch()
+            if self.slots.busy():
+                # Wake on a finished job, or poll again so new interactive jobs aren't left waiting
+                self._job_done.clear()
+                try:
+                    await asyncio.wait_for(self._job_done.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+        await self.shutdown()
+
+    async def shutdown(self) -> None:
+        """
+        Let in-flight jobs finish; unfinished and buffered ones stay pending
+        and are reclaimed by another worker.
+        """
+        if self._in_flight:
+            logging.info(f"[SlackWorker] Waiting for {len(self._in_flight)} in-flight jobs")
+            _, pending = await asyncio.wait(self._in_flight, timeout=SLACK_WORKER_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        await mcp_pool.close()
+        await aclose_redis()
+        logging.info(f"[SlackWorker] {self.consumer} stopped")
+
+
+async def main() -> None:
+    worker = SlackWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stopping.set)
+    await worker.run()
+
+
+# Usage: uv run -m app.workers.slack_worker
+if __name__ == "__main__":
+    asyncio.run(main())